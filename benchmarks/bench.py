@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the mfusepy translation layer by mounting filesystems in a temporary folder and
+running reproducible workloads on them. Results are printed or written as JSON.
+
+Examples:
+
+    python3 benchmarks/bench.py run -o results.json
+    FUSE_LIBRARY_NAME=fuse3 python3 benchmarks/bench.py run --filesystem memory
+    python3 benchmarks/bench.py run --library fuse --library fuse3 -o results.json
+    python3 benchmarks/bench.py compare baseline.json results.json
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import errno
+import functools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterable
+from typing import Any, Callable, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../examples')))
+
+# Only import mfusepy in the server process so that FUSE_LIBRARY_NAME can be varied per mount.
+
+FILESYSTEMS = ('memory', 'loopback', 'passthrough')
+DATA_FILE_SIZE = 64 * 1024 * 1024
+XATTR_COUNT = 8
+PARALLEL_READERS = 8
+# Disable kernel caching so that each access is forwarded to the filesystem and actually measures mfusepy.
+MOUNT_OPTIONS: dict[str, Any] = {'attr_timeout': 0, 'entry_timeout': 0, 'negative_timeout': 0, 'direct_io': True}
+
+
+class Layout:
+    '''The file hierarchy that is created before mounting. It is identical for all filesystems.'''
+
+    def __init__(self, entries: int, tree_folders: int, tree_files: int) -> None:
+        self.entries = entries
+        self.tree_folders = tree_folders
+        self.tree_files = tree_files
+
+    def folders(self) -> Iterable[str]:
+        yield '/big'
+        yield '/tree'
+        for i in range(self.tree_folders):
+            yield f'/tree/d{i}'
+        yield '/scratch'
+
+    def files(self) -> Iterable[tuple[str, int]]:
+        '''Yields paths and file sizes.'''
+        for i in range(self.entries):
+            yield f'/big/f{i}', 0
+        for i in range(self.tree_folders):
+            for j in range(self.tree_files):
+                yield f'/tree/d{i}/f{j}', 16
+        yield '/data.bin', DATA_FILE_SIZE
+        yield '/xattrs', 0
+
+    def to_arguments(self) -> list[str]:
+        return [f'--entries={self.entries}', f'--tree-folders={self.tree_folders}', f'--tree-files={self.tree_files}']
+
+
+def create_memory_filesystem(layout: Layout):
+    import mfusepy as fuse  # pylint: disable=import-outside-toplevel
+
+    class BenchMemory(fuse.Operations):
+        '''Like examples/memory.py but hierarchical, pre-populated, and with O(1) writes.'''
+
+        use_ns = True
+
+        def __init__(self) -> None:
+            now = time.time_ns()
+            self.uid = os.getuid()
+            self.gid = os.getgid()
+            self.files: dict[str, dict[str, Any]] = {}
+            self.children: dict[str, dict[str, None]] = {}
+            self.data: dict[str, bytearray] = {}
+            self.xattrs: dict[str, dict[str, bytes]] = {}
+            self._add('/', stat.S_IFDIR | 0o755, now)
+            for path in layout.folders():
+                self._add(path, stat.S_IFDIR | 0o755, now)
+            for path, size in layout.files():
+                self._add(path, stat.S_IFREG | 0o644, now)
+                self.data[path] = bytearray(size)
+                self.files[path]['st_size'] = size
+            self.xattrs['/xattrs'] = {f'user.key{i}': b'value' * i for i in range(XATTR_COUNT)}
+
+        def _add(self, path: str, mode: int, now: int) -> None:
+            is_dir = stat.S_ISDIR(mode)
+            self.files[path] = {
+                'st_mode': mode,
+                'st_nlink': 2 if is_dir else 1,
+                'st_size': 0,
+                'st_ctime': now,
+                'st_mtime': now,
+                'st_atime': now,
+                'st_uid': self.uid,
+                'st_gid': self.gid,
+            }
+            if is_dir:
+                self.children[path] = {}
+            if path != '/':
+                parent, name = path.rsplit('/', 1)
+                self.children[parent or '/'][name] = None
+
+        @fuse.overrides(fuse.Operations)
+        def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+            if path not in self.files:
+                raise fuse.FuseOSError(errno.ENOENT)
+            return self.files[path]
+
+        @fuse.overrides(fuse.Operations)
+        def readdir(self, path: str, fh: int) -> fuse.ReadDirResult:
+            return ['.', '..', *self.children[path]]
+
+        @fuse.overrides(fuse.Operations)
+        def create(self, path: str, mode: int, fi=None) -> int:
+            self._add(path, stat.S_IFREG | mode, time.time_ns())
+            self.data[path] = bytearray()
+            return 0
+
+        @fuse.overrides(fuse.Operations)
+        def open(self, path: str, flags: int) -> int:
+            return 0
+
+        @fuse.overrides(fuse.Operations)
+        def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+            return bytes(self.data[path][offset : offset + size])
+
+        @fuse.overrides(fuse.Operations)
+        def write(self, path: str, data, offset: int, fh: int) -> int:
+            buffer = self.data[path]
+            if offset > len(buffer):
+                buffer.extend(bytes(offset - len(buffer)))
+            buffer[offset : offset + len(data)] = data
+            self.files[path]['st_size'] = len(buffer)
+            return len(data)
+
+        @fuse.overrides(fuse.Operations)
+        def truncate(self, path: str, length: int, fh: Optional[int] = None) -> int:
+            buffer = self.data[path]
+            del buffer[length:]
+            buffer.extend(bytes(length - len(buffer)))
+            self.files[path]['st_size'] = length
+            return 0
+
+        @fuse.overrides(fuse.Operations)
+        def unlink(self, path: str) -> int:
+            parent, name = path.rsplit('/', 1)
+            del self.children[parent or '/'][name]
+            self.files.pop(path)
+            self.data.pop(path, None)
+            self.xattrs.pop(path, None)
+            return 0
+
+        @fuse.overrides(fuse.Operations)
+        def getxattr(self, path: str, name: str, position: int = 0) -> bytes:
+            try:
+                return self.xattrs[path][name]
+            except KeyError:
+                raise fuse.FuseOSError(fuse.ENOATTR)
+
+        @fuse.overrides(fuse.Operations)
+        def listxattr(self, path: str) -> Iterable[str]:
+            return self.xattrs.get(path, {}).keys()
+
+        @fuse.overrides(fuse.Operations)
+        def utimens(self, path: str, times: Optional[tuple[int, int]] = None) -> int:
+            return 0
+
+    return BenchMemory()
+
+
+def populate_folder(root: str, layout: Layout) -> None:
+    for path in layout.folders():
+        os.makedirs(root + path, exist_ok=True)
+    for path, size in layout.files():
+        with open(root + path, 'wb') as file:
+            file.truncate(size)
+
+
+def serve(arguments) -> None:
+    '''Runs in a separate process so that the filesystem does not compete with the workloads for the GIL.'''
+    import mfusepy as fuse  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.WARNING)
+    layout = Layout(arguments.entries, arguments.tree_folders, arguments.tree_files)
+    if arguments.filesystem == 'memory':
+        operations = create_memory_filesystem(layout)
+    elif arguments.filesystem == 'loopback':
+        from loopback import Loopback  # pylint: disable=import-outside-toplevel
+
+        operations = Loopback(arguments.root)
+    elif arguments.filesystem == 'passthrough':
+        operations = fuse.Passthrough(arguments.root)
+    else:
+        raise ValueError(f"Unknown filesystem: {arguments.filesystem}")
+
+    print(f"{fuse.fuse_version_major}.{fuse.fuse_version_minor}", flush=True)
+    fuse.FUSE(operations, arguments.mount, foreground=True, **MOUNT_OPTIONS)
+
+
+class Mount:
+    def __init__(self, filesystem: str, library: Optional[str], layout: Layout, folder: str) -> None:
+        self.mount_point = os.path.join(folder, f'mounted-{filesystem}')
+        os.makedirs(self.mount_point, exist_ok=True)
+        self.fuse_version = 'unknown'
+
+        command = [sys.executable, os.path.abspath(__file__), 'serve', filesystem, self.mount_point]
+        command += layout.to_arguments()
+        if filesystem in ('loopback', 'passthrough'):
+            root = os.path.join(folder, f'{filesystem}-source')
+            if not os.path.isdir(root):
+                populate_folder(root, layout)
+            command += ['--root', root]
+
+        environment = dict(os.environ)
+        if library:
+            environment['FUSE_LIBRARY_NAME'] = library
+        self._stderr = tempfile.TemporaryFile()  # noqa: SIM115  # pylint: disable=consider-using-with
+        self.process = subprocess.Popen(  # pylint: disable=consider-using-with
+            command, env=environment, stdout=subprocess.PIPE, stderr=self._stderr, text=True
+        )
+
+    def __enter__(self):
+        assert self.process.stdout
+        self.fuse_version = self.process.stdout.readline().strip() or self.fuse_version
+
+        t0 = time.time()
+        while not os.path.ismount(self.mount_point):
+            if self.process.poll() is not None or time.time() - t0 > 60:
+                self._stderr.seek(0)
+                raise RuntimeError("Failed to mount:\n" + self._stderr.read().decode(errors='replace'))
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        for command in (['fusermount3', '-u'], ['fusermount', '-u'], ['umount']):
+            if shutil.which(command[0]):
+                if subprocess.run([*command, self.mount_point], check=False, capture_output=True).returncode == 0:
+                    break
+        try:
+            self.process.wait(60)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._stderr.close()
+
+
+def time_operations(operations: Iterable[Callable[[], Any]]) -> list[int]:
+    latencies = []
+    for operation in operations:
+        t0 = time.perf_counter_ns()
+        operation()
+        latencies.append(time.perf_counter_ns() - t0)
+    return latencies
+
+
+def workload_stat_storm(root: str, layout: Layout) -> list[int]:
+    '''Similar to "find -ls": lists all folders recursively and stats each entry.'''
+    paths = [root + '/tree']
+    for folder in os.listdir(paths[0]):
+        paths.append(os.path.join(paths[0], folder))
+        paths.extend(os.path.join(paths[0], folder, name) for name in os.listdir(paths[-1]))
+    return time_operations(functools.partial(os.lstat, path) for path in paths)
+
+
+def workload_ls_l(root: str, layout: Layout) -> list[int]:
+    '''Similar to "ls -l" on a folder with many entries. Each listing is one sample.'''
+
+    def list_long():
+        with os.scandir(root + '/big') as entries:
+            for entry in entries:
+                entry.stat(follow_symlinks=False)
+
+    return time_operations([list_long] * 3)
+
+
+def workload_sequential_read(root: str, layout: Layout) -> list[int]:
+    size = 1024 * 1024
+    fd = os.open(root + '/data.bin', os.O_RDONLY)
+    try:
+        return time_operations(
+            functools.partial(os.pread, fd, size, offset) for offset in range(0, DATA_FILE_SIZE, size)
+        )
+    finally:
+        os.close(fd)
+
+
+def workload_random_read(root: str, layout: Layout) -> list[int]:
+    size = 4096
+    generator = random.Random(0)
+    offsets = [generator.randrange(DATA_FILE_SIZE // size) * size for _ in range(20000)]
+    fd = os.open(root + '/data.bin', os.O_RDONLY)
+    try:
+        return time_operations(functools.partial(os.pread, fd, size, offset) for offset in offsets)
+    finally:
+        os.close(fd)
+
+
+def workload_parallel_random_read(root: str, layout: Layout) -> list[int]:
+    '''Like random_read_4KiB but with PARALLEL_READERS threads. Each sample is one batch of reads in all threads.'''
+    size = 4096
+    generator = random.Random(0)
+    offsets = [generator.randrange(DATA_FILE_SIZE // size) * size for _ in range(20000)]
+    batches = [offsets[i : i + 64 * PARALLEL_READERS] for i in range(0, len(offsets), 64 * PARALLEL_READERS)]
+    fd = os.open(root + '/data.bin', os.O_RDONLY)
+
+    def read_chunk(chunk):
+        for offset in chunk:
+            os.pread(fd, size, offset)
+
+    def read_batch(batch):
+        list(pool.map(read_chunk, (batch[i::PARALLEL_READERS] for i in range(PARALLEL_READERS))))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(PARALLEL_READERS) as pool:
+            return time_operations(functools.partial(read_batch, batch) for batch in batches)
+    finally:
+        os.close(fd)
+
+
+def workload_small_writes(root: str, layout: Layout) -> list[int]:
+    size = 4096
+    data = bytes(range(256)) * (size // 256)
+    path = root + '/scratch/written'
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        return time_operations(
+            functools.partial(os.pwrite, fd, data, offset) for offset in range(0, 10000 * size, size)
+        )
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+
+def workload_create_unlink(root: str, layout: Layout) -> list[int]:
+    '''Each sample is one file creation and close followed by the deletion.'''
+
+    def churn(path):
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        os.unlink(path)
+
+    return time_operations(functools.partial(churn, f'{root}/scratch/churn{i}') for i in range(5000))
+
+
+def workload_create_storm(root: str, layout: Layout) -> list[int]:
+    '''Similar to "touch" for as many new files as there are entries in the big folder.'''
+    paths = [f'{root}/scratch/storm{i}' for i in range(layout.entries)]
+
+    def touch(path):
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_NONBLOCK, 0o644))
+
+    try:
+        return time_operations(functools.partial(touch, path) for path in paths)
+    finally:
+        for path in paths:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+
+def workload_xattr(root: str, layout: Layout) -> list[int]:
+    '''Similar to "getfattr -d": lists all extended attributes and queries each one.'''
+    path = root + '/xattrs'
+    names = os.listxattr(path, follow_symlinks=False)
+    if len(names) < XATTR_COUNT:
+        raise OSError(errno.ENOTSUP, "Filesystem does not provide the benchmark xattrs.")
+
+    def dump_xattrs():
+        for name in os.listxattr(path, follow_symlinks=False):
+            os.getxattr(path, name, follow_symlinks=False)
+
+    return time_operations([dump_xattrs] * 2000)
+
+
+WORKLOADS: dict[str, tuple[Callable[[str, Layout], list[int]], Callable[[Layout], int]]] = {
+    # name: (workload, number of filesystem operations in one run)
+    'stat_storm': (workload_stat_storm, lambda layout: 1 + layout.tree_folders * (layout.tree_files + 1)),
+    'ls_l': (workload_ls_l, lambda layout: 3 * layout.entries),
+    'sequential_read_1MiB': (workload_sequential_read, lambda layout: DATA_FILE_SIZE // (1024 * 1024)),
+    'random_read_4KiB': (workload_random_read, lambda layout: 20000),
+    'parallel_random_read_4KiB': (workload_parallel_random_read, lambda layout: 20000),
+    'small_writes_4KiB': (workload_small_writes, lambda layout: 10000),
+    'create_unlink': (workload_create_unlink, lambda layout: 2 * 5000),
+    'create_storm': (workload_create_storm, lambda layout: layout.entries),
+    'xattr_get_list': (workload_xattr, lambda layout: 2000 * (XATTR_COUNT + 1)),
+}
+
+
+def percentile(sorted_values: list[int], fraction: float) -> int:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies: list[int], operation_count: int) -> dict[str, Any]:
+    total = sum(latencies) / 1e9
+    latencies = sorted(latencies)
+    return {
+        'samples': len(latencies),
+        'operations': operation_count,
+        'seconds': total,
+        'ops_per_second': operation_count / total if total > 0 else 0,
+        'latency_us': {
+            name: percentile(latencies, fraction) / 1e3
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+        },
+    }
+
+
+def run(arguments) -> None:
+    layout = Layout(arguments.entries, arguments.tree_folders, arguments.tree_files)
+    workloads = arguments.workload or list(WORKLOADS)
+    results: dict[str, Any] = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'entries': layout.entries,
+        },
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        for library in arguments.library or [os.environ.get('FUSE_LIBRARY_NAME')]:
+            for filesystem in arguments.filesystem or FILESYSTEMS:
+                with Mount(filesystem, library, layout, folder) as mount:
+                    for name in workloads:
+                        key = f'{filesystem}/{library or "default"}/{name}'
+                        workload, count_operations = WORKLOADS[name]
+                        try:
+                            summary = summarize(workload(mount.mount_point, layout), count_operations(layout))
+                        except OSError as exception:
+                            if exception.errno not in (errno.ENOTSUP, errno.ENOSYS):
+                                raise
+                            summary = {'skipped': str(exception)}
+                        summary['fuse_version'] = mount.fuse_version
+                        results['results'][key] = summary
+                        print(f"{key:50} {summary.get('ops_per_second', 0):12.0f} ops/s", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+def compare(arguments) -> int:
+    '''Prints the relative change in ops/s and returns 1 if any workload regressed more than the threshold.'''
+    with open(arguments.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    with open(arguments.contender, encoding='utf-8') as file:
+        contender = json.load(file)['results']
+
+    regressed = False
+    print(f"{'workload':50} {'baseline':>12} {'contender':>12} {'change':>8}  {'p99 [us]':>19}")
+    for key in sorted(set(baseline) & set(contender)):
+        old, new = baseline[key], contender[key]
+        if 'ops_per_second' not in old or 'ops_per_second' not in new or not old['ops_per_second']:
+            continue
+        change = new['ops_per_second'] / old['ops_per_second'] - 1
+        regressed = regressed or change < -arguments.threshold
+        p99 = f"{old['latency_us']['p99']:.0f} -> {new['latency_us']['p99']:.0f}"
+        print(f"{key:50} {old['ops_per_second']:12.0f} {new['ops_per_second']:12.0f} {change:+8.1%}  {p99:>19}")
+    return 1 if regressed else 0
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_layout_arguments(subparser):
+        subparser.add_argument('--entries', type=int, default=100_000, help="Number of entries in the big folder.")
+        subparser.add_argument('--tree-folders', type=int, default=20)
+        subparser.add_argument('--tree-files', type=int, default=500)
+
+    run_parser = subparsers.add_parser('run', help="Run the benchmarks.")
+    add_layout_arguments(run_parser)
+    run_parser.add_argument('--filesystem', action='append', choices=FILESYSTEMS)
+    run_parser.add_argument('--workload', action='append', choices=list(WORKLOADS))
+    run_parser.add_argument(
+        '--library', action='append', help="Value for FUSE_LIBRARY_NAME, e.g., fuse or fuse3. May be repeated."
+    )
+    run_parser.add_argument('-o', '--output', help="Write JSON results to this file instead of stdout.")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare two JSON result files.")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('contender')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="Allowed relative slowdown.")
+
+    serve_parser = subparsers.add_parser('serve', help="Internal: mount a benchmark filesystem in the foreground.")
+    serve_parser.add_argument('filesystem', choices=FILESYSTEMS)
+    serve_parser.add_argument('mount')
+    serve_parser.add_argument('--root')
+    add_layout_arguments(serve_parser)
+
+    arguments = parser.parse_args(args)
+    if arguments.command == 'run':
+        run(arguments)
+    elif arguments.command == 'compare':
+        sys.exit(compare(arguments))
+    elif arguments.command == 'serve':
+        serve(arguments)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmarks for the translation layer using mfusepy.Driver, i.e., without mounting.
+The callbacks go through the same ctypes prototypes and wrappers as when called by libfuse
+but without the kernel round trip, which makes the Python overhead measurable in isolation.
+"""
+
+import argparse
+import ctypes
+import errno
+import json
+import os
+import stat
+import sys
+import time
+from array import array
+from collections.abc import Iterable
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+
+class Static(fuse.Operations):
+    use_ns = True
+
+    def __init__(self, entries: int, file_size: int, raw_fi: bool) -> None:
+        self.raw_fi = raw_fi
+        self.directory: dict[str, Any] = {'st_mode': stat.S_IFDIR | 0o755, 'st_nlink': 2}
+        self.file: dict[str, Any] = {'st_mode': stat.S_IFREG | 0o644, 'st_nlink': 1, 'st_size': file_size}
+        self.names = [f'file-{i:07d}' for i in range(entries)]
+        self.entries = fuse.DirEntries(
+            [name.encode() for name in self.names],
+            array('I', [stat.S_IFREG] * entries),
+            array('Q', range(1, entries + 1)),
+        )
+        self.data = bytes(file_size)
+        self.xattrs = {f'user.attribute-{i}': b'value' * i for i in range(16)}
+
+    @fuse.overrides(fuse.Operations)
+    def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+        return self.directory if path == '/' else self.file
+
+    @fuse.overrides(fuse.Operations)
+    def readdir(self, path: str, fh: int) -> fuse.ReadDirEntriesResult:
+        return self.entries if path == '/bulk' else self.names
+
+    @fuse.overrides(fuse.Operations)
+    def create(self, path: str, mode: int, fi=None) -> int:
+        return 0
+
+    @fuse.overrides(fuse.Operations)
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        # With raw_fi, fh is the fuse_file_info struct. Access it like a real filesystem would.
+        if self.raw_fi and fh.fh != 0:  # type: ignore[attr-defined]
+            raise fuse.FuseOSError(errno.EBADF)
+        return self.data[offset : offset + size]
+
+    @fuse.overrides(fuse.Operations)
+    def listxattr(self, path: str) -> Iterable[str]:
+        return self.xattrs
+
+    @fuse.overrides(fuse.Operations)
+    def getxattr(self, path: str, name: str, position: int = 0) -> bytes:
+        return self.xattrs[name]
+
+
+class CachedStatic(Static):
+    # Listings are replayed from the DirectoryCache after the first readdir call.
+    directory_cache_size = 256 << 20
+
+
+def best_of(repeat: int, function) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - t0)
+    return min(durations)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--number',
+        type=int,
+        default=100000,
+        help='Number of getattr, create, and 4 KiB read calls per repetition. A 16th for xattr calls.',
+    )
+    parser.add_argument('--entries', type=int, default=100000, help='Number of directory entries for readdir.')
+    parser.add_argument('--read-size', type=int, default=128 * 1024)
+    parser.add_argument('--file-size', type=int, default=64 * 1024 * 1024)
+    parser.add_argument('--raw-fi', action='store_true')
+    args = parser.parse_args(args)
+
+    driver = fuse.Driver(Static(args.entries, args.file_size, args.raw_fi), raw_fi=args.raw_fi)
+    driver.init()
+
+    def getattr_loop():
+        for _ in range(args.number):
+            driver.getattr('/file')
+
+    def create_loop():
+        for i in range(args.number):
+            driver.create(f'/new{i}', 0o644)
+
+    def xattr_loop():
+        # Each call queries the size first and then fetches the result, like getfattr -d does.
+        for _ in range(args.number // 16):
+            driver.listxattr('/file')
+            driver.getxattr('/file', 'user.attribute-7')
+
+    def readdir_once():
+        driver.readdir('/')
+
+    def readdir_bulk_once():
+        driver.readdir('/bulk')
+
+    cached_driver = fuse.Driver(CachedStatic(args.entries, 0, False))
+    cached_driver.init()
+
+    def readdir_cached_once():
+        cached_driver.readdir('/')
+
+    fi = driver.open('/file')
+    buffer = ctypes.create_string_buffer(args.read_size)
+
+    def read_file():
+        for offset in range(0, args.file_size, args.read_size):
+            driver.read_into('/file', buffer, offset, fi)
+
+    small_buffer = ctypes.create_string_buffer(4096)
+    small_offsets = [(i * 7919 * 4096) % args.file_size for i in range(args.number)]
+
+    def read_small():
+        for offset in small_offsets:
+            driver.read_into('/file', small_buffer, offset, fi)
+
+    results = {
+        'getattr_ns_per_op': best_of(args.repeat, getattr_loop) / args.number * 1e9,
+        'create_ns_per_op': best_of(args.repeat, create_loop) / args.number * 1e9,
+        'xattr_ns_per_op': best_of(args.repeat, xattr_loop) / (args.number // 16 * 2) * 1e9,
+        'readdir_entries_per_s': args.entries / best_of(args.repeat, readdir_once),
+        'readdir_dir_entries_per_s': args.entries / best_of(args.repeat, readdir_bulk_once),
+        'readdir_cached_entries_per_s': args.entries / best_of(args.repeat, readdir_cached_once),
+        'read_GB_per_s': args.file_size / best_of(args.repeat, read_file) / 1e9,
+        'read_4KiB_iops': args.number / best_of(args.repeat, read_small),
+    }
+    driver.destroy()
+    cached_driver.destroy()
+
+    print(
+        json.dumps(
+            {
+                'libfuse': fuse.fuse_version_major,
+                'raw_fi': args.raw_fi,
+                'read_size': args.read_size,
+                'results': results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Measures random reads per second from a gzip, bzip2, or xz compressed file with SeekableDecompressor
+compared to seeking in the file objects of the standard library, which decompress from the start of the file
+for each backward seek. The block cache is disabled to measure the decompression.
+"""
+
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+FORMATS = {'gzip': (gzip.compress, gzip.open), 'bzip2': (bz2.compress, bz2.open), 'xz': (lzma.compress, lzma.open)}
+
+
+def generate_data(size: int) -> bytes:
+    random.seed(0)
+    words = [os.urandom(random.randrange(2, 12)).hex().encode() for _ in range(1000)]
+    return b' '.join(random.choices(words, k=size // 12))[:size]
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='gzip')
+    parser.add_argument('--size', type=int, default=64 << 20, help='Decompressed size in bytes.')
+    parser.add_argument('--members', type=int, default=1, help='Number of gzip members, bzip2 or xz streams.')
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--read-size', type=int, default=4096)
+    args = parser.parse_args(args)
+
+    compress, open_file = FORMATS[args.format]
+    data = generate_data(args.size)
+    part_size = -(-len(data) // args.members)
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'data')
+        with open(path, 'wb') as file:
+            file.writelines(compress(data[offset : offset + part_size]) for offset in range(0, len(data), part_size))
+        results['compressed_bytes'] = os.path.getsize(path)
+        offsets = [random.randrange(len(data) - args.read_size) for _ in range(args.reads)]
+
+        t0 = time.perf_counter()
+        decompressor = fuse.SeekableDecompressor(path, cache_bytes=0)
+        results['index_s'] = time.perf_counter() - t0
+        results['restart_points'] = len(decompressor._restarts)
+
+        t0 = time.perf_counter()
+        for offset in offsets:
+            assert decompressor.pread(args.read_size, offset) == data[offset : offset + args.read_size]
+        results['seekable_reads_per_s'] = args.reads / (time.perf_counter() - t0)
+        decompressor.close()
+
+        t0 = time.perf_counter()
+        with open_file(path, 'rb') as file:
+            for offset in offsets:
+                file.seek(offset)
+                file.read(args.read_size)
+        results['stdlib_reads_per_s'] = args.reads / (time.perf_counter() - t0)
+
+    print(json.dumps({'format': args.format, 'size': args.size, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
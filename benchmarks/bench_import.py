@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""
+Measures the wall-clock time of 'import mfusepy' in fresh interpreters, minus the interpreter startup time.
+The cold variant uses an empty cache folder (XDG_CACHE_HOME) for the libfuse lookup.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def measure(code: str, repeat: int, env: dict[str, str]) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, env=env, cwd=REPOSITORY)
+        durations.append(time.perf_counter() - t0)
+    return durations
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--library', help='Value for FUSE_LIBRARY_NAME, e.g., fuse or fuse3.')
+    args = parser.parse_args(args)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPOSITORY, env.get('PYTHONPATH')]))
+    if args.library:
+        env['FUSE_LIBRARY_NAME'] = args.library
+
+    baseline = statistics.median(measure('pass', args.repeat, env))
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        cold = []
+        for i in range(args.repeat):
+            env['XDG_CACHE_HOME'] = os.path.join(folder, str(i))
+            cold.extend(measure('import mfusepy', 1, env))
+        results['cold_cache_ms'] = (statistics.median(cold) - baseline) * 1e3
+
+        env['XDG_CACHE_HOME'] = os.path.join(folder, 'warm')
+        measure('import mfusepy', 1, env)
+        results['warm_cache_ms'] = (statistics.median(measure('import mfusepy', args.repeat, env)) - baseline) * 1e3
+
+    print(json.dumps({'interpreter_startup_ms': baseline * 1e3, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
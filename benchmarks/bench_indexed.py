@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+Measures the memory per entry, the peak memory per entry during construction, and the lookup and listing
+throughput of IndexedReadOnlyFS compared to the common approach of a dictionary that maps each path to
+a dictionary of stat attributes.
+Lookups are measured by calling getattr directly and through mfusepy.Driver.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import stat
+import sys
+import time
+import tracemalloc
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+
+class Dictionaries(fuse.Operations):
+    use_ns = True
+
+    def __init__(self, rows) -> None:
+        self.files: dict[str, dict[str, Any]] = {'/': {'st_mode': stat.S_IFDIR | 0o555, 'st_nlink': 2}}
+        for path, mode, size, mtime in rows:
+            self.files[path] = {'st_mode': mode, 'st_nlink': 1, 'st_size': size, 'st_mtime': mtime}
+
+    @fuse.overrides(fuse.Operations)
+    def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+        if path not in self.files:
+            raise fuse.FuseOSError(2)
+        return self.files[path]
+
+
+def generate_rows(entries: int, files_per_folder: int):
+    for i in range(entries):
+        folder = i // files_per_folder
+        yield f'/folder-{folder // 1000:04d}/folder-{folder:06d}/file-{i:08d}.txt', stat.S_IFREG | 0o444, i, 10**18
+
+
+def measure_memory(factory) -> tuple[Any, int, int]:
+    '''Returns the result of factory, the memory it allocated, and the peak memory usage during the call.'''
+    gc.collect()
+    tracemalloc.start()
+    result = factory()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, peak
+
+
+def best_of(repeat: int, function) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - t0)
+    return min(durations)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--files-per-folder', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(args)
+
+    paths = [row[0] for row in generate_rows(args.entries, args.files_per_folder)]
+    random.seed(0)
+    lookups = random.choices(paths, k=args.lookups)
+    folder = os.path.dirname(paths[0])
+    del paths
+
+    results: dict[str, Any] = {}
+    indexed, size, peak = measure_memory(
+        lambda: fuse.IndexedReadOnlyFS(generate_rows(args.entries, args.files_per_folder))
+    )
+    results['indexed_bytes_per_entry'] = size / len(indexed)
+    results['indexed_peak_bytes_per_entry'] = peak / len(indexed)
+    dictionaries, size, peak = measure_memory(lambda: Dictionaries(generate_rows(args.entries, args.files_per_folder)))
+    results['dict_bytes_per_entry'] = size / len(dictionaries.files)
+    results['dict_peak_bytes_per_entry'] = peak / len(dictionaries.files)
+
+    for name, operations in (('indexed', indexed), ('dict', dictionaries)):
+
+        def lookup_loop(operations=operations):
+            for path in lookups:
+                operations.getattr(path)
+
+        results[f'{name}_getattr_per_s'] = args.lookups / best_of(args.repeat, lookup_loop)
+
+        driver = fuse.Driver(operations)
+
+        def driver_loop(driver=driver):
+            for path in lookups:
+                driver.getattr(path)
+
+        results[f'{name}_driver_getattr_per_s'] = args.lookups / best_of(args.repeat, driver_loop)
+
+    driver = fuse.Driver(indexed)
+    fi = driver.opendir(folder)
+    results['indexed_readdir_entries_per_s'] = args.files_per_folder / best_of(
+        args.repeat, lambda: driver.readdir(folder, fi)
+    )
+
+    print(json.dumps({'entries': args.entries, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Measures the per-call overhead of LoggingMixIn and log_callback compared to undecorated callbacks.
+With the callback logger at INFO level, the overhead should be close to a single function call.
+"""
+
+import argparse
+import json
+import logging
+import os
+import stat
+import sys
+import timeit
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+
+class Plain(fuse.Operations):
+    use_ns = True
+
+    def __init__(self) -> None:
+        self.files: dict[str, dict[str, Any]] = {'/': {'st_mode': stat.S_IFDIR | 0o755, 'st_nlink': 2}}
+
+    @fuse.overrides(fuse.Operations)
+    def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+        return self.files[path]
+
+    @fuse.overrides(fuse.Operations)
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        return bytes(size)
+
+
+class MixedIn(fuse.LoggingMixIn, Plain):
+    pass
+
+
+class Decorated(Plain):
+    @fuse.log_callback
+    @fuse.overrides(fuse.Operations)
+    def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+        return self.files[path]
+
+    @fuse.log_callback
+    @fuse.overrides(fuse.Operations)
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        return bytes(size)
+
+
+def measure(operations, repeat: int, number: int) -> dict[str, float]:
+    calls = {
+        'getattr': lambda: operations.getattr('/'),
+        'read_128KiB': lambda: operations.read('/', 128 * 1024, 0, 0),
+        'attribute_access': lambda: operations.files,
+    }
+    return {name: min(timeit.repeat(call, repeat=repeat, number=number)) / number * 1e9 for name, call in calls.items()}
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args(args)
+
+    results: dict[str, Any] = {}
+    for level in (logging.INFO, logging.DEBUG):
+        fuse.callback_logger.setLevel(level)
+        fuse.callback_logger.propagate = False
+        fuse.callback_logger.addHandler(logging.NullHandler())
+        results[logging.getLevelName(level)] = {
+            cls.__name__: measure(cls(), args.repeat, args.number) for cls in (Plain, MixedIn, Decorated)
+        }
+
+    print(json.dumps({'unit': 'ns/call', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
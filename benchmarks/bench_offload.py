@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Measures the read throughput of a filesystem with CPU-bound reads from multiple threads using mfusepy.Driver,
+once with reads in the libfuse threads and once for each number of worker processes with @offload.
+On Python 3.13 and newer, it also measures @offload with FUSE(..., interpreter_pool=True) for each number of
+workers as the number of threads, because each thread is pinned to its own subinterpreter.
+Each read decompresses a run-length encoded block in a Python loop, which holds the GIL like most decoders,
+checksums, and ciphers written in Python.
+"""
+
+import argparse
+import json
+import os
+import stat
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+
+def run_length_encode(data: bytes) -> list[tuple[int, int]]:
+    runs: list[tuple[int, int]] = []
+    for byte in data:
+        if runs and runs[-1][0] == byte:
+            runs[-1] = (byte, runs[-1][1] + 1)
+        else:
+            runs.append((byte, 1))
+    return runs
+
+
+class RunLengthEncoded(fuse.Operations):
+    use_ns = True
+
+    def __init__(self, block_size: int, blocks: int) -> None:
+        self.block_size = block_size
+        # Runs of 1 to 4 bytes for many small runs per block.
+        block = bytes(i // (i % 4 + 1) % 256 for i in range(block_size))
+        self.blocks = [run_length_encode(block)] * blocks
+        self.file: dict[str, Any] = {'st_mode': stat.S_IFREG | 0o444, 'st_nlink': 1, 'st_size': block_size * blocks}
+
+    @fuse.overrides(fuse.Operations)
+    def getattr(self, path: str, fh: Optional[int] = None) -> dict[str, Any]:
+        return self.file
+
+    @fuse.overrides(fuse.Operations)
+    def open(self, path: str, flags: int) -> int:
+        return 0
+
+    @fuse.overrides(fuse.Operations)
+    @fuse.offload
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        data = bytearray()
+        for byte, count in self.blocks[offset // self.block_size]:
+            data += bytes((byte,)) * count
+        start = offset % self.block_size
+        return bytes(data[start : start + size])
+
+
+def measure(operations: RunLengthEncoded, threads: int, reads: int, **options) -> float:
+    with fuse.Driver(operations, **options) as driver:
+        fi = driver.open('/file')
+        block_size = operations.block_size
+        # Start the worker processes before measuring.
+        driver.read('/file', block_size, 0, fi)
+
+        def read_blocks(thread: int) -> None:
+            # Create the subinterpreter of this thread before measuring.
+            driver.read('/file', block_size, 0, fi)
+            barrier.wait()
+            for i in range(reads):
+                driver.read('/file', block_size, (thread + i * threads) % len(operations.blocks) * block_size, fi)
+
+        barrier = threading.Barrier(threads + 1)
+        workers_threads = [threading.Thread(target=read_blocks, args=(thread,)) for thread in range(threads)]
+        for thread in workers_threads:
+            thread.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        for thread in workers_threads:
+            thread.join()
+        return threads * reads * block_size / (time.perf_counter() - t0)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--block-size', type=int, default=128 << 10)
+    parser.add_argument('--blocks', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=8, help='Number of threads calling read concurrently.')
+    parser.add_argument('--reads', type=int, default=20, help='Number of reads per thread.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args(args)
+
+    operations = RunLengthEncoded(args.block_size, args.blocks)
+    results = {'threads_bytes_per_s': measure(operations, args.threads, args.reads)}
+    for workers in sorted(set(args.workers)):
+        results[f'processes_{workers}_bytes_per_s'] = measure(
+            operations, args.threads, args.reads, process_pool=workers
+        )
+    interpreters = fuse.InterpreterPool.is_supported()
+    if interpreters:
+        for workers in sorted(set(args.workers)):
+            results[f'interpreters_{workers}_bytes_per_s'] = measure(
+                operations, workers, args.reads, interpreter_pool=True
+            )
+
+    print(
+        json.dumps(
+            {'cpu_count': os.cpu_count(), 'threads': args.threads, 'interpreters': interpreters, 'results': results},
+            indent=2,
+        )
+    )
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Builds an SQLiteMetadataFS database with 1M rows, unless it already exists, and measures the time to open it,
+the lookups per second with and without the LRU caches, and the listed entries per second.
+"""
+
+import argparse
+import json
+import os
+import random
+import stat
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy as fuse  # noqa: E402
+
+
+def generate_rows(entries: int, files_per_folder: int):
+    for i in range(entries):
+        folder = i // files_per_folder
+        yield f'/folder-{folder // 1000:04d}/folder-{folder:06d}/file-{i:08d}.txt', stat.S_IFREG | 0o444, i, 10**18
+
+
+def best_of(repeat: int, function) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - t0)
+    return min(durations)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='Path to the database. Defaults to a file in the temporary folder.')
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--files-per-folder', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(args)
+
+    database = args.database or os.path.join(
+        tempfile.gettempdir(), f'mfusepy-bench-{args.entries}-{args.files_per_folder}.sqlite'
+    )
+    results = {}
+    if not os.path.exists(database):
+        t0 = time.perf_counter()
+        fuse.SQLiteMetadataFS.build(database, generate_rows(args.entries, args.files_per_folder))
+        results['build_s'] = time.perf_counter() - t0
+    results['database_bytes_per_entry'] = os.path.getsize(database) / args.entries
+
+    paths = [row[0] for row in generate_rows(args.entries, args.files_per_folder)]
+    random.seed(0)
+    lookups = random.choices(paths, k=args.lookups)
+    folder = os.path.dirname(paths[0])
+    del paths
+
+    t0 = time.perf_counter()
+    operations = fuse.SQLiteMetadataFS(database)
+    operations.getattr(lookups[0])
+    results['open_and_first_getattr_s'] = time.perf_counter() - t0
+
+    for name, cache_size in (('uncached', 0), ('cached', 1 << 20)):
+        operations = fuse.SQLiteMetadataFS(database, cache_size=cache_size)
+
+        def lookup_loop(operations=operations):
+            for path in lookups:
+                operations.getattr(path)
+
+        results[f'{name}_getattr_per_s'] = args.lookups / best_of(args.repeat, lookup_loop)
+
+    driver = fuse.Driver(operations)
+    fi = driver.opendir(folder)
+
+    def list_folder():
+        offset = 0
+        while True:
+            page = driver.readdir(folder, fi, offset)
+            if not page:
+                break
+            offset = page[-1][3]
+
+    results['readdir_entries_per_s'] = args.files_per_folder / best_of(args.repeat, list_folder)
+    driver.destroy()
+
+    print(json.dumps({'entries': args.entries, 'database': database, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+"""
+Mounts mfusepy.Passthrough, which mirrors a folder like loopback.py but scales to multiple threads,
+avoids path lookups from /, and requests kernel passthrough for reads and writes where available.
+"""
+
+import argparse
+import logging
+
+import mfusepy as fuse
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root')
+    parser.add_argument('mount')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    fuse.FUSE(fuse.Passthrough(args.root), args.mount, foreground=True)
+
+
+if __name__ == '__main__':
+    cli()
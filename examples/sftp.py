@@ -3,6 +3,7 @@
 import argparse
 import errno
 import logging
+import os
 from typing import Optional
 
 import paramiko
@@ -17,6 +18,9 @@ class SFTP(fuse.Operations):
     You need to be able to login to remote host without entering a password.
     '''
 
+    # Pass the opened paramiko.SFTPFile objects as fh instead of opening the file for each read and write.
+    use_object_handles = True
+
     def __init__(self, host, username=None, port=22):
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -33,11 +37,10 @@ class SFTP(fuse.Operations):
         return self.sftp.chown(path, uid, gid)
 
     @fuse.overrides(fuse.Operations)
-    def create(self, path: str, mode, fi=None) -> int:
-        f = self.sftp.open(path, 'w')
+    def create(self, path: str, mode, fi=None):
+        f = self.sftp.open(path, 'w+')
         f.chmod(mode)
-        f.close()
-        return 0
+        return f
 
     @fuse.overrides(fuse.Operations)
     def destroy(self, path: str) -> None:
@@ -58,12 +61,13 @@ class SFTP(fuse.Operations):
         return self.sftp.mkdir(path, mode)
 
     @fuse.overrides(fuse.Operations)
-    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
-        f = self.sftp.open(path)
-        f.seek(offset, 0)
-        buf = f.read(size)
-        f.close()
-        return buf
+    def open(self, path: str, flags: int):
+        return self.sftp.open(path, 'r' if (flags & os.O_ACCMODE) == os.O_RDONLY else 'r+')
+
+    @fuse.overrides(fuse.Operations)
+    def read(self, path: str, size: int, offset: int, fh) -> bytes:
+        fh.seek(offset, 0)
+        return fh.read(size)
 
     @fuse.overrides(fuse.Operations)
     def readdir(self, path: str, fh: int) -> fuse.ReadDirResult:
@@ -73,6 +77,11 @@ class SFTP(fuse.Operations):
     def readlink(self, path: str) -> str:
         return self.sftp.readlink(path)
 
+    @fuse.overrides(fuse.Operations)
+    def release(self, path: str, fh) -> int:
+        fh.close()
+        return 0
+
     @fuse.overrides(fuse.Operations)
     def rename(self, old: str, new: str) -> int:
         return self.sftp.rename(old, new)
@@ -98,11 +107,9 @@ class SFTP(fuse.Operations):
         return self.sftp.utime(path, times)
 
     @fuse.overrides(fuse.Operations)
-    def write(self, path: str, data: bytes, offset: int, fh: int) -> int:
-        f = self.sftp.open(path, 'r+')
-        f.seek(offset, 0)
-        f.write(data)
-        f.close()
+    def write(self, path: str, data: bytes, offset: int, fh) -> int:
+        fh.seek(offset, 0)
+        fh.write(data)
         return len(data)
 
 
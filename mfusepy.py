@@ -17,25 +17,35 @@
 # to 0 and the ctypes module does that for us out of the box!
 # https://github.com/python/cpython/blob/f8a736b8e14ab839e1193cb1d3955b61c316d048/Lib/test/test_ctypes/test_numbers.py#L95
 
+import array
+import bisect
+import collections
 import contextlib
 import ctypes
 import errno
 import functools
-import inspect
+import io
+import itertools
 import logging
 import os
 import platform
+import struct
+import sys
+import threading
+import time
 import warnings
-from collections.abc import Iterable, Sequence
+import zlib
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
 from ctypes import CFUNCTYPE, POINTER, c_char_p, c_int, c_size_t, c_ssize_t, c_uint, c_void_p
-from ctypes.util import find_library
 from signal import SIG_DFL, SIGINT, SIGTERM, signal
-from stat import S_IFDIR
+from stat import S_IFDIR, S_IFLNK, S_IFMT, S_IFREG
 from typing import TYPE_CHECKING, Any, Optional, Union, get_type_hints
 
 FieldsEntry = Union[tuple[str, type], tuple[str, type, int]]
 BitFieldsEntry = tuple[str, type, int]
-ReadDirResult = Iterable[Union[str, tuple[str, dict[str, int], int], tuple[str, int, int]]]
+ReadDirResult = Iterable[Union[str, tuple[str, dict[str, int], int], tuple[str, int, int], 'os.DirEntry[str]']]
+# For readdir implementations, which return DirEntries instead of yielding the entries.
+ReadDirEntriesResult = Union[ReadDirResult, 'DirEntries']
 
 if TYPE_CHECKING:
     c_byte_p = ctypes._Pointer[ctypes.c_byte]  # noqa: W212
@@ -56,8 +66,6 @@ if _system == 'Windows' or _system.startswith('CYGWIN'):
     #
     # We have to fix up c_long and c_ulong so that it matches the
     # Cygwin (and UNIX) sizes when run on Windows.
-    import sys
-
     c_win_long = ctypes.c_int64 if sys.maxsize > 0xFFFFFFFF else ctypes.c_int32
     c_win_ulong = ctypes.c_uint64 if sys.maxsize > 0xFFFFFFFF else ctypes.c_uint32
 
@@ -77,6 +85,86 @@ class c_utimbuf(ctypes.Structure):
     _fields_ = [('actime', c_timespec), ('modtime', c_timespec)]
 
 
+# Well-known sonames, which can be loaded directly. This avoids importing ctypes.util and find_library,
+# which may spawn ldconfig, gcc, or ld subprocesses and therefore dominates the import time.
+_LIBFUSE_SONAMES = {'fuse': 'libfuse.so.2', 'fuse3': 'libfuse3.so.3'}
+
+
+def _library_cache_path() -> str:
+    cache_folder = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_folder, 'mfusepy', 'libraries.json')
+
+
+def _library_identity(path: str) -> Optional[list[int]]:
+    try:
+        stats = os.stat(path)
+    except OSError:
+        return None
+    return [stats.st_ino, stats.st_mtime_ns]
+
+
+def _is_loadable(path: str) -> bool:
+    try:
+        ctypes.CDLL(path)
+    except OSError:
+        return False
+    return True
+
+
+def _find_library(name: str) -> Optional[str]:
+    '''
+    Returns the result of ctypes.util.find_library, which is cached in the user cache folder because
+    it can take up to hundreds of milliseconds. Cached absolute paths are invalidated when the inode
+    or modification time of the library changes. Cached sonames, as returned on Linux, are checked
+    by loading them.
+    '''
+    import json  # pylint: disable=import-outside-toplevel
+
+    cache_path = _library_cache_path()
+    cache: dict[str, Any] = {}
+    with contextlib.suppress(OSError, ValueError), open(cache_path, encoding='utf-8') as file:
+        cache = json.load(file)
+    if not isinstance(cache, dict):
+        cache = {}
+
+    entry = cache.get(name)
+    if isinstance(entry, dict) and isinstance(entry.get('path'), str):
+        path = entry['path']
+        if os.path.isabs(path):
+            if entry.get('identity') is not None and entry['identity'] == _library_identity(path):
+                return path
+        elif _is_loadable(path):
+            return path
+
+    from ctypes.util import find_library  # pylint: disable=import-outside-toplevel
+
+    path = find_library(name)
+    if path:
+        cache[name] = {'path': path, 'identity': _library_identity(path) if os.path.isabs(path) else None}
+        with contextlib.suppress(OSError):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(cache, file)
+            os.replace(temporary_path, cache_path)
+    return path
+
+
+def _find_libfuse(*names: str) -> Optional[str]:
+    '''
+    Returns the first library of names that can be found. The well-known sonames of all names are tried
+    before any find_library call, so that, e.g., systems with only libfuse3 do not spawn processes.
+    '''
+    for name in names:
+        soname = _LIBFUSE_SONAMES.get(name)
+        if soname and _is_loadable(soname):
+            return soname
+    for name in names:
+        if path := _find_library(name):
+            return path
+    return None
+
+
 # Beware that FUSE_LIBRARY_PATH path was unchecked! If it is set to libfuse3.so.3.14.0,
 # then it will mount without error, but when trying to access the mount point, will give:
 #     Uncaught exception from FUSE operation setxattr, returning errno.EINVAL:
@@ -94,10 +182,10 @@ _libfuse_path = os.environ.get('FUSE_LIBRARY_PATH')
 if not _libfuse_path:
     if _system == 'Darwin':
         # libfuse dependency
-        _libiconv = ctypes.CDLL(find_library('iconv'), ctypes.RTLD_GLOBAL)
+        _libiconv = ctypes.CDLL(_find_library('iconv'), ctypes.RTLD_GLOBAL)
 
         _libfuse_path = (
-            find_library('fuse4x') or find_library('osxfuse') or find_library('fuse') or find_library('fuse-t')
+            _find_library('fuse4x') or _find_library('osxfuse') or _find_library('fuse') or _find_library('fuse-t')
         )
     elif _system == 'Windows':
         # pytype: disable=module-attr
@@ -126,11 +214,9 @@ if not _libfuse_path:
             _libfuse_path += f"bin\\winfsp-{arch}.dll"
         # pytype: enable=module-attr
     elif _libfuse_name := os.environ.get('FUSE_LIBRARY_NAME'):
-        _libfuse_path = find_library(_libfuse_name)
+        _libfuse_path = _find_libfuse(_libfuse_name)
     else:
-        _libfuse_path = find_library('fuse')
-        if not _libfuse_path:
-            _libfuse_path = find_library('fuse3')
+        _libfuse_path = _find_libfuse('fuse', 'fuse3')
 
 if not _libfuse_path:
     raise OSError('Unable to find libfuse')
@@ -743,6 +829,7 @@ else:
 #  - 3.13.1 -> 3.14.1: parallel_direct_writes was added in the middle.
 #                      Padding was correctly decreased by 1.
 #  - 3.14.1 -> 3.16.2: no change
+#  - 3.16.2 -> 3.17.0: backing_id was added after poll_events, which is a uint32_t followed by padding before.
 _fuse_int32 = ctypes.c_int32 if (fuse_version_major, fuse_version_minor) >= (3, 17) else ctypes.c_int
 _fuse_uint32 = ctypes.c_uint32 if (fuse_version_major, fuse_version_minor) >= (3, 17) else ctypes.c_uint
 _fuse_file_info_fields_: list[FieldsEntry] = []
@@ -861,8 +948,14 @@ elif fuse_version_major == 3:
     _fuse_file_info_fields_ += [
         ('fh', ctypes.c_uint64),
         ('lock_owner', ctypes.c_uint64),
-        ('poll_events', ctypes.c_uint64),
     ]
+    if fuse_version_minor >= 17:
+        _fuse_file_info_fields_ += [
+            ('poll_events', ctypes.c_uint32),
+            ('backing_id', ctypes.c_int32),  # Used for kernel passthrough, see OpenResult.
+        ]
+    else:
+        _fuse_file_info_fields_ += [('poll_events', ctypes.c_uint64)]
 
 
 class fuse_file_info(ctypes.Structure):
@@ -1253,7 +1346,37 @@ def time_of_timespec(ts, use_ns: bool = False) -> float:
     return ts.tv_sec + ts.tv_nsec / 1e9
 
 
-def set_st_attrs(st, attrs: dict[str, Any], use_ns: bool = False) -> None:
+_STAT_RESULT_FIELDS = (
+    'st_dev',
+    'st_ino',
+    'st_mode',
+    'st_nlink',
+    'st_uid',
+    'st_gid',
+    'st_rdev',
+    'st_size',
+    'st_blksize',
+    'st_blocks',
+)
+
+
+def _set_st_attrs_from_stat_result(st, result: os.stat_result) -> None:
+    for key in _STAT_RESULT_FIELDS:
+        setattr(st, key, getattr(result, key))
+    # os.stat_result always has nanosecond timestamps, which do not lose precision, independent of use_ns.
+    st.st_atimespec.tv_sec, st.st_atimespec.tv_nsec = divmod(result.st_atime_ns, 10**9)
+    st.st_mtimespec.tv_sec, st.st_mtimespec.tv_nsec = divmod(result.st_mtime_ns, 10**9)
+    st.st_ctimespec.tv_sec, st.st_ctimespec.tv_nsec = divmod(result.st_ctime_ns, 10**9)
+
+
+def set_st_attrs(st, attrs: Union[dict[str, Any], os.stat_result, c_stat], use_ns: bool = False) -> None:
+    if isinstance(attrs, os.stat_result):
+        _set_st_attrs_from_stat_result(st, attrs)
+        return
+    if isinstance(attrs, c_stat):
+        ctypes.memmove(ctypes.addressof(st), ctypes.addressof(attrs), ctypes.sizeof(c_stat))
+        return
+
     for key, val in attrs.items():
         if key in ('st_atime', 'st_mtime', 'st_ctime', 'st_birthtime'):
             timespec = getattr(st, key + 'spec', None)
@@ -1269,12 +1392,101 @@ def set_st_attrs(st, attrs: dict[str, Any], use_ns: bool = False) -> None:
             setattr(st, key, val)
 
 
+# The same libfuse function with a different return type to get the address without creating a ctypes pointer object.
+_fuse_get_context_address = _libfuse['fuse_get_context']
+_fuse_get_context_address.restype = ctypes.c_void_p
+
+_fuse_context_has_umask = (fuse_version_major, fuse_version_minor) >= (2, 8)
+# Native alignment ('@') matches the C struct layout. Each simple ctypes type stores its struct format in _type_.
+_fuse_context_struct = struct.Struct(
+    '@'
+    + ''.join(
+        field[1]._type_  # type: ignore[union-attr,misc]
+        for field in fuse_context._fields_
+        if _fuse_context_has_umask or field[0] != 'umask'
+    )
+)
+
+if hasattr(_libfuse, 'fuse_getgroups'):  # Added in 2.8
+    _libfuse.fuse_getgroups.argtypes = [c_int, POINTER(c_gid_t)]
+    _libfuse.fuse_getgroups.restype = c_int
+
+
+class RequestContext:
+    '''
+    Information about the process that issued the current FUSE request. Returned by request_context.
+    The object is reused for all requests handled by the same libfuse thread and is overwritten
+    on the next call to request_context in that thread. Do not keep it beyond the request.
+    '''
+
+    __slots__ = ('_groups', '_view', 'gid', 'pid', 'uid', 'umask')
+
+    def __init__(self, view: Optional[memoryview]) -> None:
+        self._view = view
+        self._groups: Optional[list[int]] = None if view else []
+        self.uid = 0
+        self.gid = 0
+        self.pid = 0
+        self.umask = 0
+
+    def _refresh(self) -> 'RequestContext':
+        values = _fuse_context_struct.unpack_from(self._view)  # type: ignore[arg-type]
+        self.uid, self.gid, self.pid = values[1:4]
+        if _fuse_context_has_umask:
+            self.umask = values[5]
+        self._groups = None
+        return self
+
+    @property
+    def groups(self) -> list[int]:
+        '''
+        Supplementary group IDs of the caller. They are queried on first access because this is expensive.
+        Empty if not supported, e.g., by libfuse < 2.8 or on non-Linux systems.
+        '''
+        if self._groups is None:
+            self._groups = _get_request_groups()
+        return self._groups
+
+
+def _get_request_groups() -> list[int]:
+    if not hasattr(_libfuse, 'fuse_getgroups'):
+        return []
+    size = 32
+    while True:
+        groups = (c_gid_t * size)()  # type: ignore[operator]
+        count = _libfuse.fuse_getgroups(size, groups)
+        if count < 0:
+            return []
+        if count <= size:
+            return list(groups[:count])
+        size = count
+
+
+_NO_REQUEST_CONTEXT = RequestContext(None)
+# The context returned by libfuse is stored per thread, so the address identifies the thread.
+_request_contexts: dict[int, RequestContext] = {}
+
+
+def request_context() -> RequestContext:
+    '''
+    Returns the uid, gid, pid, umask, and supplementary groups of the process that issued the current request.
+    Outside of a FUSE request, e.g., when using Driver, all values are 0 and groups is empty.
+    '''
+    address = _fuse_get_context_address()
+    if not address:
+        return _NO_REQUEST_CONTEXT
+    context = _request_contexts.get(address)
+    if context is None:
+        view = memoryview((ctypes.c_char * _fuse_context_struct.size).from_address(address))
+        context = _request_contexts.setdefault(address, RequestContext(view))
+    return context._refresh()
+
+
 def fuse_get_context() -> tuple[int, int, int]:
     'Returns a (uid, gid, pid) tuple'
 
-    ctxp = _libfuse.fuse_get_context()
-    ctx = ctxp.contents
-    return ctx.uid, ctx.gid, ctx.pid
+    context = request_context()
+    return context.uid, context.gid, context.pid
 
 
 def fuse_exit() -> None:
@@ -1291,14 +1503,648 @@ def fuse_exit() -> None:
         os.kill(os.getpid(), SIGTERM)
         return
 
-    fuse_ptr = ctypes.c_void_p(_libfuse.fuse_get_context().contents.fuse)
+    ctxp = _libfuse.fuse_get_context()
+    if not ctxp:
+        return
+    fuse_ptr = ctypes.c_void_p(ctxp.contents.fuse)
     _libfuse.fuse_exit(fuse_ptr)
 
 
+# Kernel passthrough, i.e., forwarding reads and writes of an open file directly to a backing file, was added
+# in libfuse 3.17 and Linux 6.9. libfuse only offers fuse_passthrough_open and fuse_passthrough_close in the
+# low-level API because they take the request as argument, but they only call these ioctls on the FUSE device.
+FUSE_CAP_PASSTHROUGH = 1 << 29
+_FUSE_DEV_IOC_BACKING_OPEN = 0x4010E501  # _IOW(229, 1, struct fuse_backing_map)
+_FUSE_DEV_IOC_BACKING_CLOSE = 0x4004E502  # _IOW(229, 2, uint32_t)
+_fuse_backing_map = struct.Struct('=iIQ')  # fd, flags, padding
+_has_passthrough = (
+    _system == 'Linux'
+    and (fuse_version_major, fuse_version_minor) >= (3, 17)
+    and hasattr(_libfuse, 'fuse_get_session')
+    and hasattr(_libfuse, 'fuse_session_fd')
+)
+
+if _has_passthrough:
+    _libfuse.fuse_get_session.argtypes = [c_void_p]
+    _libfuse.fuse_get_session.restype = c_void_p
+    _libfuse.fuse_session_fd.argtypes = [c_void_p]
+    _libfuse.fuse_session_fd.restype = c_int
+
+
+def _fuse_device_fd() -> Optional[int]:
+    '''Returns the file descriptor for /dev/fuse of the current session. Only works inside FUSE callbacks.'''
+    ctxp = _libfuse.fuse_get_context()
+    if not ctxp or not ctxp.contents.fuse:
+        return None
+    session = _libfuse.fuse_get_session(ctypes.c_void_p(ctxp.contents.fuse))
+    fd = _libfuse.fuse_session_fd(session) if session else -1
+    return fd if fd >= 0 else None
+
+
+class OpenResult:
+    '''
+    May be returned by open and create instead of the file handle in order to use kernel passthrough:
+    reads and writes of the opened file are then forwarded by the kernel to passthrough_fd without calling
+    read and write. This requires use_passthrough to be set on the Operations object, libfuse 3.17+,
+    Linux 6.9+, and CAP_SYS_ADMIN. If passthrough is not available, only fh is used, and read and write are
+    called as usual, so they must still be implemented. With raw_fi, fh is ignored and fi.fh should be set.
+    '''
+
+    __slots__ = ('fh', 'passthrough_fd')
+
+    def __init__(self, fh: Any = 0, passthrough_fd: Optional[int] = None) -> None:
+        self.fh = fh
+        self.passthrough_fd = passthrough_fd
+
+
+def _is_implemented(operations, name: str) -> bool:
+    value = getattr(operations, name, None)
+    return value is not None and not getattr(value, 'libfuse_ignore', False)
+
+
 class FuseOSError(OSError):
     def __init__(self, errno):
         super().__init__(errno, os.strerror(errno))
 
+    def __reduce__(self):
+        # OSError would be unpickled with (errno, strerror) as arguments, e.g., when raised in a ProcessPool.
+        return (self.__class__, (self.errno,))
+
+
+def _errno_name(error_number: int) -> str:
+    return errno.errorcode.get(error_number, str(error_number))
+
+
+class CallbackStatistics:
+    '''
+    Thread-safe counters collected by FUSE while mounted. Pass an instance via FUSE(..., statistics=...)
+    to be able to query it from other threads, e.g., from an Operations method or a monitoring thread.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.errors: dict[tuple[str, int], int] = {}
+        self.counters: dict[str, int] = {}
+
+    def record_error(self, operation: str, error_number: int) -> None:
+        key = (operation, error_number)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def increment(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        '''Returns a copy of all counters. Errors are keyed by "<operation>:<errno name>".'''
+        with self._lock:
+            return {
+                'errors': {
+                    f'{operation}:{_errno_name(error_number)}': count
+                    for (operation, error_number), count in self.errors.items()
+                },
+                'counters': dict(self.counters),
+            }
+
+
+class ErrorLogRateLimiter:
+    '''
+    Limits the number of log records for failing callbacks to max_records per operation and errno
+    in each interval (in seconds). The number of suppressed records is logged by a timer thread
+    when the interval has passed, or on unmount. Set max_records to None to log all errors.
+    '''
+
+    def __init__(self, max_records: Optional[int] = 10, interval: float = 10.0) -> None:
+        self.max_records = max_records
+        self.interval = interval
+        self._lock = threading.Lock()
+        # (operation, errno) -> [window start, logged records, suppressed records, log level]
+        self._windows: dict[tuple[str, int], list] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def allow(self, operation: str, error_number: int, level: int) -> bool:
+        if self.max_records is None:
+            return True
+
+        now = time.monotonic()
+        key = (operation, error_number)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window is not None:
+                    self._log_suppressed(key, window, now)
+                window = [now, 0, 0, level]
+                self._windows[key] = window
+
+            if window[1] < self.max_records:
+                window[1] += 1
+                return True
+            window[2] += 1
+            if self._timer is None:
+                self._schedule(window[0] + self.interval - now)
+            return False
+
+    def flush(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for key, window in self._windows.items():
+                self._log_suppressed(key, window, now)
+            self._windows.clear()
+
+    def _schedule(self, delay: float) -> None:
+        # Must be called with the lock held.
+        self._timer = threading.Timer(max(delay, 0.0), self._flush_due)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_due(self) -> None:
+        '''Logs the suppressed records of all ended windows and schedules the next check for open windows.'''
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            pending = []
+            for key, window in list(self._windows.items()):
+                if now - window[0] >= self.interval:
+                    self._log_suppressed(key, window, now)
+                    del self._windows[key]
+                elif window[2] > 0:
+                    pending.append(window[0] + self.interval - now)
+            if pending:
+                self._schedule(min(pending))
+
+    @staticmethod
+    def _log_suppressed(key: tuple[str, int], window: list, now: float) -> None:
+        if window[2] > 0:
+            log.log(
+                window[3],
+                "Suppressed %s %s from %s in the last %.1fs",
+                f'{window[2]:,}',
+                _errno_name(key[1]),
+                key[0],
+                now - window[0],
+            )
+
+
+class HandleTable:
+    '''
+    Maps integer handles, which can be stored in fuse_file_info.fh, to arbitrary Python objects.
+    Freed slots are reused. The upper 32 bits of each handle contain a generation counter for the slot
+    so that stale handles raise EBADF instead of returning an object that was added later.
+    The handle 0 is never returned.
+
+    Lookups are lock-free. Adding and removing objects is thread-safe.
+    '''
+
+    _EMPTY = object()
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Each slot is (generation, object) or (generation, _EMPTY) if freed. A tuple is read atomically.
+        self._slots: list[tuple[int, Any]] = [(0, self._EMPTY)]  # Slot 0 is reserved to never return handle 0.
+        self._free: list[int] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: Any) -> int:
+        with self._lock:
+            if self._free:
+                index = self._free.pop()
+                generation = (self._slots[index][0] + 1) & 0xFFFF_FFFF
+            else:
+                index = len(self._slots)
+                if index > 0xFFFF_FFFF:
+                    raise FuseOSError(errno.EMFILE)
+                self._slots.append((0, self._EMPTY))
+                generation = 0
+            self._slots[index] = (generation, value)
+            self._size += 1
+            return (generation << 32) | index
+
+    def get(self, handle: int) -> Any:
+        try:
+            generation, value = self._slots[handle & 0xFFFF_FFFF]
+        except IndexError:
+            raise FuseOSError(errno.EBADF) from None
+        if value is self._EMPTY or generation != handle >> 32 or handle <= 0:
+            raise FuseOSError(errno.EBADF)
+        return value
+
+    def remove(self, handle: int) -> Any:
+        '''Frees the slot for reuse and returns the stored object.'''
+        with self._lock:
+            value = self.get(handle)
+            index = handle & 0xFFFF_FFFF
+            self._slots[index] = (self._slots[index][0], self._EMPTY)
+            self._free.append(index)
+            self._size -= 1
+            return value
+
+
+class _Flight:
+    __slots__ = ('done', 'error', 'result', 'waiters')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.result: Any = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    '''
+    Coalesces concurrent calls with the same key: only the first caller calls the function. Callers
+    arriving while it is in flight wait for it and get the same result or exception. Results are not
+    cached beyond the duration of the first call. Memoryview results are shared as bytes copies because
+    their memory might be reused after the first call returns, e.g., by the next offloaded call of its thread.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def call(self, key: Hashable, function, *args) -> tuple[Any, bool]:
+        '''Returns the result of function(*args) and whether it was shared from another in-flight call.'''
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        result = None
+        try:
+            result = function(*args)
+        except BaseException as exception:
+            flight.error = exception
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.result = bytes(result) if flight.waiters and isinstance(result, memoryview) else result
+            flight.done.set()
+        return result, False
+
+    def detach(self, predicate: Callable[[Hashable], bool]) -> None:
+        '''
+        Lets new callers with a key, for which predicate returns True, start a new call instead of waiting for
+        the in-flight one, e.g., because it might return outdated data after a modification.
+        '''
+        with self._lock:
+            for key in [key for key in self._flights if predicate(key)]:
+                del self._flights[key]
+
+
+class DirEntries:
+    '''
+    Bulk alternative to returning a list of names or tuples from readdir and readdir_with_offset.
+    The entries are given as parallel sequences, e.g., names as a list of bytes, modes as array('I'),
+    and inodes as array('Q'), which FUSE feeds to libfuse in a tight loop without checking the type
+    of each entry. Only the file type bits of the modes and, with use_ino, the inodes are used.
+    Offsets are only used by readdir_with_offset.
+    '''
+
+    __slots__ = ('inos', 'modes', 'names', 'offsets')
+
+    def __init__(
+        self,
+        names: Sequence[Union[str, bytes]],
+        modes: Optional[Sequence[int]] = None,
+        inos: Optional[Sequence[int]] = None,
+        offsets: Optional[Sequence[int]] = None,
+    ) -> None:
+        for sequence in (modes, inos, offsets):
+            if sequence is not None and len(sequence) != len(names):
+                raise ValueError("All sequences must have the same length as the names.")
+        self.names = names
+        self.modes = modes
+        self.inos = inos
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_scandir(cls, entries: Iterable['os.DirEntry[str]'], with_dots: bool = False) -> 'DirEntries':
+        '''
+        Collects the names, file types, and inodes of os.scandir results. The file types and inodes are
+        taken from the directory entries and only require a stat call if the file system does not provide
+        them. os.scandir does not return '.' and '..', which can be prepended with with_dots.
+        '''
+        names: list[str] = ['.', '..'] if with_dots else []
+        modes = array.array('I', [S_IFDIR, S_IFDIR] if with_dots else [])
+        inos = array.array('Q', [0, 0] if with_dots else [])
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                mode = S_IFDIR
+            elif entry.is_file(follow_symlinks=False):
+                mode = S_IFREG
+            elif entry.is_symlink():
+                mode = S_IFLNK
+            else:
+                mode = S_IFMT(entry.stat(follow_symlinks=False).st_mode)
+            names.append(entry.name)
+            modes.append(mode)
+            inos.append(entry.inode())
+        return cls(names, modes, inos)
+
+
+class _PackedNames(Sequence[bytes]):
+    '''
+    Read-only sequence of names concatenated into one bytes object. Names are only sliced out when accessed,
+    so that replaying a listing does not have to split all of them up front.
+    '''
+
+    __slots__ = ('_names', '_offsets')
+
+    def __init__(self, names: bytes, offsets: array.array) -> None:
+        self._names = names
+        self._offsets = offsets  # Start of each name followed by the end of the last one.
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Name index out of range.")
+        return self._names[self._offsets[index] : self._offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[bytes]:
+        names = self._names
+        offsets = self._offsets
+        return (names[start:end] for start, end in zip(offsets, itertools.islice(offsets, 1, None)))
+
+
+class DirectoryCache:
+    '''
+    Thread-safe LRU cache for directory listings keyed by the encoded path and a version, e.g., an etag.
+    Each listing is stored compactly as one bytes object with the concatenated encoded names, an array of
+    the name offsets, and arrays of the modes and inodes. The least recently used listings are evicted when
+    they exceed max_bytes. A listing with another version replaces the cached one.
+    '''
+
+    def __init__(self, max_bytes: int = 64 << 20) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._listings: collections.OrderedDict[
+            bytes, tuple[Hashable, bytes, array.array, array.array, array.array]
+        ] = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(listing: tuple[Hashable, bytes, array.array, array.array, array.array]) -> int:
+        _version, names, *arrays = listing
+        return len(names) + sum(values.itemsize * len(values) for values in arrays)
+
+    def get(self, path: bytes, version: Hashable) -> Optional[DirEntries]:
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is None or listing[0] != version:
+                self.misses += 1
+                return None
+            self._listings.move_to_end(path)
+            self.hits += 1
+        _version, names, offsets, modes, inos = listing
+        return DirEntries(_PackedNames(names, offsets), modes, inos)
+
+    def put(self, path: bytes, version: Hashable, entries: DirEntries) -> None:
+        '''Inserts the listing. The names of entries must be bytes.'''
+        count = len(entries)
+        modes = array.array('I', itertools.repeat(0, count) if entries.modes is None else entries.modes)
+        inos = array.array('Q', itertools.repeat(0, count) if entries.inos is None else entries.inos)
+        offsets = array.array('Q', [0])
+        offsets.extend(itertools.accumulate(len(name) for name in entries.names))
+        listing = (version, b''.join(entries.names), offsets, modes, inos)  # type: ignore
+        size = self._size(listing)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_listing = self._listings.pop(path, None)
+            if old_listing is not None:
+                self.size -= self._size(old_listing)
+            self._listings[path] = listing
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _path, evicted_listing = self._listings.popitem(last=False)
+                self.size -= self._size(evicted_listing)
+                self.evictions += 1
+
+    def invalidate(self, path: bytes) -> None:
+        with self._lock:
+            listing = self._listings.pop(path, None)
+            if listing is not None:
+                self.size -= self._size(listing)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._listings.clear()
+            self.size = 0
+
+    def statistics(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'directories': len(self._listings),
+                'bytes': self.size,
+            }
+
+
+def _format_profiled_function(function: tuple[str, int, str]) -> str:
+    file_name, line, name = function
+    if file_name == '~' and line == 0:
+        return name.replace(';', ':')  # built-in functions
+    return f'{name} ({os.path.basename(file_name)}:{line})'.replace(';', ':')
+
+
+def _collapse_stacks(stats: dict, min_seconds: float = 1e-6, max_depth: int = 128) -> dict[str, float]:
+    '''
+    Converts pstats-like statistics into "collapsed stacks" as understood by flamegraph.pl and speedscope.
+    cProfile only records caller-callee pairs, not full call stacks. Therefore, the time of each function is
+    distributed onto all its call paths proportionally to the cumulative time spent in each caller.
+    '''
+    children: dict[tuple, list[tuple[tuple, float]]] = {}
+    for function, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            children.setdefault(caller, []).append((function, caller_stats[3]))
+
+    stacks: dict[str, float] = {}
+    todo: list[tuple[tuple[tuple[str, int, str], ...], float]] = [
+        ((function,), entry[3]) for function, entry in stats.items() if not entry[4]
+    ]
+    while todo:
+        path, seconds = todo.pop()
+        _cc, _nc, total_time, cumulative_time, _callers = stats[path[-1]]
+        if cumulative_time <= 0:
+            continue
+
+        scale = seconds / cumulative_time
+        stack = ';'.join(_format_profiled_function(function) for function in path)
+        stacks[stack] = stacks.get(stack, 0.0) + total_time * scale
+
+        if len(path) < max_depth:
+            for child, child_time in children.get(path[-1], []):
+                if child not in path and child_time * scale >= min_seconds:
+                    todo.append(((*path, child), child_time * scale))
+    return stacks
+
+
+class _ProfileSnapshot:
+    '''Adaptor for pstats.Stats, which would otherwise disable the profile by calling create_stats.'''
+
+    def __init__(self, profile) -> None:
+        self.profile = profile
+        self.stats: dict = {}
+
+    def create_stats(self) -> None:
+        self.profile.snapshot_stats()
+        self.stats = self.profile.stats
+
+
+class Profiler:
+    '''
+    Collects cProfile statistics for the FUSE callbacks, which are called from libfuse worker threads.
+
+    cProfile and sys.setprofile only trace the thread they were enabled in. Furthermore, ctypes discards the
+    Python thread state of foreign threads after each callback. Therefore, each callback is profiled separately
+    with a profiler that is created on the first call from a new (OS) thread and reused for subsequent calls
+    from the same thread. The statistics of all threads are merged when dumping.
+
+    On Python 3.12+, cProfile uses sys.monitoring, which only allows one active profiler per interpreter.
+    In that case, a single profiler is shared by all threads. Time spent in concurrently running callbacks
+    may then be attributed to each other. Mount with nothreads=True to get exact numbers.
+
+    Results are written to <output_prefix>.pstats, which can be analyzed with the pstats module or snakeviz,
+    and <output_prefix>.collapsed, which can be rendered with flamegraph.pl or speedscope.
+    '''
+
+    def __init__(self, output_prefix: Optional[str] = None) -> None:
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        self.output_prefix = output_prefix or f'mfusepy-profile-{os.getpid()}'
+        self._create_profile = cProfile.Profile
+        self._profiles: dict[int, Any] = {}
+        self._lock = threading.Lock()
+        # Only used for Python 3.12+, i.e., when the profiler is shared.
+        self._shared = sys.version_info >= (3, 12)
+        self._active_calls = 0
+
+    def call(self, func, *args, **kwargs):
+        if self._shared:
+            return self._call_shared(func, *args, **kwargs)
+
+        thread_id = threading.get_ident()
+        profile = self._profiles.get(thread_id)
+        if profile is None:
+            profile = self._create_profile()
+            with self._lock:
+                self._profiles[thread_id] = profile
+
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    def _call_shared(self, func, *args, **kwargs):
+        with self._lock:
+            if not self._profiles:
+                self._profiles[0] = self._create_profile()
+            if self._active_calls == 0:
+                self._profiles[0].enable()
+            self._active_calls += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active_calls -= 1
+                if self._active_calls == 0:
+                    self._profiles[0].disable()
+
+    def stats(self):
+        '''Returns a pstats.Stats object with the merged statistics of all profiled threads.'''
+        import pstats  # pylint: disable=import-outside-toplevel
+
+        with self._lock:
+            snapshots = [_ProfileSnapshot(profile) for profile in self._profiles.values()]
+        return pstats.Stats(*snapshots)
+
+    def dump(self, output_prefix: Optional[str] = None) -> None:
+        prefix = output_prefix or self.output_prefix
+        stats = self.stats()
+        stats.dump_stats(prefix + '.pstats')
+
+        stacks = _collapse_stacks(stats.stats)
+        with open(prefix + '.collapsed', 'w', encoding='utf-8') as file:
+            for stack, seconds in sorted(stacks.items()):
+                if round(seconds * 1e6) > 0:
+                    file.write(f'{stack} {round(seconds * 1e6)}\n')
+
+        log.info("Wrote profile of %d thread(s) to %s.pstats and %s.collapsed", len(self._profiles), prefix, prefix)
+
+    def dump_on_signal(self):
+        '''
+        Starts a thread that dumps the statistics each time SIGUSR1 is received.
+        Returns a function, which stops the thread, or None if the platform does not support it.
+
+        Python signal handlers only run in the main thread, which is blocked inside libfuse while mounted.
+        Instead, SIGUSR1 is blocked and waited for with sigwait in a separate thread. This must be called
+        before the libfuse worker threads are started so that they inherit the signal mask.
+        '''
+        import signal as signals  # pylint: disable=import-outside-toplevel
+
+        if not all(hasattr(signals, name) for name in ('SIGUSR1', 'pthread_sigmask', 'sigwait', 'pthread_kill')):
+            return None
+        if threading.current_thread() is not threading.main_thread():
+            return None
+
+        old_mask = signals.pthread_sigmask(signals.SIG_BLOCK, {signals.SIGUSR1})
+        stop = threading.Event()
+
+        def dump():
+            try:
+                self.dump()
+            except Exception:
+                log.exception("Failed to dump the profile.")
+
+        def wait_for_signals():
+            while signals.sigwait({signals.SIGUSR1}) and not stop.is_set():
+                dump()
+
+        thread = threading.Thread(target=wait_for_signals, name='mfusepy-profiler', daemon=True)
+        thread.start()
+
+        def stop_waiting():
+            stop.set()
+            signals.pthread_kill(thread.ident, signals.SIGUSR1)
+            thread.join()
+            signals.pthread_sigmask(signals.SIG_SETMASK, old_mask)
+
+        return stop_waiting
+
 
 # See fuse_lib_opts in fuse.c
 _LIBFUSE_2_OPTIONS_REMOVED_IN_FUSE_3 = {"-h", "--help"}
@@ -1328,6 +2174,18 @@ class FUSE:
         ('nothreads', '-s'),
     )
 
+    _XATTR_PROBE_TIMEOUT = 1.0  # seconds
+
+    # Callbacks, which may change the results of getattr or read, and whether they only change their first argument
+    # path. With coalesce_requests, in-flight getattr and read calls are not joined anymore after them.
+    # fmt: off
+    _MODIFYING_CALLBACKS = {
+        **dict.fromkeys(('write', 'write_buf', 'truncate', 'ftruncate', 'fallocate', 'chmod', 'chown', 'utimens',
+                         'utime', 'unlink', 'rmdir', 'mknod', 'mkdir', 'create'), True),
+        **dict.fromkeys(('rename', 'link', 'symlink', 'copy_file_range'), False),
+    }
+    # fmt: on
+
     def __init__(
         self,
         operations,
@@ -1335,6 +2193,11 @@ class FUSE:
         raw_fi: bool = False,
         encoding: str = 'utf-8',
         errors: str = 'surrogateescape',
+        profile: Union[bool, str, Profiler] = False,
+        statistics: Optional[CallbackStatistics] = None,
+        error_log_limiter: Optional[ErrorLogRateLimiter] = None,
+        process_pool: int = 0,
+        interpreter_pool: bool = False,
         **kwargs,
     ) -> None:
         '''
@@ -1342,13 +2205,102 @@ class FUSE:
         class as is to Operations, instead of just the fh field.
 
         This gives you access to direct_io, keep_cache, etc.
+
+        Setting profile to True, to an output path prefix, or to a Profiler object
+        will profile all callbacks. The statistics are written on unmount and on SIGUSR1.
+
+        Errors returned by callbacks are counted in statistics. Their log output is rate-limited
+        per operation and errno with error_log_limiter, which defaults to ErrorLogRateLimiter().
+
+        Setting process_pool to a number of worker processes will run the methods of the operations
+        decorated with offload in a ProcessPool, which is shut down on unmount.
+
+        Setting interpreter_pool to True will instead run them in an InterpreterPool, i.e., in one subinterpreter
+        with its own GIL per libfuse thread. If subinterpreters are not supported, i.e., before Python 3.13,
+        a warning is shown and the process_pool is used if set, else the methods are called directly.
         '''
 
+        self._initialize(
+            operations,
+            raw_fi,
+            encoding,
+            errors,
+            profile,
+            statistics,
+            error_log_limiter,
+            process_pool,
+            interpreter_pool,
+            kwargs,
+        )
+
+        args = ['fuse']
+
+        args.extend(flag for arg, flag in self.OPTIONS if kwargs.pop(arg, False))
+
+        kwargs.setdefault('fsname', self.operations.__class__.__name__)
+        args.extend(('-o', ','.join(self._normalize_fuse_options(**kwargs)), mountpoint))
+
+        argsb = [arg.encode(encoding, self.errors) for arg in args]
+        argv = (ctypes.c_char_p * len(argsb))(*argsb)
+
+        fuse_ops = self._create_fuse_operations()
+
+        try:
+            old_handler = signal(SIGINT, SIG_DFL)
+        except ValueError:
+            old_handler = SIG_DFL
+
+        stop_profile_dumper = None if self._profiler is None else self._profiler.dump_on_signal()
+
+        err = fuse_main_real(len(argsb), argv, ctypes.pointer(fuse_ops), ctypes.sizeof(fuse_ops), None)
+
+        try:
+            signal(SIGINT, old_handler)
+        except ValueError:
+            pass
+
+        self.error_log_limiter.flush()
+        self._shutdown_process_pool()
+        if stop_profile_dumper is not None:
+            stop_profile_dumper()
+        if self._profiler is not None:
+            self._profiler.dump()
+
+        del self.operations  # Invoke the destructor
+        if self._critical_exception:
+            raise self._critical_exception
+        if err:
+            raise RuntimeError(err)
+
+    def _initialize(
+        self,
+        operations,
+        raw_fi: bool,
+        encoding: str,
+        errors: str,
+        profile: Union[bool, str, Profiler],
+        statistics: Optional[CallbackStatistics],
+        error_log_limiter: Optional[ErrorLogRateLimiter],
+        process_pool: int,
+        interpreter_pool: bool,
+        options: dict[str, Any],
+    ) -> None:
         self.operations = operations
         self.raw_fi = raw_fi
         self.encoding = encoding
         self.errors = errors
-        self.__critical_exception = None
+        self._critical_exception = None
+
+        self.statistics = CallbackStatistics() if statistics is None else statistics
+        self.error_log_limiter = ErrorLogRateLimiter() if error_log_limiter is None else error_log_limiter
+
+        self._profiler: Optional[Profiler] = None
+        if isinstance(profile, Profiler):
+            self._profiler = profile
+        elif isinstance(profile, str):
+            self._profiler = Profiler(profile)
+        elif profile:
+            self._profiler = Profiler()
 
         self.use_ns = getattr(self.operations, 'use_ns', False)
         if not self.use_ns:
@@ -1357,7 +2309,7 @@ class FUSE:
                 'To enable time as nanoseconds set the property "use_ns" to '
                 'True in your operations class or set your fusepy requirements to <4.',
                 DeprecationWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
 
         if callable(self.operations):
@@ -1365,22 +2317,71 @@ class FUSE:
                 "The call operator on the Operations object is ignored since mfusepy 3.0!"
                 "Use decorators to wrap methods or if really necessary overwrite __getattribute__ instead.",
                 DeprecationWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
 
-        args = ['fuse']
-
-        args.extend(flag for arg, flag in self.OPTIONS if kwargs.pop(arg, False))
-
-        kwargs.setdefault('fsname', self.operations.__class__.__name__)
-        args.extend(('-o', ','.join(self._normalize_fuse_options(**kwargs)), mountpoint))
         self._libfuse2_options_moved_into_libfuse3_config = {
-            key: value for key, value in kwargs.items() if key in _LIBFUSE_2_OPTIONS_MOVED_INTO_FUSE_3_CONFIG
+            key: value for key, value in options.items() if key in _LIBFUSE_2_OPTIONS_MOVED_INTO_FUSE_3_CONFIG
         }
 
-        argsb = [arg.encode(encoding, self.errors) for arg in args]
-        argv = (ctypes.c_char_p * len(argsb))(*argsb)
-
+        # Determine which variants of the callbacks are implemented once instead of in each callback.
+        self._use_readdir_with_offset = _is_implemented(self.operations, 'readdir_with_offset')
+        if _system == 'OpenBSD' and getattr(getattr(self.operations, 'readdir', None), 'libfuse_ignore', False):
+            # OpenBSD (FUSE 2.6) does not support readdir_with_offset with arbitrary offsets.
+            # It seems to call readdir_with_offset with offsets like 0, 4096, etc., which is
+            # not compatible with our example fs implementations.
+            self._use_readdir_with_offset = False
+        self._use_init_with_config = _is_implemented(self.operations, 'init_with_config')
+        self._use_init = _is_implemented(self.operations, 'init')
+        self._nullpath_ok = bool(
+            getattr(self.operations, 'flag_nopath', False) and getattr(self.operations, 'flag_nullpath_ok', False)
+        )
+        self.use_object_handles = bool(getattr(self.operations, 'use_object_handles', False))
+        self.handles = HandleTable()
+        self.use_passthrough = bool(getattr(self.operations, 'use_passthrough', False))
+        # Set in init if the kernel supports passthrough. Backing files can only be opened if it is available.
+        self._passthrough_device_fd: Optional[int] = None
+        self._passthrough_available = False
+        self.coalesce_requests = bool(getattr(self.operations, 'coalesce_requests', False))
+        self._single_flight = SingleFlight()
+        # Keyed by the OS thread ID because ctypes discards the Python thread state of libfuse threads
+        # after each callback, so threading.local would not survive until the next xattr call.
+        self._xattr_probes: dict[int, tuple] = {}
+        # Incremented after each modification so that size probes of other threads are not used afterward.
+        self._xattr_generation = 0
+        directory_cache_size = getattr(self.operations, 'directory_cache_size', 0)
+        self.directory_cache = DirectoryCache(directory_cache_size) if directory_cache_size > 0 else None
+        self._process_pool: Optional[Union[ProcessPool, InterpreterPool]] = None
+        if interpreter_pool and not InterpreterPool.is_supported():
+            warnings.warn(
+                'Subinterpreters with their own GIL require Python 3.13 or newer! '
+                + ('Using the process pool instead.' if process_pool > 0 else 'Offloaded methods are called directly.'),
+                RuntimeWarning,
+                stacklevel=3,
+            )
+            interpreter_pool = False
+        if interpreter_pool:
+            self._process_pool = InterpreterPool(self.operations)
+        elif process_pool > 0:
+            self._process_pool = ProcessPool(self.operations, process_pool)
+        if self._process_pool is not None:
+            self.operations.process_pool = self._process_pool
+
+        self._create_takes_flags = True
+        if not self.raw_fi and _is_implemented(self.operations, 'create'):
+            import inspect  # pylint: disable=import-outside-toplevel
+
+            with contextlib.suppress(TypeError, ValueError):
+                self._create_takes_flags = len(inspect.signature(self.operations.create).parameters) != 2
+
+    def _shutdown_process_pool(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+            self.operations.process_pool = None
+
+    def _create_fuse_operations(self) -> fuse_operations:
+        '''Returns the libfuse operations struct with wrappers for all callbacks implemented by the operations.'''
         alternative_callbacks = {
             "readdir": ["readdir_with_offset"],
         }
@@ -1388,6 +2389,12 @@ class FUSE:
         # Iterate over all libfuse operations struct methods and check for user-implemented ones in self.operations.
         fuse_ops = fuse_operations()
         callbacks_to_always_add = {'init'}
+        if self.use_object_handles:
+            # Required to free the handles.
+            callbacks_to_always_add.update(('release', 'releasedir'))
+        if self.use_passthrough:
+            # Required to close the backing files.
+            callbacks_to_always_add.add('release')
         for field in fuse_operations._fields_:
             name, prototype = field[:2]
             is_function = hasattr(prototype, 'argtypes')
@@ -1431,30 +2438,18 @@ class FUSE:
                     if method is None:
                         raise RuntimeError(f"Internal Error: Method wrapper for FUSE callback '{name}' is missing!")
 
+                if self.coalesce_requests and name in self._MODIFYING_CALLBACKS:
+                    method = self._detaching_coalesced(method, self._MODIFYING_CALLBACKS[name])
+
                 log.debug("Set libFUSE callback for '%s' to wrapped %s wrapping %s", name, method, value)
-                value = prototype(functools.partial(self._wrapper, method))
+                wrapper = self._wrapper if self._profiler is None else self._profiled_wrapper
+                value = prototype(functools.partial(wrapper, method))
             else:
                 log.debug("Set libFUSE value for '%s' to %s", name, value)
 
             setattr(fuse_ops, name, value)
 
-        try:
-            old_handler = signal(SIGINT, SIG_DFL)
-        except ValueError:
-            old_handler = SIG_DFL
-
-        err = fuse_main_real(len(argsb), argv, ctypes.pointer(fuse_ops), ctypes.sizeof(fuse_ops), None)
-
-        try:
-            signal(SIGINT, old_handler)
-        except ValueError:
-            pass
-
-        del self.operations  # Invoke the destructor
-        if self.__critical_exception:
-            raise self.__critical_exception
-        if err:
-            raise RuntimeError(err)
+        return fuse_ops
 
     @staticmethod
     def _normalize_fuse_options(**kargs):
@@ -1490,39 +2485,19 @@ class FUSE:
                 if func.__name__ == "init":
                     raise e
                 if isinstance(e.errno, int) and e.errno > 0:
-                    is_valid_exception = (func.__name__.startswith("getattr") and e.errno == errno.ENOENT) or (
-                        func.__name__ == "getxattr" and e.errno == ENOATTR
-                    )
-
-                    error_string = ""
-                    with contextlib.suppress(ValueError):
-                        error_string = os.strerror(e.errno)
-
-                    log.debug(
-                        "FUSE operation %s (%s) raised a %s, returning errno %s (%s).",
-                        func.__name__,
-                        args,
-                        type(e),
-                        e.errno,
-                        error_string,
-                        exc_info=not is_valid_exception,
-                    )
+                    self._log_error(func, args, e.errno, e, logging.DEBUG)
                     return -e.errno
-                log.exception(
-                    "FUSE operation %s raised an OSError with negative errno %s, returning errno.EINVAL.",
-                    func.__name__,
-                    e.errno,
-                )
+                self._log_error(func, args, errno.EINVAL, e, logging.ERROR)
                 return -errno.EINVAL
 
             except Exception as e:
                 if func.__name__ == "init":
                     raise e
-                log.exception("Uncaught exception from FUSE operation %s, returning errno.EINVAL.", func.__name__)
+                self._log_error(func, args, errno.EINVAL, e, logging.ERROR)
                 return -errno.EINVAL
 
         except BaseException as e:
-            self.__critical_exception = e
+            self._critical_exception = e
             log.critical(
                 "Uncaught critical exception from FUSE operation %s, aborting.",
                 func.__name__,
@@ -1533,6 +2508,52 @@ class FUSE:
             fuse_exit()
             return -errno.EFAULT
 
+    def _log_error(self, func, args, error_number: int, exception: BaseException, level: int) -> None:
+        operation = func.__name__.removesuffix('_fuse_2').removesuffix('_fuse_3')
+        self.statistics.record_error(operation, error_number)
+
+        # Avoid formatting arguments and tracebacks for errors that would not be logged anyway.
+        if not log.isEnabledFor(level) or not self.error_log_limiter.allow(operation, error_number, level):
+            return
+
+        if level <= logging.DEBUG:
+            is_valid_exception = (operation == "getattr" and error_number == errno.ENOENT) or (
+                operation == "getxattr" and error_number == ENOATTR
+            )
+
+            error_string = ""
+            with contextlib.suppress(ValueError):
+                error_string = os.strerror(error_number)
+
+            log.log(
+                level,
+                "FUSE operation %s (%s) raised a %s, returning errno %s (%s).",
+                func.__name__,
+                args,
+                type(exception),
+                error_number,
+                error_string,
+                exc_info=not is_valid_exception,
+            )
+        elif isinstance(exception, OSError):
+            log.log(
+                level,
+                "FUSE operation %s raised an OSError with negative errno %s, returning errno.EINVAL.",
+                func.__name__,
+                exception.errno,
+                exc_info=True,
+            )
+        else:
+            log.log(
+                level,
+                "Uncaught exception from FUSE operation %s, returning errno.EINVAL.",
+                func.__name__,
+                exc_info=True,
+            )
+
+    def _profiled_wrapper(self, func, *args, **kwargs):
+        return self._profiler.call(self._wrapper, func, *args, **kwargs)  # type: ignore[union-attr]
+
     def getattr_fuse_2(self, path: bytes, buf: c_stat_p):
         return self.fgetattr(path, buf, None)
 
@@ -1544,8 +2565,9 @@ class FUSE:
 
         # copies a string into the given buffer
         # (null terminated and truncated if necessary)
-        data = ctypes.create_string_buffer(ret[: bufsize - 1])
-        ctypes.memmove(buf, data, len(data))
+        size = min(len(ret), bufsize - 1)
+        ctypes.memmove(buf, ret, size)
+        buf[size] = 0
         return 0
 
     def mknod(self, path: bytes, mode: int, dev: int) -> int:
@@ -1555,10 +2577,16 @@ class FUSE:
         return self.operations.mkdir(path.decode(self.encoding, self.errors), mode)
 
     def unlink(self, path: bytes) -> int:
-        return self.operations.unlink(path.decode(self.encoding, self.errors))
+        try:
+            return self.operations.unlink(path.decode(self.encoding, self.errors))
+        finally:
+            self._xattr_generation += 1
 
     def rmdir(self, path: bytes) -> int:
-        return self.operations.rmdir(path.decode(self.encoding, self.errors))
+        try:
+            return self.operations.rmdir(path.decode(self.encoding, self.errors))
+        finally:
+            self._xattr_generation += 1
 
     def symlink(self, source: bytes, target: bytes) -> int:
         'creates a symlink `target -> source` (e.g. ln -s source target)'
@@ -1568,7 +2596,12 @@ class FUSE:
         )
 
     def rename_fuse_2(self, old: bytes, new: bytes) -> int:
-        return self.operations.rename(old.decode(self.encoding, self.errors), new.decode(self.encoding, self.errors))
+        try:
+            return self.operations.rename(
+                old.decode(self.encoding, self.errors), new.decode(self.encoding, self.errors)
+            )
+        finally:
+            self._xattr_generation += 1
 
     def rename_fuse_3(self, old: bytes, new: bytes, flags: int) -> int:
         return self.rename_fuse_2(old, new)
@@ -1607,16 +2640,116 @@ class FUSE:
     def truncate_fuse_3(self, path: Optional[bytes], length: int, fip: fuse_fi_p) -> int:
         return self.operations.truncate(None if path is None else path.decode(self.encoding, self.errors), length)
 
+    # With use_object_handles, the values returned by open, create, and opendir are stored in self.handles,
+    # and fh only contains the integer handle. fh is 0 if open was not called, e.g., because it is not implemented.
+    def _set_handle(self, fi: fuse_file_info, value: Any) -> None:
+        fi.fh = self.handles.add(value) if self.use_object_handles else value
+
+    def _get_directory_handle(self, fip: fuse_fi_p) -> Any:
+        fh = fip.contents.fh
+        if self.use_object_handles:
+            return self.handles.get(fh) if fh else None
+        return fh
+
+    def _get_file_handle(self, fip: fuse_fi_p) -> Any:
+        if self.raw_fi:
+            return fip.contents
+        fh = fip.contents.fh
+        if self.use_object_handles:
+            return self.handles.get(fh) if fh else None
+        return fh
+
+    def _free_handle(self, fi: fuse_file_info) -> None:
+        if fi.fh:
+            self.handles.remove(fi.fh)
+            fi.fh = 0
+
+    def _detaching_coalesced(self, method, by_path: bool):
+        '''
+        Returns a wrapper for a modifying callback, after which new getattr and read calls must not join coalesced
+        calls that started before the modification. If by_path is False, or the path is None, all in-flight calls
+        are detached because the callback might modify other paths than its first argument.
+        '''
+        single_flight = self._single_flight
+
+        @functools.wraps(method)
+        def detaching(path, *args):
+            try:
+                return method(path, *args)
+            finally:
+                if by_path and path is not None:
+                    single_flight.detach(lambda key: key[1] == path)
+                else:
+                    single_flight.detach(lambda key: True)
+
+        return detaching
+
+    def _coalesced(self, operation: str, function, path: bytes, args: tuple, fh: Any) -> Any:
+        '''
+        Calls function(path, *args, fh) or waits for an identical in-flight call and shares its result.
+        The file handle is not part of the key so that concurrent readers of the same file are coalesced.
+        '''
+        result, shared = self._single_flight.call(
+            (operation, path, *args), function, path.decode(self.encoding, self.errors), *args, fh
+        )
+        if shared:
+            self.statistics.increment(f'coalesced_{operation}')
+        return result
+
+    def _open_backing_file(self, fi: fuse_file_info, fd: int) -> None:
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        assert self._passthrough_device_fd is not None
+        try:
+            fi.backing_id = fcntl.ioctl(
+                self._passthrough_device_fd, _FUSE_DEV_IOC_BACKING_OPEN, bytearray(_fuse_backing_map.pack(fd, 0, 0))
+            )
+        except OSError as exception:
+            if exception.errno in (errno.EPERM, errno.ENOTTY):
+                # Opening backing files requires CAP_SYS_ADMIN. Do not try again for each file.
+                log.warning("Kernel passthrough is not permitted, falling back to read and write: %s", exception)
+                self._passthrough_available = False
+            else:
+                log.debug("Failed to set up kernel passthrough for fd %s: %s", fd, exception)
+
+    def _close_backing_file(self, fi: fuse_file_info) -> None:
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        assert self._passthrough_device_fd is not None
+        try:
+            fcntl.ioctl(self._passthrough_device_fd, _FUSE_DEV_IOC_BACKING_CLOSE, struct.pack('=I', fi.backing_id))
+        except OSError as exception:
+            log.debug("Failed to close backing file %s: %s", fi.backing_id, exception)
+        fi.backing_id = 0
+
+    def _set_open_result(self, fi: fuse_file_info, result: Any) -> None:
+        if isinstance(result, OpenResult):
+            if result.passthrough_fd is not None and self._passthrough_available:
+                self._open_backing_file(fi, result.passthrough_fd)
+            if self.raw_fi:
+                return
+            result = result.fh
+        self._set_handle(fi, result)
+
     def open(self, path: bytes, fip) -> int:
         fi = fip.contents
         if self.raw_fi:
-            return self.operations.open(path.decode(self.encoding, self.errors), fi)
-        fi.fh = self.operations.open(path.decode(self.encoding, self.errors), fi.flags)
+            result = self.operations.open(path.decode(self.encoding, self.errors), fi)
+            if not isinstance(result, OpenResult):
+                return result
+            self._set_open_result(fi, result)
+            return 0
+        self._set_open_result(fi, self.operations.open(path.decode(self.encoding, self.errors), fi.flags))
         return 0
 
     def read(self, path: Optional[bytes], buf, size: int, offset: int, fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
-        ret = self.operations.read(None if path is None else path.decode(self.encoding, self.errors), size, offset, fh)
+        fh = self._get_file_handle(fip)
+        if self.coalesce_requests and path is not None:
+            ret = self._coalesced('read', self.operations.read, path, (size, offset), fh)
+        else:
+            ret = self.operations.read(
+                None if path is None else path.decode(self.encoding, self.errors), size, offset, fh
+            )
 
         if not ret:
             return 0
@@ -1624,12 +2757,19 @@ class FUSE:
         retsize = len(ret)
         assert retsize <= size, f'actual amount read {retsize} greater than expected {size}'
 
-        ctypes.memmove(buf, ret, retsize)
+        if isinstance(ret, bytes):
+            ctypes.memmove(buf, ret, retsize)
+        else:
+            # Writable buffers, e.g., memoryviews of an mmap, are copied without an intermediate bytes object.
+            try:
+                ctypes.memmove(buf, (ctypes.c_char * retsize).from_buffer(ret), retsize)
+            except TypeError:
+                ctypes.memmove(buf, bytes(ret), retsize)
         return retsize
 
     def write(self, path: Optional[bytes], buf: c_byte_p, size: int, offset: int, fip: fuse_fi_p) -> int:
         data = ctypes.string_at(buf, size)
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.write(
             None if path is None else path.decode(self.encoding, self.errors), data, offset, fh
         )
@@ -1644,31 +2784,70 @@ class FUSE:
         return 0
 
     def flush(self, path: Optional[bytes], fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.flush(None if path is None else path.decode(self.encoding, self.errors), fh)
 
     def release(self, path: Optional[bytes], fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
-        return self.operations.release(None if path is None else path.decode(self.encoding, self.errors), fh)
+        fh = self._get_file_handle(fip)
+        try:
+            return self.operations.release(None if path is None else path.decode(self.encoding, self.errors), fh)
+        finally:
+            if self.use_object_handles and not self.raw_fi:
+                self._free_handle(fip.contents)
+            if self._passthrough_device_fd is not None and fip.contents.backing_id > 0:
+                self._close_backing_file(fip.contents)
 
     def fsync(self, path: Optional[bytes], datasync: int, fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.fsync(None if path is None else path.decode(self.encoding, self.errors), datasync, fh)
 
     def setxattr(self, path: bytes, name: bytes, value: c_byte_p, size: int, options: int, *args) -> int:
-        return self.operations.setxattr(
+        try:
+            return self.operations.setxattr(
+                path.decode(self.encoding, self.errors),
+                name.decode(self.encoding, self.errors),
+                ctypes.string_at(value, size),
+                options,
+                *args,
+            )
+        finally:
+            self._xattr_generation += 1
+
+    def _probed_xattr(self, key: tuple, buffer: c_byte_p, function, *args) -> bytes:
+        '''
+        Callers usually query the size of an xattr value or list with a NULL buffer first and then fetch it
+        with a large enough buffer. The result of the size query is kept per thread for the following fetch
+        so that the filesystem is called only once. Because the fetch may be processed by another thread,
+        the kept result is discarded by the next xattr call in this thread or after _XATTR_PROBE_TIMEOUT seconds.
+        Kept results of all threads are also discarded by setxattr, removexattr, unlink, rmdir, and rename.
+        '''
+        thread = threading.get_ident()
+        generation = self._xattr_generation
+        probe = self._xattr_probes.pop(thread, None)
+        if probe is not None:
+            if (
+                buffer
+                and probe[0] == key
+                and probe[3] == generation
+                and time.monotonic() - probe[1] < self._XATTR_PROBE_TIMEOUT
+            ):
+                return probe[2]
+
+        result = function(*args)
+        if not buffer:
+            self._xattr_probes[thread] = (key, time.monotonic(), result, generation)
+        return result
+
+    def getxattr(self, path: bytes, name: bytes, value: c_byte_p, size: int, *args) -> int:
+        ret = self._probed_xattr(
+            (path, name, *args),
+            value,
+            self.operations.getxattr,
             path.decode(self.encoding, self.errors),
             name.decode(self.encoding, self.errors),
-            ctypes.string_at(value, size),
-            options,
             *args,
         )
 
-    def getxattr(self, path: bytes, name: bytes, value: c_byte_p, size: int, *args) -> int:
-        ret = self.operations.getxattr(
-            path.decode(self.encoding, self.errors), name.decode(self.encoding, self.errors), *args
-        )
-
         retsize = len(ret)
         # allow size queries
         if not value:
@@ -1679,16 +2858,19 @@ class FUSE:
             return -errno.ERANGE
 
         # Does not add trailing 0
-        buf = ctypes.create_string_buffer(ret, retsize)
-        ctypes.memmove(value, buf, retsize)
+        ctypes.memmove(value, ret, retsize)
 
         return retsize
 
-    def listxattr(self, path: bytes, namebuf: c_byte_p, size: int) -> int:
+    def _listxattr(self, path: bytes) -> bytes:
         attrs = self.operations.listxattr(path.decode(self.encoding, self.errors)) or ''
         ret = '\x00'.join(attrs).encode(self.encoding, self.errors)
         if len(ret) > 0:
             ret += '\x00'.encode(self.encoding, self.errors)
+        return ret
+
+    def listxattr(self, path: bytes, namebuf: c_byte_p, size: int) -> int:
+        ret = self._probed_xattr((path,), namebuf, self._listxattr, path)
 
         retsize = len(ret)
         # allow size queries
@@ -1699,19 +2881,21 @@ class FUSE:
         if retsize > size:
             return -errno.ERANGE
 
-        buf = ctypes.create_string_buffer(ret, retsize)
-        ctypes.memmove(namebuf, buf, retsize)
+        ctypes.memmove(namebuf, ret, retsize)
 
         return retsize
 
     def removexattr(self, path: bytes, name: bytes) -> int:
-        return self.operations.removexattr(
-            path.decode(self.encoding, self.errors), name.decode(self.encoding, self.errors)
-        )
+        try:
+            return self.operations.removexattr(
+                path.decode(self.encoding, self.errors), name.decode(self.encoding, self.errors)
+            )
+        finally:
+            self._xattr_generation += 1
 
     def opendir(self, path: bytes, fip: fuse_fi_p) -> int:
         # Ignore raw_fi
-        fip.contents.fh = self.operations.opendir(path.decode(self.encoding, self.errors))
+        self._set_handle(fip.contents, self.operations.opendir(path.decode(self.encoding, self.errors)))
         return 0
 
     # == About readdir and what should be returned ==
@@ -1784,25 +2968,65 @@ class FUSE:
     #     fuse.h#L263C1-L280C3
     def _readdir(self, path: Optional[bytes], buf, filler, offset: int, fip: fuse_fi_p) -> int:
         # Ignore raw_fi
-        st = c_stat()
-
         decoded_path = None if path is None else path.decode(self.encoding, self.errors)
-        use_readdir_with_offset = hasattr(self.operations, "readdir_with_offset") and not getattr(
-            self.operations.readdir_with_offset, "libfuse_ignore", False
-        )
-        if _system == 'OpenBSD' and getattr(getattr(self.operations, "readdir", None), "libfuse_ignore", False):
-            # OpenBSD (FUSE 2.6) does not support readdir_with_offset with arbitrary offsets.
-            # It seems to call readdir_with_offset with offsets like 0, 4096, etc., which is
-            # not compatible with our example fs implementations.
-            use_readdir_with_offset = False
-        items = (
-            self.operations.readdir_with_offset(decoded_path, offset, fip.contents.fh)
-            if use_readdir_with_offset
-            else self.operations.readdir(decoded_path, fip.contents.fh)
-        )
+        fh = self._get_directory_handle(fip)
+        if self._use_readdir_with_offset:
+            self._fill_directory(self.operations.readdir_with_offset(decoded_path, offset, fh), buf, filler)
+            return 0
+
+        cache = self.directory_cache
+        if cache is not None and path is not None:
+            version = self.operations.directory_version(decoded_path)
+            if version is not None:
+                entries = cache.get(path, version)
+                if entries is None:
+                    entries = self._read_directory_snapshot(decoded_path, fh)
+                    cache.put(path, version, entries)
+                self._fill_dir_entries(entries, buf, filler)
+                return 0
+
+        self._fill_directory(self.operations.readdir(decoded_path, fh), buf, filler)
+        return 0
 
+    def _read_directory_snapshot(self, path: Optional[str], fh: Any) -> DirEntries:
+        '''Returns the result of readdir as DirEntries with encoded names as they would be passed to the filler.'''
+        names: list[bytes] = []
+        modes = array.array('I')
+        inos = array.array('Q')
+
+        def collect(buffer, name, stbuf, offset, *flags):
+            names.append(name)
+            if stbuf:
+                modes.append(stbuf.contents.st_mode)
+                inos.append(stbuf.contents.st_ino)
+            else:
+                modes.append(0)
+                inos.append(0)
+            return 0
+
+        prototypes: dict[str, Any] = {field[0]: field[1] for field in fuse_operations._fields_}
+        filler = prototypes['readdir']._argtypes_[2](collect)
+        self._fill_directory(self.operations.readdir(path, fh), None, filler)
+        return DirEntries(names, modes, inos)
+
+    def _fill_directory(self, items, buf, filler) -> None:
+        if isinstance(items, DirEntries):
+            self._fill_dir_entries(items, buf, filler)
+            return
+
+        # Only the first item is checked for os.scandir results to keep the type checks out of the loop.
+        iterator = iter(items)
+        first = next(iterator, None)
+        if first is None:
+            return
+        if isinstance(first, os.DirEntry):
+            self._fill_dir_entries(DirEntries.from_scandir(itertools.chain((first,), iterator)), buf, filler)
+            return
+
+        use_readdir_with_offset = self._use_readdir_with_offset
+        st = c_stat()
         encountered_non_zero_offset = False
-        for item in items:
+        for item in itertools.chain((first,), iterator):
             has_stat = False
             if isinstance(item, str):
                 has_stat = True
@@ -1837,7 +3061,33 @@ class FUSE:
         if encountered_non_zero_offset and not use_readdir_with_offset:
             log.warning("When returning non-zero offsets from readdir, you should use readdir_with_offset instead.")
 
-        return 0
+    def _fill_dir_entries(self, entries: DirEntries, buf, filler) -> None:
+        use_readdir_with_offset = self._use_readdir_with_offset
+        if entries.offsets is not None and not use_readdir_with_offset and any(entries.offsets):
+            log.warning("When returning non-zero offsets from readdir, you should use readdir_with_offset instead.")
+        offsets = entries.offsets if entries.offsets is not None and use_readdir_with_offset else itertools.repeat(0)
+
+        names = entries.names
+        if names and isinstance(names[0], str):
+            names = [name.encode(self.encoding, self.errors) for name in names]  # type: ignore
+        flags = () if fuse_version_major == 2 else (0,)
+
+        if entries.modes is None and entries.inos is None:
+            for name, offset in zip(names, offsets):
+                if filler(buf, name, None, offset, *flags) != 0:
+                    break
+            return
+
+        # The filler copies the stat struct, so it can be reused for all entries.
+        st = c_stat()
+        st_ref = ctypes.byref(st)
+        modes = itertools.repeat(0) if entries.modes is None else entries.modes
+        inos = itertools.repeat(0) if entries.inos is None else entries.inos
+        for name, mode, ino, offset in zip(names, modes, inos, offsets):
+            st.st_mode = mode
+            st.st_ino = ino
+            if filler(buf, name, st_ref, offset, *flags) != 0:
+                break
 
     def readdir_fuse_2(self, path: Optional[bytes], buf, filler, offset: int, fip: fuse_fi_p) -> int:
         return self._readdir(path, buf, filler, offset, fip)
@@ -1850,31 +3100,46 @@ class FUSE:
 
     def releasedir(self, path: Optional[bytes], fip: fuse_fi_p) -> int:
         # Ignore raw_fi
-        return self.operations.releasedir(
-            None if path is None else path.decode(self.encoding, self.errors), fip.contents.fh
-        )
+        try:
+            return self.operations.releasedir(
+                None if path is None else path.decode(self.encoding, self.errors), self._get_directory_handle(fip)
+            )
+        finally:
+            if self.use_object_handles:
+                self._free_handle(fip.contents)
 
     def fsyncdir(self, path: Optional[bytes], datasync: int, fip: fuse_fi_p) -> int:
         # Ignore raw_fi
         return self.operations.fsyncdir(
-            None if path is None else path.decode(self.encoding, self.errors), datasync, fip.contents.fh
+            None if path is None else path.decode(self.encoding, self.errors), datasync, self._get_directory_handle(fip)
         )
 
     def _init(self, conn: FuseConnInfoPointer, config: Optional[FuseConfigPointer]) -> None:
-        if hasattr(self.operations, "init_with_config") and not getattr(
-            self.operations.init_with_config, "libfuse_ignore", False
-        ):
+        if self._use_init_with_config:
             self.operations.init_with_config(
                 None if conn is None else conn.contents, None if config is None else config.contents
             )
-        elif hasattr(self.operations, "init") and not getattr(self.operations.init, "libfuse_ignore", False):
+        elif self._use_init:
             self.operations.init("/")
 
     def init_fuse_2(self, conn: FuseConnInfoPointer) -> None:
         self._init(conn, None)
 
+    def _negotiate_passthrough(self, conn: fuse_conn_info) -> None:
+        if not _has_passthrough:
+            log.info("Kernel passthrough requires libfuse 3.17 or newer on Linux.")
+        elif not conn.capable & FUSE_CAP_PASSTHROUGH:
+            log.info("Kernel passthrough is not supported by the kernel.")
+        else:
+            self._passthrough_device_fd = _fuse_device_fd()
+            if self._passthrough_device_fd is not None:
+                conn.want |= FUSE_CAP_PASSTHROUGH
+                self._passthrough_available = True
+
     def init_fuse_3(self, conn: FuseConnInfoPointer, config: FuseConfigPointer) -> None:
-        if getattr(self.operations, 'flag_nopath', False) and getattr(self.operations, 'flag_nullpath_ok', False):
+        if self.use_passthrough and conn:
+            self._negotiate_passthrough(conn.contents)
+        if self._nullpath_ok:
             config.contents.nullpath_ok = True
         if config:
             for key, value in self._libfuse2_options_moved_into_libfuse3_config.items():
@@ -1892,29 +3157,37 @@ class FUSE:
         decoded_path = path.decode(self.encoding, self.errors)
 
         if self.raw_fi:
-            return self.operations.create(decoded_path, mode, fi)
-        if len(inspect.signature(self.operations.create).parameters) == 2:
-            fi.fh = self.operations.create(decoded_path, mode)
+            result = self.operations.create(decoded_path, mode, fi)
+            if not isinstance(result, OpenResult):
+                return result
+            self._set_open_result(fi, result)
+            return 0
+
+        if self._create_takes_flags:
+            self._set_open_result(fi, self.operations.create(decoded_path, mode, fi.flags))
         else:
-            fi.fh = self.operations.create(decoded_path, mode, fi.flags)
+            self._set_open_result(fi, self.operations.create(decoded_path, mode))
         return 0
 
     def ftruncate(self, path: Optional[bytes], length: int, fip: fuse_fi_p) -> int:
-        fh = (fip.contents if self.raw_fi else fip.contents.fh) if fip else None
+        fh = self._get_file_handle(fip) if fip else None
         return self.operations.truncate(None if path is None else path.decode(self.encoding, self.errors), length, fh)
 
     def fgetattr(self, path: Optional[bytes], buf: c_stat_p, fip: Optional[fuse_fi_p]) -> int:
         ctypes.memset(buf, 0, ctypes.sizeof(c_stat))
 
         st = buf.contents
-        fh = (fip.contents if self.raw_fi else fip.contents.fh) if fip else None
+        fh = self._get_file_handle(fip) if fip else None
 
-        attrs = self.operations.getattr(None if path is None else path.decode(self.encoding, self.errors), fh)
+        if self.coalesce_requests and path is not None:
+            attrs = self._coalesced('getattr', self.operations.getattr, path, (), fh)
+        else:
+            attrs = self.operations.getattr(None if path is None else path.decode(self.encoding, self.errors), fh)
         set_st_attrs(st, attrs, use_ns=self.use_ns)
         return 0
 
     def lock(self, path: Optional[bytes], fip: fuse_fi_p, cmd: int, lock) -> int:
-        fh = (fip.contents if self.raw_fi else fip.contents.fh) if fip else None
+        fh = self._get_file_handle(fip) if fip else None
         return self.operations.lock(None if path is None else path.decode(self.encoding, self.errors), fh, cmd, lock)
 
     def utimens_fuse_2(self, path: Optional[bytes], buf: c_utimbuf_p) -> int:
@@ -1934,34 +3207,267 @@ class FUSE:
         return self.operations.bmap(path.decode(self.encoding, self.errors), blocksize, idx)
 
     def ioctl(self, path: Optional[bytes], cmd: int, arg: c_void_p, fip: fuse_fi_p, flags: int, data: c_void_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.ioctl(
             None if path is None else path.decode(self.encoding, self.errors), cmd, arg, fh, flags, data
         )
 
     def poll(self, path: Optional[bytes], fip: fuse_fi_p, ph, reventsp) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.poll(None if path is None else path.decode(self.encoding, self.errors), fh, ph, reventsp)
 
     def write_buf(self, path: bytes, buf: fuse_bufvec_p, offset: int, fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.write_buf(path.decode(self.encoding, self.errors), buf, offset, fh)
 
     def read_buf(self, path: bytes, bufpp: fuse_bufvec_pp, size: int, offset: int, fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.read_buf(path.decode(self.encoding, self.errors), bufpp, size, offset, fh)
 
     def flock(self, path: bytes, fip: fuse_fi_p, op: int) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.flock(path.decode(self.encoding, self.errors), fh, op)
 
     def fallocate(self, path: Optional[bytes], mode: int, offset: int, size: int, fip: fuse_fi_p) -> int:
-        fh = fip.contents if self.raw_fi else fip.contents.fh
+        fh = self._get_file_handle(fip)
         return self.operations.fallocate(
             None if path is None else path.decode(self.encoding, self.errors), mode, offset, size, fh
         )
 
 
+class Driver:
+    '''
+    Calls the libfuse callbacks that FUSE would register for the given operations object directly
+    without mounting anything. The arguments are marshaled through the same ctypes prototypes,
+    wrappers, and error handling as when called by libfuse.
+
+    This is intended for tests and microbenchmarks of the translation layer in environments
+    without /dev/fuse. The struct layouts and callback signatures are those of the loaded libfuse.
+    Note that Python callbacks given to libfuse, e.g., the readdir filler, are also implemented in
+    Python here, while they would be implemented in C by libfuse.
+
+    The convenience methods mirror the system calls and raise OSError on negative return values.
+    Use 'call' to get the raw return value.
+    '''
+
+    def __init__(
+        self,
+        operations,
+        raw_fi: bool = False,
+        encoding: str = 'utf-8',
+        errors: str = 'surrogateescape',
+        profile: Union[bool, str, Profiler] = False,
+        statistics: Optional[CallbackStatistics] = None,
+        error_log_limiter: Optional[ErrorLogRateLimiter] = None,
+        process_pool: int = 0,
+        interpreter_pool: bool = False,
+        **kwargs,
+    ) -> None:
+        # FUSE.__init__ would mount. Only do the setup, which happens before fuse_main_real is called.
+        self.fuse = FUSE.__new__(FUSE)
+        self.fuse._initialize(
+            operations,
+            raw_fi,
+            encoding,
+            errors,
+            profile,
+            statistics,
+            error_log_limiter,
+            process_pool,
+            interpreter_pool,
+            kwargs,
+        )
+        self.fuse_operations = self.fuse._create_fuse_operations()
+        self.encoding = encoding
+        self.errors = errors
+        self._prototypes: dict[str, Any] = {field[0]: field[1] for field in fuse_operations._fields_}
+
+    def __enter__(self):
+        self.init()
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.destroy()
+
+    def _encode(self, path: Optional[str]) -> Optional[bytes]:
+        return None if path is None else path.encode(self.encoding, self.errors)
+
+    def _padded(self, name: str, *args) -> tuple:
+        # Some platforms have additional arguments, e.g., 'position' for getxattr on macOS.
+        return args + (0,) * (len(self._prototypes[name]._argtypes_) - len(args))
+
+    def implements(self, name: str) -> bool:
+        return bool(getattr(self.fuse_operations, name))
+
+    def call(self, name: str, *args) -> int:
+        '''Calls the registered libfuse callback with the given ctypes-compatible arguments.'''
+        callback = getattr(self.fuse_operations, name)
+        if not callback:
+            return -errno.ENOSYS
+        result = callback(*args)
+        if self.fuse._critical_exception is not None:
+            exception, self.fuse._critical_exception = self.fuse._critical_exception, None
+            raise exception
+        return result
+
+    def _check(self, result: int) -> int:
+        if result is not None and result < 0:
+            raise FuseOSError(-result)
+        return result
+
+    def init(self) -> None:
+        conn = fuse_conn_info()
+        if fuse_version_major == 2:
+            self.call('init', ctypes.pointer(conn))
+        else:
+            self.call('init', ctypes.pointer(conn), ctypes.pointer(fuse_config()))
+
+    def destroy(self) -> None:
+        if self.implements('destroy'):
+            self.call('destroy', None)
+        self.fuse._shutdown_process_pool()
+
+    def getattr(self, path: Optional[str], fi: Optional[fuse_file_info] = None) -> c_stat:
+        st = c_stat()
+        if fuse_version_major == 2:
+            if fi is None:
+                self._check(self.call('getattr', self._encode(path), ctypes.byref(st)))
+            else:
+                self._check(self.call('fgetattr', self._encode(path), ctypes.byref(st), ctypes.byref(fi)))
+        else:
+            self._check(
+                self.call('getattr', self._encode(path), ctypes.byref(st), None if fi is None else ctypes.byref(fi))
+            )
+        return st
+
+    def readlink(self, path: str, size: int = 4096) -> str:
+        buffer = ctypes.create_string_buffer(size)
+        self._check(self.call('readlink', self._encode(path), ctypes.cast(buffer, c_byte_p), size))
+        return buffer.value.decode(self.encoding, self.errors)
+
+    def open(self, path: str, flags: int = os.O_RDONLY) -> fuse_file_info:
+        fi = fuse_file_info(flags=flags)
+        if self.implements('open'):
+            self._check(self.call('open', self._encode(path), ctypes.byref(fi)))
+        return fi
+
+    def create(self, path: str, mode: int, flags: int = os.O_WRONLY | os.O_CREAT) -> fuse_file_info:
+        fi = fuse_file_info(flags=flags)
+        self._check(self.call('create', self._encode(path), mode, ctypes.byref(fi)))
+        return fi
+
+    def read(self, path: Optional[str], size: int, offset: int, fi: fuse_file_info) -> bytes:
+        buffer = ctypes.create_string_buffer(size)
+        result = self._check(
+            self.call('read', self._encode(path), ctypes.cast(buffer, c_byte_p), size, offset, ctypes.byref(fi))
+        )
+        return buffer.raw[:result]
+
+    def read_into(self, path: Optional[str], buffer, offset: int, fi: fuse_file_info) -> int:
+        '''Reads into a preallocated ctypes buffer to avoid measuring the allocation of the result.'''
+        size = ctypes.sizeof(buffer)
+        return self._check(
+            self.call('read', self._encode(path), ctypes.cast(buffer, c_byte_p), size, offset, ctypes.byref(fi))
+        )
+
+    def write(self, path: Optional[str], data: bytes, offset: int, fi: fuse_file_info) -> int:
+        buffer = ctypes.create_string_buffer(data, len(data))
+        return self._check(
+            self.call('write', self._encode(path), ctypes.cast(buffer, c_byte_p), len(data), offset, ctypes.byref(fi))
+        )
+
+    def flush(self, path: Optional[str], fi: fuse_file_info) -> int:
+        return self._check(self.call('flush', self._encode(path), ctypes.byref(fi)))
+
+    def release(self, path: Optional[str], fi: fuse_file_info) -> int:
+        return self._check(self.call('release', self._encode(path), ctypes.byref(fi)))
+
+    def opendir(self, path: str) -> fuse_file_info:
+        fi = fuse_file_info()
+        if self.implements('opendir'):
+            self._check(self.call('opendir', self._encode(path), ctypes.byref(fi)))
+        return fi
+
+    def readdir(
+        self, path: Optional[str], fi: Optional[fuse_file_info] = None, offset: int = 0
+    ) -> list[tuple[str, int, int, int]]:
+        '''Returns a list of (name, st_mode, st_ino, offset) tuples as they would be passed to the kernel.'''
+        entries: list[tuple[str, int, int, int]] = []
+
+        def fill(buffer, name, stbuf, offset, *flags):
+            if stbuf:
+                st = stbuf.contents
+                entries.append((name.decode(self.encoding, self.errors), st.st_mode, st.st_ino, offset))
+            else:
+                entries.append((name.decode(self.encoding, self.errors), 0, 0, offset))
+            return 0
+
+        filler = self._prototypes['readdir']._argtypes_[2](fill)
+        fi = fuse_file_info() if fi is None else fi
+        args = (self._encode(path), None, filler, offset, ctypes.byref(fi))
+        self._check(self.call('readdir', *(args if fuse_version_major == 2 else (*args, 0))))
+        return entries
+
+    def releasedir(self, path: Optional[str], fi: fuse_file_info) -> int:
+        return self._check(self.call('releasedir', self._encode(path), ctypes.byref(fi)))
+
+    def statfs(self, path: str) -> c_statvfs:
+        stv = c_statvfs()
+        self._check(self.call('statfs', self._encode(path), ctypes.byref(stv)))
+        return stv
+
+    def getxattr(self, path: str, name: str) -> bytes:
+        '''Queries the size first and then the value, like the kernel does for getxattr(2) with size 0.'''
+        encoded_path = self._encode(path)
+        encoded_name = name.encode(self.encoding, self.errors)
+        size = self._check(self.call('getxattr', *self._padded('getxattr', encoded_path, encoded_name, None, 0)))
+        buffer = ctypes.create_string_buffer(max(size, 1))
+        args = self._padded('getxattr', encoded_path, encoded_name, ctypes.cast(buffer, c_byte_p), size)
+        # buffer.raw must only be read after the call has filled the buffer.
+        length = self._check(self.call('getxattr', *args))
+        return buffer.raw[:length]
+
+    def listxattr(self, path: str) -> list[str]:
+        encoded_path = self._encode(path)
+        size = self._check(self.call('listxattr', encoded_path, None, 0))
+        buffer = ctypes.create_string_buffer(max(size, 1))
+        result = self._check(self.call('listxattr', encoded_path, ctypes.cast(buffer, c_byte_p), size))
+        return [name.decode(self.encoding, self.errors) for name in buffer.raw[:result].split(b'\x00') if name]
+
+    def setxattr(self, path: str, name: str, value: bytes, options: int = 0) -> int:
+        buffer = ctypes.create_string_buffer(value, len(value))
+        args = (
+            self._encode(path),
+            name.encode(self.encoding, self.errors),
+            ctypes.cast(buffer, c_byte_p),
+            len(value),
+            options,
+        )
+        return self._check(self.call('setxattr', *self._padded('setxattr', *args)))
+
+    def _call_path(self, name: str, *paths: str) -> int:
+        return self._check(self.call(name, *(self._encode(path) for path in paths)))
+
+    def mkdir(self, path: str, mode: int) -> int:
+        return self._check(self.call('mkdir', self._encode(path), mode))
+
+    def unlink(self, path: str) -> int:
+        return self._call_path('unlink', path)
+
+    def rmdir(self, path: str) -> int:
+        return self._call_path('rmdir', path)
+
+    def rename(self, old: str, new: str) -> int:
+        if fuse_version_major == 2:
+            return self._call_path('rename', old, new)
+        return self._check(self.call('rename', self._encode(old), self._encode(new), 0))
+
+    def truncate(self, path: str, length: int) -> int:
+        if fuse_version_major == 2:
+            return self._check(self.call('truncate', self._encode(path), length))
+        return self._check(self.call('truncate', self._encode(path), length, None))
+
+
 def _nullable_dummy_function(method):
     '''
     Marks the given method as to be ignored by the 'FUSE' class.
@@ -1995,8 +3501,34 @@ class Operations:
     if documented, positive numbers as values. Raising OSError(errno.<CODE>)
     also works and has to be used for those methods returning something other
     than int.
+
+    Set use_object_handles to True in order to return arbitrary Python objects
+    from open, create, and opendir instead of integer file handles. These
+    objects are then passed as 'fh' to the other methods and are forgotten
+    after release and releasedir. This is ignored for files when raw_fi is set.
+
+    Set use_passthrough to True in order to request kernel passthrough on mount.
+    open and create may then return an OpenResult with a file descriptor, to
+    which the kernel forwards reads and writes directly.
+
+    Set coalesce_requests to True in order to share the result of an in-flight getattr or read call
+    with concurrent calls for the same path and arguments, e.g., when many processes open the same file
+    at once. The calls are coalesced regardless of the file handle, so this should only be enabled if
+    the results do not depend on it. Calls arriving after a write, truncate, or other modification of the path
+    has returned do not join calls that started before it. The number of coalesced calls is counted in
+    FUSE.statistics.
+
+    Set directory_cache_size to a number of bytes in order to cache the listings returned by readdir
+    in a DirectoryCache, e.g., for immutable trees like archives. Repeated listings are then replayed
+    without calling readdir while directory_version returns the same value for the path.
+
+    Methods decorated with offload run in the worker processes of process_pool if it is set,
+    e.g., by FUSE(..., process_pool=N), or in the subinterpreters set by FUSE(..., interpreter_pool=True).
+    Each worker calls init_worker on its copy of the operations.
     '''
 
+    process_pool: Optional[Union['ProcessPool', 'InterpreterPool']] = None
+
     @_nullable_dummy_function
     def access(self, path: str, amode: int) -> int:
         return 0
@@ -2055,6 +3587,10 @@ class Operations:
 
         st_atime, st_mtime and st_ctime should be floats.
 
+        An os.stat_result, e.g., from os.stat, may also be returned. It is copied
+        into the stat C structure without building a dictionary first. A filled
+        c_stat is copied as is.
+
         NOTE: There is an incompatibility between Linux and Mac OS X
         concerning st_nlink of directories. Mac OS X counts all files inside
         the directory, while Linux counts only the subdirectories.
@@ -2148,24 +3684,43 @@ class Operations:
 
     @_nullable_dummy_function
     def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
-        'Returns bytes containing the requested data.'
+        '''
+        Returns bytes containing the requested data. Other buffers, e.g., a memoryview
+        of an mmap, are also accepted and copied directly if they are writable.
+        '''
 
         raise FuseOSError(errno.EIO)
 
     @_nullable_dummy_function
-    def readdir(self, path: str, fh: int) -> ReadDirResult:
+    def readdir(self, path: str, fh: int) -> ReadDirEntriesResult:
         '''
         Can return either a list of names, or a list of (name, attrs, offset)
-        tuples. attrs is a dict as in getattr.
-        Only st_mode in attrs is used! In the future it may be possible to simply return the mode.
+        tuples. attrs is a dict as in getattr or simply the mode.
+        Only st_mode and st_ino in attrs are used! For large directories, return DirEntries, which
+        holds the names, modes, and inodes in parallel sequences, or an os.scandir iterator directly.
         The 'offset' argument should almost always be 0. If you want to support non-zero offsets
         to avoid memory issues for very large directories, implement readdir_with_offset instead!
         '''
 
         return ['.', '..']
 
+    def directory_version(self, path: str) -> Hashable:
+        '''
+        Only called if directory_cache_size is set. Returns a value, e.g., an etag or the modification time,
+        that changes whenever the listing of the directory changes. Return None to not cache the listing.
+        The default assumes that directories never change.
+        '''
+
+        return 0
+
+    def init_worker(self) -> None:
+        '''
+        Only called if process_pool is set. Called once in each worker process or subinterpreter after
+        the operations object was unpickled, e.g., to open files or connections that cannot be pickled.
+        '''
+
     @_nullable_dummy_function
-    def readdir_with_offset(self, path: str, offset: int, fh: int) -> ReadDirResult:
+    def readdir_with_offset(self, path: str, offset: int, fh: int) -> ReadDirEntriesResult:
         '''
         Similar to readdir but takes an additional 'offset' argument, which is inaptly named in FUSE
         because it also is known to contain inodes, hashes, pointers to B-Trees and whatever.
@@ -2265,9 +3820,19 @@ class Operations:
 callback_logger = logging.getLogger('fuse.log-mixin')
 
 
+def _truncated_repr(value: Any, max_length: int = 64) -> str:
+    if isinstance(value, (bytes, bytearray, memoryview)) and len(value) > max_length:
+        return f'{bytes(value[:max_length])!r}...[{len(value)} B]'
+    return repr(value)
+
+
 def _log_method_call(method, *args):
+    # Formatting the arguments can be more expensive than the callback itself, e.g., for read and write.
+    if not callback_logger.isEnabledFor(logging.DEBUG):
+        return method(*args)
+
     # For methods, 'args' will start with 'self'!
-    callback_logger.debug('-> %s %s', method.__name__, repr(args))
+    callback_logger.debug('-> %s (%s)', method.__name__, ', '.join(_truncated_repr(arg) for arg in args))
     ret = '[Unhandled Exception]'
     try:
         ret = method(*args)
@@ -2276,34 +3841,72 @@ def _log_method_call(method, *args):
         ret = str(e)
         raise
     finally:
-        callback_logger.debug('<- %s %s', method.__name__, repr(ret))
+        callback_logger.debug('<- %s %s', method.__name__, _truncated_repr(ret))
 
 
 class LoggingMixIn:
     """
     This class can be inherited from in addition to Operations to enable logging for all Operation callbacks.
     Using the decorator is to be preferred!
+
+    The callbacks are wrapped once when the subclass is created. Other attribute accesses are not intercepted.
+    An override in a further subclass is wrapped, too, but when it calls super(), only the outermost call is logged.
     """
 
-    def __getattribute__(self, name):
-        value = super().__getattribute__(name)
-        if (
-            not name.startswith('_')
-            and callable(value)
-            and hasattr(Operations, name)
-            and not getattr(value, 'libfuse_ignore', False)
-        ):
-            return functools.partial(_log_method_call, value)
-        return value
+    def __init_subclass__(cls, **kwargs):
+        import inspect  # pylint: disable=import-outside-toplevel
+
+        super().__init_subclass__(**kwargs)
+        for name in dir(Operations):
+            if name.startswith('_'):
+                continue
+
+            value = inspect.getattr_static(cls, name, None)
+            if isinstance(value, staticmethod):
+                function = value.__func__
+            elif inspect.isfunction(value):
+                function = value
+            elif callable(value) and not isinstance(value, (type, classmethod)):
+                # E.g., chmod = os.chmod. Builtins do not bind 'self' and must therefore stay unbound.
+                function = value
+                value = staticmethod(value)
+            else:
+                continue
+
+            if getattr(function, 'libfuse_ignore', False) or getattr(function, '_logs_callback', False):
+                continue
+
+            wrapped = log_callback(function)
+            setattr(cls, name, staticmethod(wrapped) if isinstance(value, staticmethod) else wrapped)
+
+
+# Names of the callbacks, which are currently being logged in this thread.
+_logged_callbacks = threading.local()
 
 
 def log_callback(method):
     """Simple decorator that adds log output for the decorated method."""
 
+    name = method.__name__
+
     # For some weird reason functools.partial(_wrap_method_call, method) does not work?!
+    # -> Because functools.partial is not a descriptor and therefore does not bind 'self'.
+    @functools.wraps(method)
     def wrap_method_call(*args):
-        return _log_method_call(method, *args)
+        if not callback_logger.isEnabledFor(logging.DEBUG):
+            return method(*args)
+
+        # A logged override, which calls super(), reaches the wrapper of the base class. Do not log it twice.
+        active = _logged_callbacks.__dict__.setdefault('names', set())
+        if name in active:
+            return method(*args)
+        active.add(name)
+        try:
+            return _log_method_call(method, *args)
+        finally:
+            active.discard(name)
 
+    wrap_method_call._logs_callback = True  # type: ignore[attr-defined]
     return wrap_method_call
 
 
@@ -2336,3 +3939,2212 @@ def overrides(parent_class):
         return method
 
     return overrider
+
+
+def _keep_unimplemented(cls: type, mixin: type, names: Iterable[str]) -> None:
+    '''
+    Mixin callbacks, which only add behavior around the filesystem's callback, should stay unimplemented when
+    the filesystem does not implement them, so that FUSE does not register them with libfuse.
+    '''
+    for name in names:
+        if getattr(cls, name, None) is not getattr(mixin, name):
+            continue
+        parent = getattr(super(mixin, cls), name, None)
+        if parent is None or getattr(parent, 'libfuse_ignore', False):
+            setattr(cls, name, parent)
+
+
+def _file_handle_key(path: Optional[str], fh: Any) -> Hashable:
+    '''Returns a hashable key for the open file, for any kind of fh including raw_fi and object handles.'''
+    if isinstance(fh, fuse_file_info):
+        return (path, fh.fh)
+    try:
+        return (path, hash(fh))
+    except TypeError:
+        return (path, id(fh))
+
+
+def _detach_file_handle(fh: Any) -> Any:
+    '''
+    Returns a copy of fh if it is the raw_fi fuse_file_info, which points to memory owned by libfuse that
+    becomes invalid after the callback returns, so that it can be used later by other threads.
+    '''
+    if isinstance(fh, fuse_file_info):
+        return type(fh).from_buffer_copy(fh)
+    return fh
+
+
+class BlockCache:
+    '''
+    Thread-safe LRU cache for file contents split into aligned blocks of block_size bytes.
+    The least recently used blocks are evicted when the cached data exceeds max_bytes.
+    '''
+
+    def __init__(self, block_size: int = 1 << 20, max_bytes: int = 256 << 20) -> None:
+        if block_size <= 0:
+            raise ValueError("The block size must be positive.")
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._blocks: collections.OrderedDict[tuple[Hashable, int], bytes] = collections.OrderedDict()
+        self._blocks_per_key: dict[Hashable, set[int]] = {}
+        # Incremented on each invalidation so that data read before it is not inserted afterward.
+        self.generation = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, block: int) -> Optional[bytes]:
+        with self._lock:
+            data = self._blocks.get((key, block))
+            if data is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end((key, block))
+            self.hits += 1
+            return data
+
+    def put(self, key: Hashable, block: int, data: bytes, generation: Optional[int] = None) -> None:
+        '''
+        Inserts the block. If generation is given and the cache was invalidated since it was queried,
+        the data might be outdated and is not inserted.
+        '''
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old_data = self._blocks.pop((key, block), None)
+            if old_data is None:
+                self._blocks_per_key.setdefault(key, set()).add(block)
+            else:
+                self.size -= len(old_data)
+            self._blocks[(key, block)] = data
+            self.size += len(data)
+
+            while self.size > self.max_bytes:
+                (evicted_key, evicted_block), evicted_data = self._blocks.popitem(last=False)
+                self._forget(evicted_key, evicted_block)
+                self.size -= len(evicted_data)
+                self.evictions += 1
+
+    def _forget(self, key: Hashable, block: int) -> None:
+        blocks = self._blocks_per_key[key]
+        blocks.discard(block)
+        if not blocks:
+            del self._blocks_per_key[key]
+
+    def invalidate(self, key: Hashable, start: int = 0, end: Optional[int] = None) -> None:
+        '''
+        Removes all cached blocks of key that overlap with the byte range [start, end). Blocks shorter than
+        block_size, i.e., the last block of the file, are always removed because the end of the file might
+        have been moved by writing or truncating beyond it.
+        '''
+        with self._lock:
+            self.generation += 1
+            blocks = self._blocks_per_key.get(key)
+            if not blocks:
+                return
+            first = start // self.block_size
+            last = None if end is None else (end - 1) // self.block_size
+            for block in [
+                block
+                for block in blocks
+                if (block >= first and (last is None or block <= last))
+                or len(self._blocks[(key, block)]) < self.block_size
+            ]:
+                self.size -= len(self._blocks.pop((key, block)))
+                self._forget(key, block)
+
+    def invalidate_tree(self, path: str) -> None:
+        '''Removes all cached blocks of path and of all paths below it, e.g., after renaming a folder.'''
+        with self._lock:
+            self.generation += 1
+            prefix = path.rstrip('/') + '/'
+            keys = [key for key in self._blocks_per_key if isinstance(key, str) and (key + '/').startswith(prefix)]
+            for key in keys:
+                for block in self._blocks_per_key.pop(key):
+                    self.size -= len(self._blocks.pop((key, block)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._blocks.clear()
+            self._blocks_per_key.clear()
+            self.size = 0
+
+    def statistics(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'blocks': len(self._blocks),
+                'bytes': self.size,
+            }
+
+
+class BlockCacheMixin:
+    '''
+    This class can be inherited from before an Operations subclass to cache the data returned by its read
+    method in a BlockCache, e.g., for slow network backends: class CachedSFTP(BlockCacheMixin, SFTP).
+    Reads are split into block-aligned reads of block_size bytes. Blocks are keyed by the path, or by
+    the file handle if the path is None, in which case they are dropped on release because the file handle
+    might be reused for another file. The cache is available as block_cache for metrics.
+
+    Cached blocks are invalidated by write, truncate, unlink, and rename, which also invalidates all paths below
+    a renamed folder. Set invalidate_on_release to True to also drop all blocks of a file when it is closed,
+    which makes changes made directly to the backend visible after reopening the file. Other changes to
+    the backend are not noticed.
+    '''
+
+    invalidate_on_release = False
+
+    def __init__(self, *args, block_size: int = 1 << 20, max_bytes: int = 256 << 20, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.block_cache = BlockCache(block_size, max_bytes)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        names = ['write', 'truncate', 'unlink', 'rename']
+        # Release is needed to drop the blocks keyed by file handles, which are only used for null paths.
+        null_paths = getattr(cls, 'flag_nopath', False) and getattr(cls, 'flag_nullpath_ok', False)
+        if not null_paths and not cls.invalidate_on_release:
+            names.append('release')
+        _keep_unimplemented(cls, BlockCacheMixin, names)
+
+    @staticmethod
+    def _block_cache_key(path: Optional[str], fh: Any) -> Hashable:
+        return _file_handle_key(None, fh) if path is None else path
+
+    def read(self, path: Optional[str], size: int, offset: int, fh: Any) -> bytes:
+        if size <= 0:
+            return b''
+        cache = self.block_cache
+        key = self._block_cache_key(path, fh)
+        block_size = cache.block_size
+        first_block = offset // block_size
+
+        chunks = []
+        for block in range(first_block, (offset + size - 1) // block_size + 1):
+            data = cache.get(key, block)
+            if data is None:
+                generation = cache.generation
+                data = bytes(super().read(path, block_size, block * block_size, fh) or b'')  # type: ignore[misc]
+                cache.put(key, block, data, generation)
+            chunks.append(data)
+            if len(data) < block_size:
+                break
+
+        start = offset - first_block * block_size
+        return (chunks[0] if len(chunks) == 1 else b''.join(chunks))[start : start + size]
+
+    def write(self, path: Optional[str], data, offset: int, fh: Any) -> int:
+        try:
+            return super().write(path, data, offset, fh)  # type: ignore[misc]
+        finally:
+            self.block_cache.invalidate(self._block_cache_key(path, fh), offset, offset + len(data))
+
+    def truncate(self, path: Optional[str], length: int, fh: Any = None) -> int:
+        try:
+            if fh is None:
+                return super().truncate(path, length)  # type: ignore[misc]
+            return super().truncate(path, length, fh)  # type: ignore[misc]
+        finally:
+            self.block_cache.invalidate(self._block_cache_key(path, fh), length)
+
+    def release(self, path: Optional[str], fh: Any) -> int:
+        try:
+            return super().release(path, fh)  # type: ignore[misc]
+        finally:
+            if self.invalidate_on_release or path is None:
+                self.block_cache.invalidate(self._block_cache_key(path, fh))
+
+    def unlink(self, path: str) -> int:
+        try:
+            return super().unlink(path)  # type: ignore[misc]
+        finally:
+            self.block_cache.invalidate(path)
+
+    def rename(self, old: str, new: str) -> int:
+        try:
+            return super().rename(old, new)  # type: ignore[misc]
+        finally:
+            self.block_cache.invalidate_tree(old)
+            self.block_cache.invalidate_tree(new)
+
+
+class _ReadaheadStream:
+    __slots__ = ('blocks', 'lock', 'next_offset', 'path', 'pending', 'window')
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.next_offset = -1
+        self.window = 0
+        # Contiguous prefetched blocks as (offset, future) sorted by offset.
+        self.blocks: collections.deque = collections.deque()
+        # All submitted prefetches that have not finished yet, including ones that were dropped from blocks.
+        self.pending: set = set()
+
+    def submit(self, executor, function, *args) -> Any:
+        future = executor.submit(function, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def cancel(self) -> None:
+        for _, future in self.blocks:
+            future.cancel()
+        self.blocks.clear()
+
+    def wait(self) -> None:
+        '''Waits for all prefetches that could not be canceled because they are already running.'''
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+
+        concurrent.futures.wait(list(self.pending))
+
+
+class ReadaheadMixin:
+    '''
+    This class can be inherited from before an Operations subclass to prefetch data for sequential reads
+    asynchronously, e.g., for streaming from high-latency backends: class Streaming(ReadaheadMixin, SFTP).
+
+    Sequential access is detected per path and file handle by offset continuity. After two consecutive
+    reads, up to max_readahead_blocks blocks of readahead_size bytes are read ahead in a pool of
+    readahead_threads threads. The window doubles with each sequential read and is halved on random access,
+    which also cancels all pending prefetches of the file. Prefetches are also canceled on release, which
+    waits for already running prefetches, and for all open handles of the path before and after write,
+    truncate, and rename, which also affects all paths below a renamed folder. With raw_fi, prefetches
+    are given a copy of the fuse_file_info.
+
+    The read method of the filesystem must be thread-safe, i.e., support concurrent calls for the same
+    file handle, for example by using os.pread instead of seek and read.
+    '''
+
+    def __init__(
+        self,
+        *args,
+        readahead_size: int = 1 << 20,
+        max_readahead_blocks: int = 8,
+        readahead_threads: int = 4,
+        **kwargs,
+    ) -> None:
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+
+        super().__init__(*args, **kwargs)
+        self.readahead_size = readahead_size
+        self.max_readahead_blocks = max_readahead_blocks
+        self._readahead_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=readahead_threads, thread_name_prefix='mfusepy-readahead'
+        )
+        self._readahead_lock = threading.Lock()
+        self._readahead_streams: dict[Hashable, _ReadaheadStream] = {}
+        # Incremented on each cancellation so that reads overlapping with it do not prefetch outdated data.
+        self._readahead_generation = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _keep_unimplemented(cls, ReadaheadMixin, ('write', 'truncate', 'rename'))
+
+    def _cancel_readahead(self, path: Optional[str], remove: bool = False) -> None:
+        '''Cancels the prefetches of all open handles of path. If remove is True, also of all paths below it.'''
+        with self._readahead_lock:
+            self._readahead_generation += 1
+            if remove:
+                prefix = (path or '').rstrip('/') + '/'
+                keys = [
+                    key
+                    for key, stream in self._readahead_streams.items()
+                    if stream.path is not None and (stream.path + '/').startswith(prefix)
+                ]
+                streams = [self._readahead_streams.pop(key) for key in keys]
+            else:
+                streams = [stream for stream in self._readahead_streams.values() if stream.path == path]
+        for stream in streams:
+            with stream.lock:
+                stream.cancel()
+                stream.next_offset = -1
+            if remove:
+                # The removed streams are not found by release anymore, so wait for their prefetches here.
+                stream.wait()
+
+    def _read_block(self, path: Optional[str], offset: int, fh: Any) -> bytes:
+        return bytes(super().read(path, self.readahead_size, offset, fh) or b'')  # type: ignore[misc]
+
+    def read(self, path: Optional[str], size: int, offset: int, fh: Any) -> bytes:
+        key = _file_handle_key(path, fh)
+        with self._readahead_lock:
+            generation = self._readahead_generation
+            stream = self._readahead_streams.get(key)
+            if stream is None:
+                stream = self._readahead_streams[key] = _ReadaheadStream(path)
+
+        block_size = self.readahead_size
+        end = offset + size
+        with stream.lock:
+            sequential = offset == stream.next_offset
+            if not sequential:
+                stream.cancel()
+                stream.window //= 2
+
+            blocks = stream.blocks
+            while blocks and blocks[0][0] + block_size <= offset:
+                blocks.popleft()[1].cancel()
+
+            # Serve as much as possible from prefetched blocks.
+            chunks = []
+            position = offset
+            end_of_file = False
+            for block_offset, future in blocks:
+                if block_offset > position or position >= end:
+                    break
+                try:
+                    data = future.result()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    # Retry synchronously below to report the error for this read.
+                    stream.cancel()
+                    break
+                chunk = data[position - block_offset : end - block_offset]
+                chunks.append(chunk)
+                position += len(chunk)
+                if len(data) < block_size:
+                    end_of_file = True
+                    break
+
+            if position < end and not end_of_file:
+                chunks.append(bytes(super().read(path, end - position, position, fh) or b''))  # type: ignore[misc]
+            result = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+            stream.next_offset = offset + len(result)
+
+            if sequential and len(result) == size and generation == self._readahead_generation:
+                stream.window = min(max(1, stream.window * 2), self.max_readahead_blocks)
+                next_block = blocks[-1][0] + block_size if blocks else stream.next_offset
+                if next_block < stream.next_offset + stream.window * block_size:
+                    fh = _detach_file_handle(fh)
+                while next_block < stream.next_offset + stream.window * block_size:
+                    future = stream.submit(self._readahead_executor, self._read_block, path, next_block, fh)
+                    blocks.append((next_block, future))
+                    next_block += block_size
+
+            return result
+
+    def release(self, path: Optional[str], fh: Any) -> int:
+        with self._readahead_lock:
+            stream = self._readahead_streams.pop(_file_handle_key(path, fh), None)
+        if stream is not None:
+            with stream.lock:
+                stream.cancel()
+            stream.wait()
+        return super().release(path, fh)  # type: ignore[misc]
+
+    # Prefetches are canceled before modifications to not waste bandwidth, and again afterward because
+    # reads during the modification might have queued new prefetches of the old data.
+
+    def write(self, path: Optional[str], data, offset: int, fh: Any) -> int:
+        self._cancel_readahead(path)
+        try:
+            return super().write(path, data, offset, fh)  # type: ignore[misc]
+        finally:
+            self._cancel_readahead(path)
+
+    def truncate(self, path: Optional[str], length: int, fh: Any = None) -> int:
+        self._cancel_readahead(path)
+        try:
+            if fh is None:
+                return super().truncate(path, length)  # type: ignore[misc]
+            return super().truncate(path, length, fh)  # type: ignore[misc]
+        finally:
+            self._cancel_readahead(path)
+
+    def rename(self, old: str, new: str) -> int:
+        self._cancel_readahead(old, remove=True)
+        self._cancel_readahead(new, remove=True)
+        try:
+            return super().rename(old, new)  # type: ignore[misc]
+        finally:
+            self._cancel_readahead(old, remove=True)
+            self._cancel_readahead(new, remove=True)
+
+    def destroy(self, path: str) -> None:
+        self._readahead_executor.shutdown(wait=False, cancel_futures=True)
+        return super().destroy(path)  # type: ignore[misc]
+
+
+class _WriteBuffer:
+    __slots__ = ('data', 'error', 'fh', 'lock', 'offset', 'path', 'time')
+
+    def __init__(self, path: Optional[str], fh: Any) -> None:
+        self.path = path
+        self.fh = fh
+        self.lock = threading.Lock()
+        self.data = bytearray()
+        self.offset = 0
+        self.time = 0.0
+        self.error: Optional[BaseException] = None
+
+
+class WriteCoalescingMixin:
+    '''
+    This class can be inherited from before an Operations subclass to combine small contiguous writes,
+    e.g., for high-latency backends: class Buffered(WriteCoalescingMixin, SFTP).
+
+    Contiguous writes to the same open file are collected in memory and forwarded to the filesystem's write
+    as one call when max_write_size bytes are buffered, when the buffer is older than max_write_age seconds,
+    or before any of these barriers: flush, fsync, release, truncate, rename, getattr of the file, and reads
+    that overlap the buffered range. If more than max_buffered_bytes are buffered over all files, writes are
+    forwarded synchronously, which slows down the writers until the buffers have been written.
+
+    Because buffered writes are acknowledged before they reach the filesystem, errors are reported by the
+    next write, flush, fsync, or release of that file. Data that failed to be written stays buffered and is
+    written again by the next barrier until the file is released. Buffers older than max_write_age are written
+    by a background thread, so the filesystem's write must be safe to call concurrently with other callbacks.
+    With raw_fi, buffered writes are forwarded with a copy of the fuse_file_info of the first buffered write.
+    '''
+
+    def __init__(
+        self,
+        *args,
+        max_write_size: int = 1 << 20,
+        max_write_age: float = 1.0,
+        max_buffered_bytes: int = 64 << 20,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_write_size = max_write_size
+        self.max_write_age = max_write_age
+        self.max_buffered_bytes = max_buffered_bytes
+        self._write_buffers_lock = threading.Lock()
+        # path -> file handle key -> buffer. Lookups by path are needed for the barriers.
+        self._write_buffers: dict[Optional[str], dict[Hashable, _WriteBuffer]] = {}
+        self._buffered_bytes = 0
+        self._write_flusher: Optional[threading.Thread] = None
+        self._stop_write_flusher = threading.Event()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _keep_unimplemented(cls, WriteCoalescingMixin, ('write', 'read', 'truncate', 'rename'))
+
+    def _get_write_buffer(self, path: Optional[str], fh: Any, create: bool = False) -> Optional[_WriteBuffer]:
+        key = _file_handle_key(path, fh)
+        with self._write_buffers_lock:
+            buffers = self._write_buffers.get(path)
+            buffer = None if buffers is None else buffers.get(key)
+            if buffer is None and create:
+                buffer = self._write_buffers.setdefault(path, {})[key] = _WriteBuffer(path, _detach_file_handle(fh))
+            return buffer
+
+    def _get_write_buffers(self, path: Optional[str]) -> list[_WriteBuffer]:
+        # Fast path without lock for the common case of no buffered writes.
+        if not self._write_buffers.get(path):
+            return []
+        with self._write_buffers_lock:
+            return list(self._write_buffers.get(path, {}).values())
+
+    def _write_back(self, buffer: _WriteBuffer) -> None:
+        '''Writes the buffered data to the filesystem. The buffer lock must be held.'''
+        if buffer.error is not None:
+            error, buffer.error = buffer.error, None
+            raise error
+        if not buffer.data:
+            return
+
+        data = bytes(buffer.data)
+        written = 0
+        try:
+            while written < len(data):
+                result = super().write(  # type: ignore[misc]
+                    buffer.path, data[written:] if written else data, buffer.offset + written, buffer.fh
+                )
+                if not isinstance(result, int) or result <= 0:
+                    raise FuseOSError(errno.EIO)
+                written += result
+        finally:
+            # Keep the data that was not written so that it is not lost and written again by the next barrier.
+            del buffer.data[:written]
+            buffer.offset += written
+            with self._write_buffers_lock:
+                self._buffered_bytes -= written
+
+    def _write_back_all(self, path: Optional[str], start: int = 0, end: Optional[int] = None) -> None:
+        '''Writes back all buffers of path, which overlap with the byte range [start, end).'''
+        for buffer in self._get_write_buffers(path):
+            with buffer.lock:
+                if buffer.error is not None or (
+                    buffer.data and buffer.offset + len(buffer.data) > start and (end is None or buffer.offset < end)
+                ):
+                    self._write_back(buffer)
+
+    def _flush_old_write_buffers(self) -> None:
+        while not self._stop_write_flusher.wait(self.max_write_age / 2):
+            now = time.monotonic()
+            with self._write_buffers_lock:
+                buffers = [buffer for path_buffers in self._write_buffers.values() for buffer in path_buffers.values()]
+            for buffer in buffers:
+                if not buffer.data or now - buffer.time < self.max_write_age:
+                    continue
+                with buffer.lock:
+                    try:
+                        self._write_back(buffer)
+                    except Exception as exception:  # pylint: disable=broad-exception-caught
+                        buffer.error = exception
+
+    def write(self, path: Optional[str], data, offset: int, fh: Any) -> int:
+        buffer = self._get_write_buffer(path, fh, create=True)
+        assert buffer is not None
+        with buffer.lock:
+            if buffer.data and offset != buffer.offset + len(buffer.data):
+                self._write_back(buffer)
+            elif buffer.error is not None:
+                self._write_back(buffer)  # Raises the error.
+
+            with self._write_buffers_lock:
+                reserved = self._buffered_bytes + len(data) <= self.max_buffered_bytes
+                if reserved:
+                    self._buffered_bytes += len(data)
+            if not reserved:
+                self._write_back(buffer)
+                return super().write(path, data, offset, fh)  # type: ignore[misc]
+
+            if not buffer.data:
+                buffer.offset = offset
+                buffer.time = time.monotonic()
+            buffer.data += data
+            if len(buffer.data) >= self.max_write_size:
+                self._write_back(buffer)
+
+        if self._write_flusher is None:
+            with self._write_buffers_lock:
+                if self._write_flusher is None:
+                    self._write_flusher = threading.Thread(
+                        target=self._flush_old_write_buffers, name='mfusepy-write-flusher', daemon=True
+                    )
+                    self._write_flusher.start()
+        return len(data)
+
+    def read(self, path: Optional[str], size: int, offset: int, fh: Any) -> bytes:
+        self._write_back_all(path, offset, offset + size)
+        return super().read(path, size, offset, fh)  # type: ignore[misc]
+
+    def getattr(self, path: Optional[str], fh: Any = None) -> dict[str, Any]:
+        self._write_back_all(path)
+        return super().getattr(path, fh)  # type: ignore[misc]
+
+    def flush(self, path: Optional[str], fh: Any) -> int:
+        buffer = self._get_write_buffer(path, fh)
+        if buffer is not None:
+            with buffer.lock:
+                self._write_back(buffer)
+        return super().flush(path, fh)  # type: ignore[misc]
+
+    def fsync(self, path: Optional[str], datasync: int, fh: Any) -> int:
+        buffer = self._get_write_buffer(path, fh)
+        if buffer is not None:
+            with buffer.lock:
+                self._write_back(buffer)
+        return super().fsync(path, datasync, fh)  # type: ignore[misc]
+
+    def release(self, path: Optional[str], fh: Any) -> int:
+        key = _file_handle_key(path, fh)
+        buffer = self._get_write_buffer(path, fh)
+        try:
+            if buffer is not None:
+                with buffer.lock:
+                    try:
+                        self._write_back(buffer)
+                    finally:
+                        # The file is closed, so data that could not be written is dropped after reporting the error.
+                        with self._write_buffers_lock:
+                            self._buffered_bytes -= len(buffer.data)
+                        buffer.data.clear()
+        finally:
+            with self._write_buffers_lock:
+                buffers = self._write_buffers.get(path)
+                if buffers is not None:
+                    buffers.pop(key, None)
+                    if not buffers:
+                        del self._write_buffers[path]
+            # Release the file in the filesystem even if the buffered data could not be written.
+            result = super().release(path, fh)  # type: ignore[misc]
+        return result
+
+    def truncate(self, path: Optional[str], length: int, fh: Any = None) -> int:
+        self._write_back_all(path)
+        if fh is None:
+            return super().truncate(path, length)  # type: ignore[misc]
+        return super().truncate(path, length, fh)  # type: ignore[misc]
+
+    def rename(self, old: str, new: str) -> int:
+        self._write_back_all(old)
+        return super().rename(old, new)  # type: ignore[misc]
+
+    def destroy(self, path: str) -> None:
+        self._stop_write_flusher.set()
+        with self._write_buffers_lock:
+            buffers = [buffer for path_buffers in self._write_buffers.values() for buffer in path_buffers.values()]
+        for buffer in buffers:
+            with buffer.lock:
+                try:
+                    self._write_back(buffer)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    log.exception("Failed to write buffered data for %s on unmount", buffer.path)
+        return super().destroy(path)  # type: ignore[misc]
+
+
+class Passthrough(Operations):
+    '''
+    Mirrors a folder like examples/loopback.py, but scales to multiple threads and avoids path lookups from /:
+
+     - read and write use os.pread and os.pwrite, which need neither a lock nor a seek.
+     - All paths are resolved relative to a file descriptor for the root folder with the *at() system calls.
+     - getattr returns the os.stat_result, which is copied into the stat struct without building a dictionary.
+     - readdir uses os.scandir on the descriptor returned by opendir and gets the file types without stat calls.
+       The entries are returned as DirEntries, which are passed to libfuse without per-entry type checks.
+     - open and create request kernel passthrough so that the kernel reads and writes the files directly.
+       This requires libfuse 3.17+, Linux 6.9+, and root. Otherwise, read and write are called as usual.
+    '''
+    use_ns = True
+    use_passthrough = True
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.realpath(root)
+        # O_PATH is sufficient for the *at() calls and does not require read permissions for the root.
+        self.root_fd: Optional[int] = os.open(self.root, getattr(os, 'O_PATH', os.O_RDONLY) | os.O_DIRECTORY)
+
+    def __del__(self) -> None:
+        root_fd = getattr(self, 'root_fd', None)
+        if root_fd is not None:
+            self.root_fd = None
+            os.close(root_fd)
+
+    @staticmethod
+    def _relative(path: str) -> str:
+        return path[1:] or '.'
+
+    def access(self, path: str, amode: int) -> int:
+        if not os.access(self._relative(path), amode, dir_fd=self.root_fd):
+            raise FuseOSError(errno.EACCES)
+        return 0
+
+    def chmod(self, path: str, mode: int) -> int:
+        os.chmod(self._relative(path), mode, dir_fd=self.root_fd)
+        return 0
+
+    def chown(self, path: str, uid: int, gid: int) -> int:
+        os.chown(self._relative(path), uid, gid, dir_fd=self.root_fd, follow_symlinks=False)
+        return 0
+
+    def create(self, path: str, mode: int, fi=None):
+        flags = fi if isinstance(fi, int) else os.O_WRONLY | os.O_TRUNC
+        fd = os.open(self._relative(path), flags | os.O_CREAT, mode, dir_fd=self.root_fd)
+        return OpenResult(fd, passthrough_fd=fd)
+
+    def flush(self, path: str, fh: int) -> int:
+        # Closing a duplicate reports write errors and releases POSIX locks like close(2) would,
+        # while avoiding the cost of an fsync on each close.
+        os.close(os.dup(fh))
+        return 0
+
+    def fsync(self, path: str, datasync: int, fh: int) -> int:
+        if datasync != 0 and hasattr(os, 'fdatasync'):
+            os.fdatasync(fh)
+        else:
+            os.fsync(fh)
+        return 0
+
+    def getattr(self, path: str, fh: Optional[int] = None):
+        if fh is not None:
+            return os.fstat(fh)
+        return os.stat(self._relative(path), dir_fd=self.root_fd, follow_symlinks=False)
+
+    def getxattr(self, path: str, name: str, position: int = 0) -> bytes:
+        # The xattr functions do not support dir_fd.
+        return os.getxattr(self.root + path, name, follow_symlinks=False)
+
+    def link(self, target: str, source: str) -> int:
+        os.link(
+            self._relative(source),
+            self._relative(target),
+            src_dir_fd=self.root_fd,
+            dst_dir_fd=self.root_fd,
+            follow_symlinks=False,
+        )
+        return 0
+
+    def listxattr(self, path: str) -> Iterable[str]:
+        return os.listxattr(self.root + path, follow_symlinks=False)
+
+    def mkdir(self, path: str, mode: int) -> int:
+        os.mkdir(self._relative(path), mode, dir_fd=self.root_fd)
+        return 0
+
+    def mknod(self, path: str, mode: int, dev: int) -> int:
+        if S_IFMT(mode) == S_IFREG:
+            # OpenBSD does not allow using os.mknod to create regular files.
+            flags = os.O_CREAT | os.O_WRONLY | os.O_EXCL
+            os.close(os.open(self._relative(path), flags, mode & 0o7777, dir_fd=self.root_fd))
+        else:
+            os.mknod(self._relative(path), mode, dev, dir_fd=self.root_fd)
+        return 0
+
+    def open(self, path: str, flags: int):
+        fd = os.open(self._relative(path), flags, dir_fd=self.root_fd)
+        return OpenResult(fd, passthrough_fd=fd)
+
+    def opendir(self, path: str) -> int:
+        return os.open(self._relative(path), os.O_RDONLY | os.O_DIRECTORY, dir_fd=self.root_fd)
+
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        return os.pread(fh, size, offset)
+
+    def readdir(self, path: str, fh: int) -> ReadDirEntriesResult:
+        # scandir duplicates the descriptor and rewinds it, so that the directory can be listed repeatedly.
+        return DirEntries.from_scandir(os.scandir(fh), with_dots=True)
+
+    def readlink(self, path: str) -> str:
+        return os.readlink(self._relative(path), dir_fd=self.root_fd)
+
+    def release(self, path: str, fh: int) -> int:
+        os.close(fh)
+        return 0
+
+    def releasedir(self, path: str, fh: int) -> int:
+        os.close(fh)
+        return 0
+
+    def removexattr(self, path: str, name: str) -> int:
+        os.removexattr(self.root + path, name, follow_symlinks=False)
+        return 0
+
+    def rename(self, old: str, new: str) -> int:
+        os.rename(self._relative(old), self._relative(new), src_dir_fd=self.root_fd, dst_dir_fd=self.root_fd)
+        return 0
+
+    def rmdir(self, path: str) -> int:
+        os.rmdir(self._relative(path), dir_fd=self.root_fd)
+        return 0
+
+    def setxattr(self, path: str, name: str, value: bytes, options: int, position: int = 0) -> int:
+        os.setxattr(self.root + path, name, value, options, follow_symlinks=False)
+        return 0
+
+    def statfs(self, path: str) -> dict[str, int]:
+        stv = os.statvfs(self.root)
+        return {
+            key: getattr(stv, key)
+            for key in (
+                'f_bavail',
+                'f_bfree',
+                'f_blocks',
+                'f_bsize',
+                'f_favail',
+                'f_ffree',
+                'f_files',
+                'f_flag',
+                'f_frsize',
+                'f_namemax',
+            )
+        }
+
+    def symlink(self, target: str, source: str) -> int:
+        os.symlink(source, self._relative(target), dir_fd=self.root_fd)
+        return 0
+
+    def truncate(self, path: str, length: int, fh: Optional[int] = None) -> int:
+        if fh is not None:
+            os.ftruncate(fh, length)
+            return 0
+
+        # os.truncate does not support dir_fd.
+        fd = os.open(self._relative(path), os.O_WRONLY, dir_fd=self.root_fd)
+        try:
+            os.ftruncate(fd, length)
+        finally:
+            os.close(fd)
+        return 0
+
+    def unlink(self, path: str) -> int:
+        os.unlink(self._relative(path), dir_fd=self.root_fd)
+        return 0
+
+    def utimens(self, path: str, times: Optional[tuple[int, int]] = None) -> int:
+        if times is None:
+            os.utime(self._relative(path), dir_fd=self.root_fd, follow_symlinks=False)
+        else:
+            os.utime(self._relative(path), ns=times, dir_fd=self.root_fd, follow_symlinks=False)
+        return 0
+
+    def write(self, path: str, data, offset: int, fh: int) -> int:
+        return os.pwrite(fh, data, offset)
+
+
+
+def _read_only_stat(ino: int, mode: int, size: int, mtime: int, uid: int, gid: int) -> c_stat:
+    timespec = c_timespec(*divmod(mtime, 10**9))
+    return c_stat(
+        st_ino=ino,
+        st_mode=mode,
+        st_nlink=2 if S_IFMT(mode) == S_IFDIR else 1,
+        st_uid=uid,
+        st_gid=gid,
+        st_size=size,
+        st_blocks=(size + 511) // 512,
+        st_atimespec=timespec,
+        st_mtimespec=timespec,
+        st_ctimespec=timespec,
+    )
+
+
+# The operations object and the attached shared memory buffers of a ProcessPool worker process,
+# or the operations object and the pending response of an InterpreterPool subinterpreter.
+_offload_worker_state: dict[str, Any] = {'operations': None, 'buffers': {}, 'response': None}
+
+
+def _offload_worker_initialize(operations: bytes) -> None:
+    import pickle  # pylint: disable=import-outside-toplevel
+
+    _offload_worker_state['operations'] = pickle.loads(operations)
+    init_worker = getattr(_offload_worker_state['operations'], 'init_worker', None)
+    if init_worker is not None:
+        init_worker()
+
+
+def _offload_worker_call(function, args: tuple, kwargs: dict[str, Any], buffer_name: str) -> tuple[bool, Any]:
+    '''
+    Calls the method decorated with offload on the operations of this worker. Returns (True, size) if
+    the bytes-like result was written to the shared memory buffer and (False, result) otherwise.
+    '''
+    result = function.__wrapped__(_offload_worker_state['operations'], *args, **kwargs)
+    if not isinstance(result, (bytes, bytearray, memoryview)):
+        return False, result
+
+    buffers = _offload_worker_state['buffers']
+    buffer = buffers.get(buffer_name)
+    if buffer is None:
+        from multiprocessing import shared_memory  # pylint: disable=import-outside-toplevel
+
+        # The creating process unlinks the buffer. Only let it track the buffer if possible.
+        options = {'track': False} if sys.version_info >= (3, 13) else {}
+        buffer = buffers[buffer_name] = shared_memory.SharedMemory(buffer_name, **options)
+    data = memoryview(result).cast('B')
+    if len(data) > len(buffer.buf):
+        return False, result
+    buffer.buf[: len(data)] = data
+    return True, len(data)
+
+
+def offload(method):
+    '''
+    Decorator for methods of an operations class, which should run in the worker processes or subinterpreters
+    of the process_pool attribute of the operations, e.g., for CPU-bound work like decompression, which would
+    otherwise be serialized by the GIL. The method is called directly if process_pool is None.
+    '''
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        process_pool = getattr(self, 'process_pool', None)
+        if process_pool is None:
+            return method(self, *args, **kwargs)
+        return process_pool.call(wrapper, *args, **kwargs)
+
+    return wrapper
+
+
+class ProcessPool:
+    '''
+    Runs methods decorated with offload in worker processes, each with its own unpickled copy of the operations.
+    The operations are pickled once on construction. Changes to them in this process are not seen by the workers.
+    The workers are started with the 'spawn' method by default because forking a process with running libfuse
+    threads is not safe.
+
+    Bytes-like results of up to buffer_size bytes are returned via a shared memory buffer of the calling thread
+    as a memoryview, which FUSE copies directly into the libfuse buffer. The memoryview is only valid until
+    the next offloaded call in the same thread. Therefore, coalesce_requests shares it with other threads
+    as a bytes copy. Other results and exceptions are pickled.
+    '''
+
+    def __init__(self, operations, workers: Optional[int] = None, buffer_size: int = 1 << 20, mp_context=None) -> None:
+        # pylint: disable=import-outside-toplevel
+        import concurrent.futures
+        import multiprocessing
+        import pickle
+
+        self.buffer_size = buffer_size
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn') if mp_context is None else mp_context,
+            initializer=_offload_worker_initialize,
+            initargs=(pickle.dumps(operations),),
+        )
+        self._lock = threading.Lock()
+        # Keyed by the OS thread ID because ctypes discards the Python thread state of libfuse threads
+        # after each callback, so a buffer in threading.local would be created anew for each call.
+        self._buffers: dict[int, Any] = {}
+
+    def __reduce__(self):
+        # The process pool of the operations in the worker processes is None.
+        return (type(None), ())
+
+    def _buffer(self) -> Any:
+        thread_id = threading.get_ident()
+        buffer = self._buffers.get(thread_id)
+        if buffer is None:
+            from multiprocessing import shared_memory  # pylint: disable=import-outside-toplevel
+
+            buffer = shared_memory.SharedMemory(create=True, size=self.buffer_size)
+            with self._lock:
+                self._buffers[thread_id] = buffer
+        return buffer
+
+    def call(self, function, *args, **kwargs) -> Any:
+        '''Calls the function decorated with offload in a worker process and returns its result.'''
+        buffer = self._buffer()
+        in_buffer, result = self._executor.submit(_offload_worker_call, function, args, kwargs, buffer.name).result()
+        return buffer.buf[:result] if in_buffer else result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for buffer in self._buffers.values():
+                # Memoryviews returned by call that are still referenced keep the mapping open until they are freed.
+                with contextlib.suppress(BufferError):
+                    buffer.close()
+                buffer.unlink()
+            self._buffers.clear()
+
+
+# The response of an offloaded call in a subinterpreter: the kind of the payload and its size.
+_INTERPRETER_RESPONSE = struct.Struct('<BQ')
+_INTERPRETER_RESPONSE_BYTES = 0
+_INTERPRETER_RESPONSE_PICKLED = 1
+_INTERPRETER_RESPONSE_EXCEPTION = 2
+
+# Executed in each new subinterpreter of an InterpreterPool. sys.path and the main script are set up like for
+# the 'spawn' start method of multiprocessing, so that the pickled operations can be loaded.
+_INTERPRETER_BOOTSTRAP = '''
+import pickle, sys
+import _interpreters  # Memoryviews can only be shared with interpreters that imported it.
+sys.path[:], _mfusepy_main_path, _mfusepy_operations = pickle.loads(_mfusepy_bootstrap)
+if _mfusepy_main_path:
+    import runpy
+    _mfusepy_main = runpy.run_path(_mfusepy_main_path, run_name='__mp_main__')
+    globals().update((key, value) for key, value in _mfusepy_main.items() if not key.startswith('__'))
+    sys.modules['__mp_main__'] = sys.modules['__main__']
+import mfusepy
+mfusepy._offload_worker_initialize(_mfusepy_operations)
+del _mfusepy_bootstrap, _mfusepy_main_path, _mfusepy_operations
+'''
+
+
+def _interpreter_worker_call(request: bytes, buffer: memoryview) -> None:
+    '''
+    Calls the method decorated with offload on the operations of this subinterpreter and writes the response,
+    including exceptions, into the buffer shared with the calling thread.
+    '''
+    import pickle  # pylint: disable=import-outside-toplevel
+
+    function, args, kwargs = pickle.loads(request)
+    try:
+        result = function.__wrapped__(_offload_worker_state['operations'], *args, **kwargs)
+        if isinstance(result, (bytes, bytearray, memoryview)):
+            response = (_INTERPRETER_RESPONSE_BYTES, memoryview(result).cast('B'))
+        else:
+            response = (_INTERPRETER_RESPONSE_PICKLED, memoryview(pickle.dumps(result)))
+    except Exception as exception:
+        response = (_INTERPRETER_RESPONSE_EXCEPTION, memoryview(pickle.dumps(exception)))
+    _offload_worker_state['response'] = response
+    _interpreter_worker_respond(buffer)
+
+
+def _interpreter_worker_respond(buffer: memoryview) -> None:
+    '''Writes the header of the last response and, if it fits, the payload into the buffer.'''
+    kind, payload = _offload_worker_state['response']
+    _INTERPRETER_RESPONSE.pack_into(buffer, 0, kind, len(payload))
+    if _INTERPRETER_RESPONSE.size + len(payload) <= len(buffer):
+        buffer[_INTERPRETER_RESPONSE.size : _INTERPRETER_RESPONSE.size + len(payload)] = payload
+        _offload_worker_state['response'] = None
+
+
+class InterpreterPool:
+    '''
+    Runs methods decorated with offload in subinterpreters, which have their own GIL (PEP 684) and therefore
+    run Python code in parallel inside the same process. Each calling thread, i.e., each libfuse worker thread,
+    is pinned to its own subinterpreter, which is created on its first offloaded call and which executes
+    the calls in the calling thread. Each subinterpreter imports mfusepy and unpickles its own copy of
+    the operations, on which init_worker is called. The operations are pickled once on construction.
+    Like for ProcessPool, the operations class must be importable, e.g., not be defined in a Python shell,
+    and scripts are executed again in each subinterpreter, so they need an if __name__ == '__main__' guard.
+
+    No objects are shared between the interpreters. The only shared state is a buffer per calling thread,
+    into which the subinterpreter writes the response. Bytes-like results are returned as a memoryview
+    into that buffer, which is only valid until the next offloaded call in the same thread, and which
+    coalesce_requests shares with other threads as a bytes copy. Other results and exceptions are pickled.
+    The buffer starts with buffer_size bytes and grows for larger responses.
+
+    Requires Python 3.13 or newer because older versions cannot load ctypes, and therefore mfusepy,
+    in subinterpreters. Use is_supported to check for it.
+    '''
+
+    def __init__(self, operations, buffer_size: int = 1 << 20) -> None:
+        if not InterpreterPool.is_supported():
+            raise RuntimeError('Subinterpreters with their own GIL and ctypes support require Python 3.13 or newer!')
+
+        import pickle  # pylint: disable=import-outside-toplevel
+
+        main = sys.modules.get('__main__')
+        # Scripts are executed again as '__mp_main__' to make the classes defined in them available for unpickling.
+        # Modules started with 'python -m' and interactive sessions are skipped like by multiprocessing.
+        main_path = getattr(main, '__file__', None) if getattr(main, '__spec__', None) is None else None
+        self.buffer_size = max(buffer_size, _INTERPRETER_RESPONSE.size)
+        self._bootstrap = pickle.dumps((list(sys.path), main_path, pickle.dumps(operations)))
+        self._lock = threading.Lock()
+        # The subinterpreter and response buffer of each thread. Keyed by the OS thread ID because ctypes discards
+        # the Python thread state of libfuse threads after each callback, so threading.local would not persist.
+        self._workers: dict[int, tuple[int, bytearray]] = {}
+
+    def __reduce__(self):
+        # The process pool of the operations in the subinterpreters is None.
+        return (type(None), ())
+
+    @staticmethod
+    def is_supported() -> bool:
+        '''Returns True if the running Python can import mfusepy in subinterpreters with their own GIL.'''
+        import importlib.util  # pylint: disable=import-outside-toplevel
+
+        return sys.version_info >= (3, 13) and importlib.util.find_spec('_interpreters') is not None
+
+    @staticmethod
+    def _execute(interpreter: int, code: str, shared: dict[str, Any]) -> None:
+        import _interpreters  # pylint: disable=import-outside-toplevel
+
+        exception = _interpreters.exec(interpreter, code, shared)
+        if exception is not None:
+            raise RuntimeError(f"Failed to run offloaded call in subinterpreter:\n{exception.formatted}")
+
+    def _interpreter(self) -> tuple[int, bytearray]:
+        thread_id = threading.get_ident()
+        worker = self._workers.get(thread_id)
+        if worker is None:
+            import _interpreters  # pylint: disable=import-outside-toplevel
+
+            interpreter = _interpreters.create()
+            buffer = bytearray(self.buffer_size)
+            try:
+                self._execute(interpreter, _INTERPRETER_BOOTSTRAP, {'_mfusepy_bootstrap': self._bootstrap})
+                self._execute(interpreter, '_mfusepy_buffer = _mfusepy_shared', {'_mfusepy_shared': memoryview(buffer)})
+            except BaseException:
+                _interpreters.destroy(interpreter)
+                raise
+            worker = (interpreter, buffer)
+            with self._lock:
+                self._workers[thread_id] = worker
+        return worker
+
+    def call(self, function, *args, **kwargs) -> Any:
+        '''Calls the function decorated with offload in the subinterpreter of the calling thread.'''
+        import pickle  # pylint: disable=import-outside-toplevel
+
+        interpreter, buffer = self._interpreter()
+        self._execute(
+            interpreter,
+            'mfusepy._interpreter_worker_call(_mfusepy_request, _mfusepy_buffer)',
+            {'_mfusepy_request': pickle.dumps((function, args, kwargs))},
+        )
+
+        kind, size = _INTERPRETER_RESPONSE.unpack_from(buffer, 0)
+        end = _INTERPRETER_RESPONSE.size + size
+        if end > len(buffer):
+            # Replace the buffer instead of resizing it because returned memoryviews may still reference it.
+            buffer = bytearray(max(end, 2 * len(buffer)))
+            with self._lock:
+                self._workers[threading.get_ident()] = (interpreter, buffer)
+            self._execute(
+                interpreter,
+                '_mfusepy_buffer = _mfusepy_shared\nmfusepy._interpreter_worker_respond(_mfusepy_buffer)',
+                {'_mfusepy_shared': memoryview(buffer)},
+            )
+
+        payload = memoryview(buffer)[_INTERPRETER_RESPONSE.size : end]
+        if kind == _INTERPRETER_RESPONSE_BYTES:
+            return payload
+        result = pickle.loads(payload)
+        if kind == _INTERPRETER_RESPONSE_EXCEPTION:
+            raise result
+        return result
+
+    def shutdown(self) -> None:
+        import _interpreters  # pylint: disable=import-outside-toplevel
+
+        with self._lock:
+            for interpreter, _buffer in self._workers.values():
+                _interpreters.destroy(interpreter)
+            self._workers.clear()
+
+
+class IndexedReadOnlyFS(Operations):
+    '''
+    Read-only file system base class for large indexes, e.g., of archives, with tens of millions of entries.
+    The metadata is stored in arrays instead of dictionaries: one bytes object with the NUL-terminated
+    encoded names, and columns for the name offsets, parent ids, modes, sizes, and modification times.
+
+    The constructor takes (path, mode, size, mtime_ns) rows sorted by path_sort_key, i.e., depth-first.
+    The rows are streamed into the arrays without intermediate dictionaries. Missing parent folders are
+    added implicitly. For duplicate paths, the last row wins. The entries are then numbered breadth-first with
+    the children of each folder sorted by name. This makes the children of a folder a contiguous range, which
+    can be found by bisecting the sorted parent ids and returned from readdir with few array operations.
+    Paths are looked up one component at a time in an open-addressing hash table.
+
+    Subclasses provide the file contents by implementing read_entry, which gets the index of the row passed
+    to the constructor. raw_fi is not supported.
+    '''
+
+    use_ns = True
+
+    def __init__(
+        self,
+        rows: Iterable[tuple[str, int, int, int]],
+        encoding: str = 'utf-8',
+        errors: str = 'surrogateescape',
+    ) -> None:
+        self.encoding = encoding
+        self.errors = errors
+        self.uid = os.getuid() if hasattr(os, 'getuid') else 0
+        self.gid = os.getgid() if hasattr(os, 'getgid') else 0
+
+        # The rows are streamed in depth-first order and numbered in that order. Entries are only appended to the
+        # columns, except for duplicate rows, which overwrite the previous entry. The folders of the current path
+        # are kept on a stack to find the parent of each row and to add missing folders.
+        now = time.time_ns()
+        names = bytearray(b'\0')
+        name_offsets = array.array('Q', [0, 1])
+        parents = array.array('Q', [0])
+        row_ids = array.array('q', [-1])
+        modes = array.array('I', [S_IFDIR | 0o555])
+        sizes = array.array('Q', [0])
+        mtimes = array.array('q', [now])
+
+        folder_names: list[str] = []
+        folder_ids = [0]
+        previous_key: Optional[str] = None
+        previous_entry = 0
+        for index, (path, mode, size, mtime) in enumerate(rows):
+            path = path.strip('/')
+            key = self.path_sort_key(path)
+            if previous_key is not None and key <= previous_key:
+                if key < previous_key:
+                    raise ValueError(f"The rows must be sorted by path_sort_key, but {path!r} follows a larger path.")
+                # For duplicate paths, the last row wins.
+                row_ids[previous_entry] = index
+                modes[previous_entry] = S_IFDIR | (mode & 0o7777) if previous_entry == 0 else mode
+                sizes[previous_entry] = size
+                mtimes[previous_entry] = mtime
+                continue
+            previous_key = key
+
+            if not path:
+                row_ids[0], modes[0], sizes[0], mtimes[0] = index, S_IFDIR | (mode & 0o7777), size, mtime
+                previous_entry = 0
+                continue
+
+            *parent_names, name = path.split('/')
+            depth = 0
+            common = min(len(folder_names), len(parent_names))
+            while depth < common and folder_names[depth] == parent_names[depth]:
+                depth += 1
+            del folder_names[depth:]
+            del folder_ids[depth + 1 :]
+            for folder_name in parent_names[depth:]:
+                # Because of the sort order, an existing folder can only be the entry added last.
+                entry = len(parents) - 1
+                if parents[entry] != folder_ids[-1] or names[name_offsets[entry] : name_offsets[entry + 1] - 1] != (
+                    folder_name.encode(encoding, errors)
+                ):
+                    entry = len(parents)
+                    names += folder_name.encode(encoding, errors) + b'\0'
+                    name_offsets.append(len(names))
+                    parents.append(folder_ids[-1])
+                    row_ids.append(-1)
+                    modes.append(S_IFDIR | 0o555)
+                    sizes.append(0)
+                    mtimes.append(now)
+                modes[entry] = S_IFDIR | (modes[entry] & 0o7777)
+                folder_names.append(folder_name)
+                folder_ids.append(entry)
+
+            previous_entry = len(parents)
+            names += name.encode(encoding, errors) + b'\0'
+            name_offsets.append(len(names))
+            parents.append(folder_ids[-1])
+            row_ids.append(index)
+            modes.append(mode)
+            sizes.append(size)
+            mtimes.append(mtime)
+        del folder_names, folder_ids
+
+        # Renumber the entries breadth-first so that the children of each folder become a contiguous range.
+        # The children of each folder are already sorted by name because of the depth-first order.
+        count = len(parents)
+        child_ends = array.array('Q', [0]) * count
+        for parent in itertools.islice(parents, 1, None):
+            child_ends[parent] += 1
+        total = 0
+        for entry in range(count):
+            total += child_ends[entry]
+            child_ends[entry] = total - child_ends[entry]
+        child_ids = array.array('Q', [0]) * max(0, count - 1)
+        for entry in range(1, count):
+            parent = parents[entry]
+            child_ids[child_ends[parent]] = entry
+            child_ends[parent] += 1
+
+        # After filling child_ids, child_ends[entry] is the end of the children of entry and the start of the
+        # children of entry + 1.
+        order = array.array('Q', [0])
+        position = 0
+        while position < len(order):
+            entry = order[position]
+            order.extend(child_ids[child_ends[entry - 1] if entry else 0 : child_ends[entry]])
+            position += 1
+        del child_ids, child_ends
+        new_ids = array.array('Q', [0]) * count
+        for new_id, entry in enumerate(order):
+            new_ids[entry] = new_id
+
+        self.parents = array.array('Q', (new_ids[parents[entry]] for entry in order))
+        del parents, new_ids
+        self.rows = array.array('q', map(row_ids.__getitem__, order))
+        del row_ids
+        self.modes = array.array('I', map(modes.__getitem__, order))
+        del modes
+        self.sizes = array.array('Q', map(sizes.__getitem__, order))
+        del sizes
+        self.mtimes = array.array('q', map(mtimes.__getitem__, order))
+        del mtimes
+        sorted_names = bytearray()
+        self.name_offsets = array.array('Q', [0])
+        for entry in order:
+            sorted_names += names[name_offsets[entry] : name_offsets[entry + 1]]
+            self.name_offsets.append(len(sorted_names))
+        del names, name_offsets, order
+        self.names = bytes(sorted_names)
+        del sorted_names
+
+        # Open addressing with linear probing. Slots store the entry id plus one, 0 means empty.
+        # The names are hashed with CRC32 instead of the salted hash so that the table stays valid when it is
+        # pickled to another process, e.g., to ProcessPool workers.
+        count = len(self.parents)
+        self._mask = (1 << max(1, (2 * count).bit_length())) - 1
+        self._slots = array.array('I' if count < (1 << 32) - 1 else 'Q', [0]) * (self._mask + 1)
+        for entry in range(1, count):
+            slot = self._hash(self.parents[entry], self.name(entry))
+            while self._slots[slot]:
+                slot = (slot + 1) & self._mask
+            self._slots[slot] = entry + 1
+
+    @staticmethod
+    def path_sort_key(path: str) -> str:
+        '''
+        Returns the key for sorting the rows. It sorts by path components, i.e., folders before their contents
+        and '/a/b' before '/a.txt', by replacing the separators with NUL, which is smaller than all other characters.
+        '''
+        return path.strip('/').replace('/', '\0')
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def _hash(self, parent: int, name: bytes) -> int:
+        return (zlib.crc32(name) ^ (parent * 0x9E3779B97F4A7C15)) & self._mask
+
+    def name(self, entry: int) -> bytes:
+        return self.names[self.name_offsets[entry] : self.name_offsets[entry + 1] - 1]
+
+    def lookup(self, path: str) -> int:
+        '''Returns the entry id for the path or raises ENOENT.'''
+        names, offsets, parents, slots, mask = self.names, self.name_offsets, self.parents, self._slots, self._mask
+        entry = 0
+        for name in path.encode(self.encoding, self.errors).split(b'/'):
+            if not name:
+                continue
+            slot = (zlib.crc32(name) ^ (entry * 0x9E3779B97F4A7C15)) & mask
+            while True:
+                candidate = slots[slot] - 1
+                if candidate < 0:
+                    raise FuseOSError(errno.ENOENT)
+                if parents[candidate] == entry and names[offsets[candidate] : offsets[candidate + 1] - 1] == name:
+                    entry = candidate
+                    break
+                slot = (slot + 1) & mask
+        return entry
+
+    def children(self, entry: int) -> range:
+        '''Returns the range of entry ids of the children of the given folder.'''
+        # The root is its own parent and must not be counted as its child.
+        return range(bisect.bisect_left(self.parents, entry, 1), bisect.bisect_right(self.parents, entry, 1))
+
+    def stat(self, entry: int) -> c_stat:
+        return _read_only_stat(entry + 1, self.modes[entry], self.sizes[entry], self.mtimes[entry], self.uid, self.gid)
+
+    def read_entry(self, row: int, offset: int, size: int) -> bytes:
+        '''Returns the contents of the file given by its row index in the constructor argument.'''
+        raise FuseOSError(errno.EIO)
+
+    def getattr(self, path: str, fh: Optional[int] = None):
+        return self.stat(self.lookup(path) if fh is None else fh)
+
+    def open(self, path: str, flags: int) -> int:
+        if flags & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_TRUNC):
+            raise FuseOSError(errno.EROFS)
+        return self.lookup(path)
+
+    def opendir(self, path: str) -> int:
+        entry = self.lookup(path)
+        if S_IFMT(self.modes[entry]) != S_IFDIR:
+            raise FuseOSError(errno.ENOTDIR)
+        return entry
+
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        row = self.rows[fh]
+        if row < 0 or S_IFMT(self.modes[fh]) == S_IFDIR:
+            raise FuseOSError(errno.EISDIR)
+        return self.read_entry(row, offset, max(0, min(size, self.sizes[fh] - offset)))
+
+    def readdir(self, path: str, fh: int) -> ReadDirEntriesResult:
+        children = self.children(fh)
+        start, stop = children.start, children.stop
+        names = [b'.', b'..']
+        if stop > start:
+            names += self.names[self.name_offsets[start] : self.name_offsets[stop] - 1].split(b'\0')
+        modes = array.array('I', [S_IFDIR, S_IFDIR]) + self.modes[start:stop]
+        inos = array.array('Q', [fh + 1, self.parents[fh] + 1]) + array.array('Q', range(start + 1, stop + 1))
+        return DirEntries(names, modes, inos)
+
+    def readlink(self, path: str) -> str:
+        entry = self.lookup(path)
+        if S_IFMT(self.modes[entry]) != S_IFLNK or self.rows[entry] < 0:
+            raise FuseOSError(errno.EINVAL)
+        return self.read_entry(self.rows[entry], 0, self.sizes[entry]).decode(self.encoding, self.errors)
+
+    def statfs(self, path: str) -> dict[str, int]:
+        return {'f_bsize': 512, 'f_frsize': 512, 'f_files': len(self), 'f_namemax': 255}
+
+
+class SQLiteMetadataFS(Operations):
+    '''
+    Read-only file system base class, which looks up the metadata in an SQLite database instead of keeping
+    it in memory. Opening a prebuilt database is instantaneous and the memory usage is independent of the
+    number of entries. Build the database with SQLiteMetadataFS.build.
+
+    Each libfuse worker thread gets its own read-only connection, and the statements are reused from the
+    statement cache of each connection. Folders are listed with readdir_with_offset in pages of
+    readdir_page_size entries using keyset pagination on the dirents id, which also makes the offsets stable.
+    Path components and inodes are cached in LRU caches with cache_size entries, which are never invalidated.
+
+    Subclasses provide the file contents by implementing read_entry, which gets the inode number.
+    raw_fi is not supported.
+    '''
+
+    use_ns = True
+    readdir_page_size = 512
+
+    _SCHEMA = '''
+        CREATE TABLE inodes (
+            ino INTEGER PRIMARY KEY, mode INTEGER NOT NULL, size INTEGER NOT NULL, mtime INTEGER NOT NULL
+        );
+        CREATE TABLE dirents (
+            id INTEGER PRIMARY KEY, parent INTEGER NOT NULL, name BLOB NOT NULL, ino INTEGER NOT NULL
+        );
+        CREATE TABLE xattrs (ino INTEGER NOT NULL, name BLOB NOT NULL, value BLOB NOT NULL, PRIMARY KEY (ino, name))
+            WITHOUT ROWID;
+    '''
+    # Created after inserting all rows, which is faster than updating them for each row.
+    _INDEXES = '''
+        CREATE UNIQUE INDEX dirents_by_name ON dirents (parent, name);
+        CREATE INDEX dirents_by_id ON dirents (parent, id);
+    '''
+    _SQL_CHILD = 'SELECT ino FROM dirents WHERE parent = ? AND name = ?'
+    _SQL_INODE = 'SELECT mode, size, mtime FROM inodes WHERE ino = ?'
+    _SQL_READDIR = (
+        'SELECT dirents.id, dirents.name, dirents.ino, inodes.mode FROM dirents JOIN inodes ON inodes.ino = dirents.ino'
+        ' WHERE dirents.parent = ? AND dirents.id > ? ORDER BY dirents.id LIMIT ?'
+    )
+    _SQL_XATTR = 'SELECT value FROM xattrs WHERE ino = ? AND name = ?'
+    _SQL_XATTRS = 'SELECT name FROM xattrs WHERE ino = ? ORDER BY name'
+
+    def __init__(
+        self, database: str, cache_size: int = 1 << 16, encoding: str = 'utf-8', errors: str = 'surrogateescape'
+    ) -> None:
+        self.database = os.path.abspath(database)
+        if not os.path.isfile(self.database):
+            raise FileNotFoundError(errno.ENOENT, "SQLite database not found", database)
+        self.encoding = encoding
+        self.errors = errors
+        self.uid = os.getuid() if hasattr(os, 'getuid') else 0
+        self.gid = os.getgid() if hasattr(os, 'getgid') else 0
+        self._lock = threading.Lock()
+        # Keyed by the OS thread ID because ctypes discards the Python thread state of libfuse threads
+        # after each callback, so a connection in threading.local would be opened anew for each call.
+        self._connections: dict[int, Any] = {}
+        self._child = functools.lru_cache(maxsize=cache_size)(self._query_child)
+        self._inode = functools.lru_cache(maxsize=cache_size)(self._query_inode)
+
+    @classmethod
+    def build(
+        cls,
+        database: str,
+        rows: Iterable[tuple[str, int, int, int]],
+        xattrs: Iterable[tuple[str, str, bytes]] = (),
+        encoding: str = 'utf-8',
+        errors: str = 'surrogateescape',
+    ) -> None:
+        '''
+        Creates a database from (path, mode, size, mtime_ns) rows and (path, name, value) extended attributes.
+        Missing parent folders are added implicitly. For duplicate paths, the last row wins. The folders are
+        listed in the order of the rows. Inode numbers are assigned in the order of the rows starting at 2.
+        '''
+        import sqlite3  # pylint: disable=import-outside-toplevel
+
+        now = time.time_ns()
+        inos: dict[str, int] = {'': 1}
+        inodes: list[list[int]] = [[1, S_IFDIR | 0o555, 0, now]]
+        dirents: list[tuple[int, bytes, int]] = []
+
+        def add(path: str, mode: int, size: int, mtime: int) -> int:
+            ino = inos.get(path)
+            if ino is not None:
+                return ino
+            parent, _, name = path.rpartition('/')
+            parent_ino = inos.get(parent)
+            if parent_ino is None:
+                parent_ino = add(parent, S_IFDIR | 0o555, 0, now)
+            inodes[parent_ino - 1][1] = S_IFDIR | (inodes[parent_ino - 1][1] & 0o7777)
+            ino = inos[path] = len(inodes) + 1
+            inodes.append([ino, mode, size, mtime])
+            dirents.append((parent_ino, name.encode(encoding, errors), ino))
+            return ino
+
+        for path, mode, size, mtime in rows:
+            ino = add(path.strip('/'), mode, size, mtime)
+            inodes[ino - 1][1:] = [mode, size, mtime]
+
+        connection = sqlite3.connect(database)
+        try:
+            connection.execute('PRAGMA journal_mode = WAL')
+            with connection:
+                connection.executescript(cls._SCHEMA)
+                connection.executemany('INSERT INTO inodes VALUES (?, ?, ?, ?)', inodes)
+                connection.executemany('INSERT INTO dirents (parent, name, ino) VALUES (?, ?, ?)', dirents)
+                connection.executemany(
+                    'INSERT OR REPLACE INTO xattrs VALUES (?, ?, ?)',
+                    ((inos[path.strip('/')], name.encode(encoding, errors), value) for path, name, value in xattrs),
+                )
+            connection.executescript(cls._INDEXES)
+            connection.execute('ANALYZE')
+        finally:
+            connection.close()
+
+    def _connection(self):
+        thread_id = threading.get_ident()
+        connection = self._connections.get(thread_id)
+        if connection is None:
+            import sqlite3  # pylint: disable=import-outside-toplevel
+            import urllib.parse  # pylint: disable=import-outside-toplevel
+
+            uri = 'file:' + urllib.parse.quote(self.database) + '?mode=ro'
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            with self._lock:
+                self._connections[thread_id] = connection
+        return connection
+
+    def _query_child(self, parent: int, name: bytes) -> Optional[int]:
+        row = self._connection().execute(self._SQL_CHILD, (parent, name)).fetchone()
+        return None if row is None else row[0]
+
+    def _query_inode(self, ino: int) -> tuple[int, int, int]:
+        row = self._connection().execute(self._SQL_INODE, (ino,)).fetchone()
+        if row is None:
+            raise FuseOSError(errno.ENOENT)
+        return row
+
+    def lookup(self, path: str) -> int:
+        '''Returns the inode number for the path or raises ENOENT.'''
+        ino: Optional[int] = 1
+        for name in path.encode(self.encoding, self.errors).split(b'/'):
+            if name:
+                ino = self._child(ino, name)
+                if ino is None:
+                    raise FuseOSError(errno.ENOENT)
+        return ino  # type: ignore
+
+    def read_entry(self, ino: int, offset: int, size: int) -> bytes:
+        '''Returns the contents of the file given by its inode number.'''
+        raise FuseOSError(errno.EIO)
+
+    def destroy(self, path: str) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, {}
+        for connection in connections.values():
+            connection.close()
+
+    def getattr(self, path: str, fh: Optional[int] = None):
+        ino = self.lookup(path) if fh is None else fh
+        mode, size, mtime = self._inode(ino)
+        return _read_only_stat(ino, mode, size, mtime, self.uid, self.gid)
+
+    def getxattr(self, path: str, name: str, position: int = 0) -> bytes:
+        row = (
+            self._connection()
+            .execute(self._SQL_XATTR, (self.lookup(path), name.encode(self.encoding, self.errors)))
+            .fetchone()
+        )
+        if row is None:
+            raise FuseOSError(ENOATTR)
+        return row[0]
+
+    def listxattr(self, path: str) -> Iterable[str]:
+        rows = self._connection().execute(self._SQL_XATTRS, (self.lookup(path),))
+        return [name.decode(self.encoding, self.errors) for (name,) in rows]
+
+    def open(self, path: str, flags: int) -> int:
+        if flags & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_TRUNC):
+            raise FuseOSError(errno.EROFS)
+        return self.lookup(path)
+
+    def opendir(self, path: str) -> int:
+        ino = self.lookup(path)
+        if S_IFMT(self._inode(ino)[0]) != S_IFDIR:
+            raise FuseOSError(errno.ENOTDIR)
+        return ino
+
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        mode, file_size, _mtime = self._inode(fh)
+        if S_IFMT(mode) == S_IFDIR:
+            raise FuseOSError(errno.EISDIR)
+        return self.read_entry(fh, offset, max(0, min(size, file_size - offset)))
+
+    def readdir_with_offset(self, path: str, offset: int, fh: int) -> ReadDirEntriesResult:
+        # The offsets 1 and 2 belong to '.' and '..'. The entries have their dirents id plus 2 as offset.
+        names: list[bytes] = [b'.', b'..'][offset:]
+        modes = array.array('I', [S_IFDIR, S_IFDIR][offset:])
+        inos = array.array('Q', [fh, 0][offset:])
+        offsets = array.array('Q', [1, 2][offset:])
+        rows = self._connection().execute(self._SQL_READDIR, (fh, max(0, offset - 2), self.readdir_page_size))
+        for dirent_id, name, ino, mode in rows:
+            names.append(name)
+            modes.append(mode)
+            inos.append(ino)
+            offsets.append(dirent_id + 2)
+        return DirEntries(names, modes, inos, offsets)
+
+    def readlink(self, path: str) -> str:
+        ino = self.lookup(path)
+        mode, size, _mtime = self._inode(ino)
+        if S_IFMT(mode) != S_IFLNK:
+            raise FuseOSError(errno.EINVAL)
+        return self.read_entry(ino, 0, size).decode(self.encoding, self.errors)
+
+    def statfs(self, path: str) -> dict[str, int]:
+        return {'f_bsize': 512, 'f_frsize': 512, 'f_namemax': 255}
+
+
+class _DecompressionStream:
+    __slots__ = ('decompressor', 'input', 'input_end', 'offset', 'position', 'segment_end')
+
+    def __init__(self, decompressor: Any, offset: int, position: int, segment_end: int, input_end: int = -1) -> None:
+        self.decompressor = decompressor
+        # Compressed offset of the next input to read, input that was read but not yet consumed,
+        # and the compressed offset up to which input may be read or -1.
+        self.offset = offset
+        self.input = b''
+        self.input_end = input_end
+        # Decompressed offset of the next output and of the end of the member, stream, or block.
+        self.position = position
+        self.segment_end = segment_end
+
+
+class SeekableDecompressor(io.RawIOBase):
+    '''
+    Random access to gzip, bzip2, and xz compressed files with the decompressors of the standard library.
+    Reads decompress from the nearest restart point before the offset instead of from the start of the file.
+
+    Restart points are the starts of gzip members and bzip2 streams, which are found in a first pass over the
+    file, and the xz blocks listed in the xz index. They are saved to index_path, which defaults to the file
+    path with the suffix .mfusepy-checkpoints, and loaded instead of repeating the first pass as long as the
+    size and modification time of the file are unchanged. Within gzip members, copies of the zlib decompressor,
+    which contain the window and the bit position, are kept in memory every checkpoint_spacing bytes together
+    with the compressed offset of the input that they have not consumed yet. At most max_checkpoints copies are
+    kept. When more would be needed, the spacing is doubled and every other copy is dropped, so that the memory
+    usage of about 40 KiB per copy stays bounded also for very large files. They cannot be saved because the
+    zlib module cannot resume decompression at a bit offset, and they are recorded again by reads after loading
+    a saved index. Only multi-member gzip files, e.g., from bgzip,
+    multi-stream bzip2 files, e.g., from pbzip2, and xz files with multiple blocks, e.g., from xz -T, can be
+    accessed randomly after loading a saved index.
+
+    Decompressed data is cached in a BlockCache of cache_bytes in blocks of block_size bytes.
+    pread is thread-safe. The file object interface is not.
+    '''
+
+    _FORMATS = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bzip2'), (b'\xfd7zXZ\x00', 'xz'))
+    _INDEX_MAGIC = b'MFSEEKIX'
+    _INDEX_HEADER = struct.Struct('<8sQQQQ')
+    _XZ_STREAM_HEADER_SIZE = 12
+    _CHUNK_SIZE = 128 << 10
+
+    def __init__(
+        self,
+        path: str,
+        index_path: Optional[str] = None,
+        write_index: bool = True,
+        checkpoint_spacing: int = 4 << 20,
+        max_checkpoints: int = 1024,
+        block_size: int = 1 << 20,
+        cache_bytes: int = 64 << 20,
+    ) -> None:
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self._file = open(self.path, 'rb')  # noqa: SIM115
+        try:
+            self.format = self.detect(self._file.read(6))
+            if self.format is None:
+                raise ValueError(f"{path} is not gzip, bzip2, or xz compressed.")
+            self.index_path = self.path + '.mfusepy-checkpoints' if index_path is None else index_path
+            self.checkpoint_spacing = checkpoint_spacing
+            self.max_checkpoints = max_checkpoints
+            self._snapshot_spacing = checkpoint_spacing
+            self._snapshot_count = 0
+            self.block_cache = BlockCache(block_size, cache_bytes)
+            stat_result = os.fstat(self._file.fileno())
+            self._file_version = (stat_result.st_size, stat_result.st_mtime_ns)
+            self._lock = threading.Lock()
+            self._stream: Optional[_DecompressionStream] = None
+            self._read_position = 0
+
+            # Restart points as (decompressed offset, compressed offset, compressed end of the xz block or -1,
+            # xz stream header offset or -1, zlib decompressor copy or None) sorted by the decompressed offset.
+            # Points without a decompressor copy start a new segment and are saved.
+            self._offsets: list[int] = []
+            self._restarts: list[tuple[int, int, int, int, Any]] = []
+            self.size = 0
+            if not self._load_index():
+                if self.format == 'xz':
+                    self._read_xz_index()
+                else:
+                    self._scan()
+                if write_index:
+                    try:
+                        self._save_index()
+                    except OSError as exception:
+                        log.warning("Could not write the checkpoint index to %s: %s", self.index_path, exception)
+            self._segment_starts = [restart[0] for restart in self._restarts if restart[4] is None]
+        except BaseException:
+            self._file.close()
+            raise
+
+    @classmethod
+    def detect(cls, header: bytes) -> Optional[str]:
+        '''Returns 'gzip', 'bzip2', or 'xz' if the header starts with their magic bytes, else None.'''
+        for magic, name in cls._FORMATS:
+            if header.startswith(magic):
+                return name
+        return None
+
+    def _new_decompressor(self) -> Any:
+        # pylint: disable=import-outside-toplevel
+        if self.format == 'gzip':
+            return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        if self.format == 'bzip2':
+            import bz2
+
+            return bz2.BZ2Decompressor()
+        import lzma
+
+        return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _read_input(self, stream: _DecompressionStream) -> bytes:
+        size = self._CHUNK_SIZE if stream.input_end < 0 else min(self._CHUNK_SIZE, stream.input_end - stream.offset)
+        chunk = self._read_at(stream.offset, size) if size > 0 else b''
+        if not chunk:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        stream.offset += len(chunk)
+        return chunk
+
+    def _step(self, stream: _DecompressionStream, max_length: int) -> bytes:
+        '''Decompresses up to max_length bytes from the stream and reads more input if required.'''
+        decompressor = stream.decompressor
+        if self.format == 'gzip':
+            if not stream.input:
+                stream.input = self._read_input(stream)
+            data = decompressor.decompress(stream.input, max_length)
+            stream.input = decompressor.unconsumed_tail
+        else:
+            # Decompressing xz blocks without the following blocks would fail at the stream index.
+            # Therefore, input_end limits the input to the end of the block.
+            data = decompressor.decompress(self._read_input(stream) if decompressor.needs_input else b'', max_length)
+        stream.position += len(data)
+        return data
+
+    def _add_snapshot(self, stream: _DecompressionStream) -> None:
+        index = bisect.bisect_right(self._offsets, stream.position)
+        if stream.position - self._offsets[index - 1] < self._snapshot_spacing:
+            return
+        while self._snapshot_count >= self.max_checkpoints:
+            if not self._snapshot_count:
+                return
+            self._thin_snapshots()
+            index = bisect.bisect_right(self._offsets, stream.position)
+            if stream.position - self._offsets[index - 1] < self._snapshot_spacing:
+                return
+        # The unconsumed input is not kept because it is read again from the file when restoring the snapshot.
+        snapshot = (stream.position, stream.offset - len(stream.input), -1, -1, stream.decompressor.copy())
+        self._offsets.insert(index, stream.position)
+        self._restarts.insert(index, snapshot)
+        self._snapshot_count += 1
+
+    def _thin_snapshots(self) -> None:
+        '''Doubles the snapshot spacing and drops the decompressor copies that are closer than that.'''
+        self._snapshot_spacing *= 2
+        restarts = [self._restarts[0]]
+        for restart in itertools.islice(self._restarts, 1, None):
+            if restart[4] is None or restart[0] - restarts[-1][0] >= self._snapshot_spacing:
+                restarts.append(restart)
+        self._restarts = restarts
+        self._offsets = [restart[0] for restart in restarts]
+        self._snapshot_count = sum(1 for restart in restarts if restart[4] is not None)
+
+    def _scan(self) -> None:
+        self._offsets = [0]
+        self._restarts = [(0, 0, -1, -1, None)]
+        stream = _DecompressionStream(self._new_decompressor(), 0, 0, -1)
+        while True:
+            decompressor = stream.decompressor
+            if decompressor.eof:
+                # A following gzip member or bzip2 stream can be decompressed with a new decompressor.
+                offset = stream.offset - len(decompressor.unused_data)
+                if self.detect(self._read_at(offset, 6)) != self.format:
+                    break
+                stream = _DecompressionStream(self._new_decompressor(), offset, stream.position, -1)
+                self._offsets.append(stream.position)
+                self._restarts.append((stream.position, offset, -1, -1, None))
+                continue
+
+            self._step(stream, self._CHUNK_SIZE * 8)
+            if self.format == 'gzip':
+                self._add_snapshot(stream)
+        self.size = stream.position
+
+    def _read_xz_index(self) -> None:
+        streams = []
+        end = self._file_version[0]
+        try:
+            while end > 0:
+                footer = self._read_at(end - 12, 12)
+                if footer[-4:] == b'\0\0\0\0':
+                    # Stream padding
+                    end -= 4
+                    continue
+                if len(footer) != 12 or footer[-2:] != b'YZ':
+                    raise ValueError("Invalid xz stream footer.")
+                index_size = (int.from_bytes(footer[4:8], 'little') + 1) * 4
+                index_offset = end - 12 - index_size
+                index = self._read_at(index_offset, index_size)
+                if index[0] != 0:
+                    raise ValueError("Invalid xz index.")
+
+                def read_integer(position: int, index: bytes = index) -> tuple[int, int]:
+                    value = 0
+                    shift = 0
+                    while True:
+                        byte = index[position]
+                        position += 1
+                        value |= (byte & 0x7F) << shift
+                        if byte < 0x80:
+                            return value, position
+                        shift += 7
+
+                count, position = read_integer(1)
+                blocks = []
+                for _ in range(count):
+                    unpadded_size, position = read_integer(position)
+                    decompressed_size, position = read_integer(position)
+                    blocks.append(((unpadded_size + 3) & ~3, decompressed_size))
+
+                stream_offset = index_offset - sum(size for size, _ in blocks) - self._XZ_STREAM_HEADER_SIZE
+                if stream_offset < 0 or self.detect(self._read_at(stream_offset, 6)) != 'xz':
+                    raise ValueError("Invalid xz index.")
+                streams.append((stream_offset, blocks))
+                end = stream_offset
+        except IndexError as exception:
+            raise ValueError("Invalid xz index.") from exception
+
+        position = 0
+        for stream_offset, blocks in reversed(streams):
+            offset = stream_offset + self._XZ_STREAM_HEADER_SIZE
+            for size, decompressed_size in blocks:
+                self._restarts.append((position, offset, offset + size, stream_offset, None))
+                offset += size
+                position += decompressed_size
+        if not self._restarts:
+            self._restarts.append((0, 0, -1, -1, None))
+        self._offsets = [restart[0] for restart in self._restarts]
+        self.size = position
+
+    def _save_index(self) -> None:
+        restarts = [restart for restart in self._restarts if restart[4] is None]
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(self._INDEX_HEADER.pack(self._INDEX_MAGIC, *self._file_version, self.size, len(restarts)))
+            array.array('Q', [restart[0] for restart in restarts]).tofile(file)
+            array.array('Q', [restart[1] for restart in restarts]).tofile(file)
+            array.array('q', [restart[2] for restart in restarts]).tofile(file)
+            array.array('q', [restart[3] for restart in restarts]).tofile(file)
+        os.replace(temporary_path, self.index_path)
+
+    def _load_index(self) -> bool:
+        try:
+            with open(self.index_path, 'rb') as file:
+                data = file.read()
+            magic, file_size, mtime, size, count = self._INDEX_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return False
+        if magic != self._INDEX_MAGIC or (file_size, mtime) != self._file_version or count == 0:
+            return False
+
+        columns = []
+        position = self._INDEX_HEADER.size
+        for typecode in 'QQqq':
+            column = array.array(typecode)
+            column.frombytes(data[position : position + column.itemsize * count])
+            position += column.itemsize * count
+            columns.append(column)
+        if any(len(column) != count for column in columns):
+            return False
+        self._restarts = [(offset, compressed, end, header, None) for offset, compressed, end, header in zip(*columns)]
+        self._offsets = list(columns[0])
+        self.size = size
+        return True
+
+    def _open_stream(self, index: int) -> _DecompressionStream:
+        position, offset, input_end, header_offset, state = self._restarts[index]
+        if state is None:
+            decompressor = self._new_decompressor()
+            if header_offset >= 0:
+                decompressor.decompress(self._read_at(header_offset, self._XZ_STREAM_HEADER_SIZE))
+        else:
+            decompressor = state.copy()
+        segment = bisect.bisect_right(self._segment_starts, position)
+        segment_end = self._segment_starts[segment] if segment < len(self._segment_starts) else self.size
+        return _DecompressionStream(decompressor, offset, position, segment_end, input_end)
+
+    def _decompress(self, offset: int, size: int) -> bytes:
+        end = offset + size
+        index = bisect.bisect_right(self._offsets, offset) - 1
+        stream = self._stream
+        self._stream = None
+        # Continue the previous stream for sequential reads unless there is a closer restart point.
+        if stream is None or not self._offsets[index] <= stream.position <= offset < stream.segment_end:
+            stream = self._open_stream(index)
+
+        chunks = []
+        while stream.position < end:
+            if stream.position >= stream.segment_end:
+                stream = self._open_stream(bisect.bisect_right(self._offsets, stream.position) - 1)
+                continue
+            start = stream.position
+            if start < offset:
+                max_length = min(offset - start, self.block_cache.block_size)
+            else:
+                max_length = min(end, stream.segment_end) - start
+            data = self._step(stream, max_length)
+            if self.format == 'gzip':
+                self._add_snapshot(stream)
+            if stream.position > offset:
+                chunks.append(data[max(0, offset - start) :])
+        self._stream = stream
+        return b''.join(chunks)
+
+    def pread(self, size: int, offset: int) -> bytes:
+        '''Returns up to size bytes of the decompressed data starting at offset.'''
+        size = min(size, self.size - offset)
+        if size <= 0:
+            return b''
+
+        cache = self.block_cache
+        block_size = cache.block_size
+        first_block = offset // block_size
+        chunks = []
+        for block in range(first_block, (offset + size - 1) // block_size + 1):
+            data = cache.get(self.path, block)
+            if data is None:
+                with self._lock:
+                    data = self._decompress(block * block_size, min(block_size, self.size - block * block_size))
+                cache.put(self.path, block, data)
+            chunks.append(data)
+
+        start = offset - first_block * block_size
+        return (chunks[0] if len(chunks) == 1 else b''.join(chunks))[start : start + size]
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.pread(len(buffer), self._read_position)
+        buffer[: len(data)] = data
+        self._read_position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._read_position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position.")
+        self._read_position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._read_position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            self._stream = None
+            self._restarts.clear()
+            self.block_cache.clear()
+        super().close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        '''
+        Returns the restart points without the file, e.g., for ProcessPool workers, which reopen it by path.
+        The in-memory decompressor copies cannot be pickled and are recorded again by reads after unpickling.
+        '''
+        if self.closed:
+            raise ValueError("Cannot pickle a closed SeekableDecompressor.")
+        excluded = ('_file', '_lock', '_stream', 'block_cache')
+        state = {key: value for key, value in self.__dict__.items() if key not in excluded}
+        state['_restarts'] = [restart for restart in self._restarts if restart[4] is None]
+        state['_offsets'] = [restart[0] for restart in state['_restarts']]
+        state['_snapshot_spacing'] = self.checkpoint_spacing
+        state['_snapshot_count'] = 0
+        state['_block_cache_parameters'] = (self.block_cache.block_size, self.block_cache.max_bytes)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        block_size, cache_bytes = state.pop('_block_cache_parameters')
+        self.__dict__.update(state)
+        self._file = open(self.path, 'rb')  # noqa: SIM115
+        stat_result = os.fstat(self._file.fileno())
+        if (stat_result.st_size, stat_result.st_mtime_ns) != self._file_version:
+            self._file.close()
+            raise ValueError(f"{self.path} has been modified since it was indexed.")
+        self._lock = threading.Lock()
+        self._stream = None
+        self.block_cache = BlockCache(block_size, cache_bytes)
+
+
+class TarFS(IndexedReadOnlyFS):
+    '''
+    Read-only file system for tar archives. The members are indexed in a single streaming pass over the archive,
+    and the index is saved next to it, or at index_path, to skip that pass on the next mount. The index is rebuilt
+    when the size or modification time of the archive changes. File contents of uncompressed archives are returned
+    as memoryviews of a copy-on-write mmap of the archive, which FUSE copies into the libfuse buffer without
+    creating intermediate bytes objects. Gzip, bzip2, and xz compressed archives are read with a
+    SeekableDecompressor, which saves its own index next to the archive. Sparse members are not supported.
+    '''
+
+    _INDEX_MAGIC = b'MFTARIX' + (b'L' if sys.byteorder == 'little' else b'B')
+    _INDEX_HEADER = struct.Struct('<8sQQQ')
+
+    def __init__(
+        self,
+        archive: str,
+        index_path: Optional[str] = None,
+        write_index: bool = True,
+        encoding: str = 'utf-8',
+        errors: str = 'surrogateescape',
+    ) -> None:
+        self.archive = os.path.abspath(archive)
+        self.index_path = self.archive + '.mfusepy-index' if index_path is None else index_path
+        stat_result = os.stat(self.archive)
+        self._archive_version = (stat_result.st_size, stat_result.st_mtime_ns)
+
+        with open(self.archive, 'rb') as file:
+            compressed = SeekableDecompressor.detect(file.read(6)) is not None
+        self._decompressor = SeekableDecompressor(self.archive, write_index=write_index) if compressed else None
+
+        columns = self._load_index(encoding, errors)
+        if columns is None:
+            columns = self._scan_archive(encoding, errors)
+            if write_index:
+                try:
+                    self._save_index(columns, encoding, errors)
+                except OSError as exception:
+                    log.warning("Could not write the tar index to %s: %s", self.index_path, exception)
+        paths, modes, sizes, mtimes, offsets, link_targets = columns
+        # The index keeps the archive order. The rows are passed sorted and renumbered in that order.
+        order = sorted(range(len(paths)), key=lambda row: self.path_sort_key(paths[row]))
+        self.data_offsets = array.array('Q', map(offsets.__getitem__, order))
+        self.link_targets = {new: link_targets[old] for new, old in enumerate(order) if old in link_targets}
+        del columns, offsets, link_targets
+        super().__init__(
+            ((paths[row], modes[row], sizes[row], mtimes[row]) for row in order), encoding=encoding, errors=errors
+        )
+
+        self._map_archive()
+
+    def _map_archive(self) -> None:
+        import mmap  # pylint: disable=import-outside-toplevel
+
+        self._mmap: Optional[mmap.mmap] = None
+        self._view = memoryview(b'')
+        if self._decompressor is None:
+            with open(self.archive, 'rb') as file:
+                # ACCESS_COPY makes the mapping writable for ctypes without modifying the archive.
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+            self._view = memoryview(self._mmap)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The mapping cannot be pickled, e.g., for ProcessPool workers, and is recreated by __setstate__.
+        state = self.__dict__.copy()
+        del state['_mmap'], state['_view']
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._map_archive()
+
+    @staticmethod
+    def _normalize(name: str) -> str:
+        return '/'.join(part for part in name.split('/') if part not in ('', '.'))
+
+    def _scan_archive(self, encoding: str, errors: str) -> tuple:
+        import tarfile  # pylint: disable=import-outside-toplevel
+
+        paths: list[str] = []
+        modes = array.array('I')
+        sizes = array.array('Q')
+        mtimes = array.array('q')
+        offsets = array.array('Q')
+        link_targets: dict[int, bytes] = {}
+        rows_by_path: dict[str, int] = {}
+
+        with tarfile.open(self.archive, 'r:', fileobj=self._decompressor, encoding=encoding, errors=errors) as tar:
+            while True:
+                member = tar.next()
+                if member is None:
+                    break
+                # Do not keep all TarInfo objects in memory.
+                tar.members.clear()  # type: ignore[attr-defined]
+
+                path = self._normalize(member.name)
+                mode = member.mode & 0o7777
+                size = 0
+                offset = 0
+                if member.islnk():
+                    # Hard links are served from the data of the linked member.
+                    row = rows_by_path.get(self._normalize(member.linkname))
+                    if row is None:
+                        continue
+                    mode, size, offset = modes[row], sizes[row], offsets[row]
+                    if row in link_targets:
+                        link_targets[len(paths)] = link_targets[row]
+                elif member.isreg():
+                    mode |= S_IFREG
+                    size = member.size
+                    offset = member.offset_data
+                elif member.isdir():
+                    mode |= S_IFDIR
+                elif member.issym():
+                    mode = S_IFLNK | 0o777
+                    link_targets[len(paths)] = member.linkname.encode(encoding, errors)
+                    size = len(link_targets[len(paths)])
+                else:
+                    mode |= {tarfile.CHRTYPE: 0o020000, tarfile.BLKTYPE: 0o060000, tarfile.FIFOTYPE: 0o010000}.get(
+                        member.type, S_IFREG
+                    )
+
+                rows_by_path[path] = len(paths)
+                paths.append(path)
+                modes.append(mode)
+                sizes.append(size)
+                mtimes.append(int(member.mtime * 10**9))
+                offsets.append(offset)
+
+        return paths, modes, sizes, mtimes, offsets, link_targets
+
+    def _save_index(self, columns: tuple, encoding: str, errors: str) -> None:
+        paths, modes, sizes, mtimes, offsets, link_targets = columns
+        encoded_paths = b'\0'.join(path.encode(encoding, errors) for path in paths)
+        encoded_targets = b'\0'.join(link_targets.get(row, b'') for row in range(len(paths)))
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(self._INDEX_HEADER.pack(self._INDEX_MAGIC, *self._archive_version, len(paths)))
+            for column in (modes, sizes, mtimes, offsets):
+                column.tofile(file)
+            for blob in (encoded_paths, encoded_targets):
+                file.write(struct.pack('<Q', len(blob)))
+                file.write(blob)
+        os.replace(temporary_path, self.index_path)
+
+    def _load_index(self, encoding: str, errors: str) -> Optional[tuple]:
+        try:
+            with open(self.index_path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+
+        try:
+            magic, size, mtime, count = self._INDEX_HEADER.unpack_from(data)
+            if magic != self._INDEX_MAGIC or (size, mtime) != self._archive_version:
+                return None
+            position = self._INDEX_HEADER.size
+            columns: list[array.array] = []
+            for typecode in 'IQqQ':
+                column = array.array(typecode)
+                column.frombytes(data[position : position + column.itemsize * count])
+                position += column.itemsize * count
+                columns.append(column)
+            blobs = []
+            for _ in range(2):
+                (length,) = struct.unpack_from('<Q', data, position)
+                blobs.append(data[position + 8 : position + 8 + length])
+                position += 8 + length
+        except (struct.error, ValueError):
+            return None
+
+        paths = [path.decode(encoding, errors) for path in blobs[0].split(b'\0')] if count else []
+        targets = blobs[1].split(b'\0') if count else []
+        if any(len(column) != count for column in columns) or len(paths) != count or len(targets) != count:
+            return None
+        link_targets = {row: target for row, target in enumerate(targets) if target}
+        return (paths, *columns, link_targets)
+
+    def read_entry(self, row: int, offset: int, size: int):
+        start = self.data_offsets[row] + offset
+        if self._decompressor is not None:
+            return self._decompressor.pread(size, start)
+        return self._view[start : start + size]
+
+    def readlink(self, path: str) -> str:
+        target = self.link_targets.get(self.rows[self.lookup(path)])
+        if target is None:
+            raise FuseOSError(errno.EINVAL)
+        return target.decode(self.encoding, self.errors)
+
+    def destroy(self, path: str) -> None:
+        if self._decompressor is not None:
+            self._decompressor.close()
+        self._view.release()
+        # Memoryviews returned by read that are still referenced keep the mapping open until they are freed.
+        if self._mmap is not None:
+            with contextlib.suppress(BufferError):
+                self._mmap.close()
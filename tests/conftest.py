@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
 
+import ctypes
+import sys
+
+import pytest
+
 assertion_count = 0
 
 
@@ -10,3 +15,54 @@ def pytest_assertion_pass(item, lineno, orig, expl):
 
 def pytest_terminal_summary(terminalreporter, exitstatus, config):
     print(f'{assertion_count} assertions tested.')
+
+
+@pytest.fixture
+def run_in_foreign_thread():
+    '''
+    Returns a function, which calls each of the given functions (at most 4) in its own ctypes callback on
+    one thread that was not started by Python, like the worker threads of libfuse, and returns the results.
+    ctypes creates a new Python thread state for each of these callbacks, so threading.local is empty in each.
+    The callbacks are pthread key destructors, which are called from C after the thread function returned.
+    '''
+    if sys.platform == 'win32':
+        pytest.skip("Requires pthreads")
+
+    libc = ctypes.CDLL(None)
+    libc.pthread_setspecific.argtypes = [ctypes.c_uint, ctypes.c_void_p]
+    libc.pthread_key_delete.argtypes = [ctypes.c_uint]
+    libc.pthread_join.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+
+    def run(*functions):
+        # PTHREAD_DESTRUCTOR_ITERATIONS is 4 on Linux and macOS.
+        assert len(functions) <= 4
+        results = []
+        key = ctypes.c_uint()
+
+        @ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+        def destructor(value):
+            try:
+                results.append(functions[len(results)]())
+            except Exception as exception:
+                results.append(exception)
+            if len(results) < len(functions):
+                # Setting the value again lets the thread exit call the destructor again.
+                libc.pthread_setspecific(key.value, value)
+
+        @ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_void_p)
+        def start(_argument):
+            libc.pthread_setspecific(key.value, 1)
+
+        assert libc.pthread_key_create(ctypes.byref(key), destructor) == 0
+        try:
+            thread = ctypes.c_void_p()
+            assert libc.pthread_create(ctypes.byref(thread), None, start, None) == 0
+            assert libc.pthread_join(thread, None) == 0
+        finally:
+            libc.pthread_key_delete(key.value)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    return run
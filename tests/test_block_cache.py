@@ -0,0 +1,141 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+class Backend(mfusepy.Operations):
+    use_ns = True
+
+    def __init__(self, data: bytes) -> None:
+        self.data = bytearray(data)
+        self.reads: list[tuple[int, int]] = []
+
+    def read(self, path, size, offset, fh):
+        self.reads.append((offset, size))
+        return bytes(self.data[offset : offset + size])
+
+    def write(self, path, data, offset, fh):
+        self.data.extend(bytes(max(0, offset - len(self.data))))
+        self.data[offset : offset + len(data)] = data
+        return len(data)
+
+    def truncate(self, path, length, fh=None):
+        del self.data[length:]
+        self.data.extend(bytes(length - len(self.data)))
+        return 0
+
+
+class CachedBackend(mfusepy.BlockCacheMixin, Backend):
+    pass
+
+
+class Files(mfusepy.Operations):
+    use_ns = True
+
+    def __init__(self, files) -> None:
+        self.files = files
+
+    def read(self, path, size, offset, fh):
+        return self.files[path][offset : offset + size]
+
+    def rename(self, old, new):
+        for path in [path for path in self.files if path == old or path.startswith(old + '/')]:
+            self.files[new + path[len(old) :]] = self.files.pop(path)
+        return 0
+
+
+class CachedFiles(mfusepy.BlockCacheMixin, Files):
+    pass
+
+
+def test_block_cache_mixin():
+    data = bytes(range(256)) * 40
+    operations = CachedBackend(data, block_size=1000, max_bytes=3000)
+
+    # Unimplemented callbacks must stay unimplemented so that they are not registered with libfuse.
+    assert getattr(CachedFiles.truncate, 'libfuse_ignore', False)
+    assert not getattr(CachedBackend.write, 'libfuse_ignore', False)
+
+    assert operations.read('/file', 1500, 500, 0) == data[500:2000]
+    assert operations.reads == [(0, 1000), (1000, 1000)]
+    assert operations.read('/file', 10, 1200, 0) == data[1200:1210]
+    assert len(operations.reads) == 2
+
+    # Reads beyond the end of the file.
+    assert operations.read('/file', 1000, 10000, 0) == data[10000:]
+    assert operations.read('/file', 1000, 20000, 0) == b''
+    # Empty reads at block boundaries do not have any block to read.
+    reads = len(operations.reads)
+    assert operations.read('/file', 0, 2000, 0) == b''
+    assert len(operations.reads) == reads
+
+    operations.write('/file', b'new', 1999, 0)
+    assert operations.read('/file', 4, 1998, 0) == data[1998:1999] + b'new'
+    assert operations.reads[-2:] == [(1000, 1000), (2000, 1000)]
+    # The fourth cached block exceeds max_bytes.
+    assert operations.read('/file', 10, 3000, 0) == data[3000:3010]
+
+    statistics = operations.block_cache.statistics()
+    assert statistics['bytes'] <= 3000
+    assert statistics['evictions'] > 0
+    assert 0 < statistics['hit_ratio'] < 1
+
+
+def test_block_cache_mixin_growing_file():
+    operations = CachedBackend(b'abc', block_size=1000)
+    assert operations.read('/file', 1000, 0, 0) == b'abc'
+
+    # The cached short block at the old end of the file must not truncate reads after the file grew.
+    operations.write('/file', b'x' * 2000, 1000, 0)
+    assert operations.read('/file', 3000, 0, 0) == b'abc' + bytes(997) + b'x' * 2000
+
+    operations.truncate('/file', 10)
+    assert operations.read('/file', 100, 0, 0) == b'abc' + bytes(7)
+    operations.truncate('/file', 20)
+    assert operations.read('/file', 100, 0, 0) == b'abc' + bytes(17)
+
+
+def test_block_cache_mixin_rename_folder():
+    operations = CachedFiles({'/folder/file': b'old', '/other/file': b'other'}, block_size=1000)
+    assert operations.read('/folder/file', 100, 0, 0) == b'old'
+    assert operations.read('/other/file', 100, 0, 0) == b'other'
+
+    operations.rename('/folder', '/moved')
+    operations.files['/folder/file'] = b'new'
+    assert operations.read('/folder/file', 100, 0, 0) == b'new'
+    assert operations.read('/moved/file', 100, 0, 0) == b'old'
+    assert operations.block_cache.get('/other/file', 0) == b'other'
+
+
+def test_block_cache_mixin_null_path():
+    class NullPathFiles(Files):
+        flag_nopath = True
+        flag_nullpath_ok = True
+
+        def __init__(self, files) -> None:
+            super().__init__(files)
+            self.open_files: dict = {}
+
+        def read(self, path, size, offset, fh):
+            return super().read(self.open_files[fh if isinstance(fh, int) else fh.fh], size, offset, fh)
+
+    class CachedNullPathFiles(mfusepy.BlockCacheMixin, NullPathFiles):
+        pass
+
+    assert not getattr(CachedNullPathFiles.release, 'libfuse_ignore', False)
+    operations = CachedNullPathFiles({'/a': b'A' * 100, '/b': b'B' * 100}, block_size=64)
+
+    # The file handle of a closed file is reused for another file.
+    operations.open_files[3] = '/a'
+    assert operations.read(None, 10, 0, 3) == b'A' * 10
+    assert operations.release(None, 3) == 0
+    operations.open_files[3] = '/b'
+    assert operations.read(None, 10, 0, 3) == b'B' * 10
+
+    # With raw_fi, blocks are keyed by fi.fh instead of the short-lived fuse_file_info.
+    assert operations.read(None, 10, 0, mfusepy.fuse_file_info(fh=3)) == b'B' * 10
+    assert operations.read(None, 10, 0, mfusepy.fuse_file_info(fh=3)) == b'B' * 10
+    assert operations.block_cache.statistics()['hits'] >= 1
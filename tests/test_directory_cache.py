@@ -0,0 +1,83 @@
+import os
+import stat
+import sys
+from array import array
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+class Archive(mfusepy.Operations):
+    use_ns = True
+    directory_cache_size = 1 << 20
+
+    def __init__(self) -> None:
+        self.listings = 0
+        self.version = 'v1'
+        self.names = ['a', 'b']
+
+    def directory_version(self, path):
+        return None if path == '/uncached' else self.version
+
+    def readdir(self, path, fh):
+        self.listings += 1
+        yield '.'
+        for name in self.names:
+            yield name, {'st_mode': stat.S_IFREG | 0o644, 'st_ino': len(name)}, 0
+
+
+def test_directory_cache():
+    cache = mfusepy.DirectoryCache(max_bytes=120)
+    assert cache.get(b'/a', 1) is None
+
+    cache.put(b'/a', 1, mfusepy.DirEntries([b'x', b'yy'], array('I', [1, 2]), array('Q', [3, 4])))
+    entries = cache.get(b'/a', 1)
+    assert entries is not None
+    assert (list(entries.names), list(entries.modes), list(entries.inos)) == ([b'x', b'yy'], [1, 2], [3, 4])
+    assert (entries.names[1], entries.names[-2], entries.names[1:]) == (b'yy', b'x', [b'yy'])
+    assert cache.get(b'/a', 2) is None
+
+    cache.put(b'/empty', 1, mfusepy.DirEntries([]))
+    entries = cache.get(b'/empty', 1)
+    assert entries is not None
+    assert len(entries) == 0
+
+    # Each listing of two entries takes 3 + 3 * 8 + 2 * 4 + 2 * 8 bytes and the empty one 8 bytes.
+    cache.put(b'/b', 1, mfusepy.DirEntries([b'x', b'yy']))
+    cache.put(b'/c', 1, mfusepy.DirEntries([b'x', b'yy']))
+    assert cache.get(b'/a', 1) is None
+    statistics = cache.statistics()
+    assert statistics['bytes'] <= 120
+    assert statistics['evictions'] == 1
+
+    cache.invalidate(b'/b')
+    assert cache.get(b'/b', 1) is None
+    cache.clear()
+    assert cache.statistics()['bytes'] == 0
+
+
+def test_driver_directory_cache():
+    operations = Archive()
+    driver = mfusepy.Driver(operations)
+    assert driver.fuse.directory_cache is not None
+
+    expected = [('.', 0, 0, 0), ('a', stat.S_IFREG | 0o644, 1, 0), ('b', stat.S_IFREG | 0o644, 1, 0)]
+    assert driver.readdir('/') == expected
+    assert driver.readdir('/') == expected
+    assert operations.listings == 1
+
+    operations.version = 'v2'
+    operations.names = ['ccc']
+    assert driver.readdir('/') == [('.', 0, 0, 0), ('ccc', stat.S_IFREG | 0o644, 3, 0)]
+    assert operations.listings == 2
+
+    driver.readdir('/uncached')
+    driver.readdir('/uncached')
+    assert operations.listings == 4
+
+    statistics = driver.fuse.directory_cache.statistics()
+    assert (statistics['hits'], statistics['misses'], statistics['directories']) == (1, 2, 1)
+
+    # The cache is disabled by default.
+    assert mfusepy.Driver(mfusepy.Operations()).fuse.directory_cache is None
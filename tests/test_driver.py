@@ -0,0 +1,199 @@
+import ctypes
+import errno
+import os
+import stat
+import sys
+import threading
+from array import array
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../examples')))
+
+from memory import Memory  # noqa: E402
+
+import mfusepy  # noqa: E402
+
+
+def test_driver_memory_roundtrip():
+    with mfusepy.Driver(Memory()) as driver:
+        assert stat.S_ISDIR(driver.getattr('/').st_mode)
+        with pytest.raises(OSError, match="No such file") as exception:
+            driver.getattr('/missing')
+        assert exception.value.errno == errno.ENOENT
+
+        fi = driver.create('/file', 0o644)
+        assert driver.write('/file', b'hello world', 0, fi) == 11
+        assert driver.write('/file', b'there', 6, fi) == 5
+        assert driver.read('/file', 100, 0, fi) == b'hello there'
+        assert driver.read('/file', 3, 2, fi) == b'llo'
+        driver.release('/file', fi)
+        assert driver.getattr('/file').st_size == 11
+
+        assert [entry[0] for entry in driver.readdir('/')] == ['.', '..', 'file']
+
+        driver.setxattr('/file', 'user.key', b'value')
+        assert driver.listxattr('/file') == ['user.key']
+        assert driver.getxattr('/file', 'user.key') == b'value'
+
+        driver.rename('/file', '/renamed')
+        driver.unlink('/renamed')
+        assert [entry[0] for entry in driver.readdir('/')] == ['.', '..']
+
+
+def test_driver_unimplemented():
+    # Default implementations are not registered with libfuse, which would then return ENOSYS.
+    driver = mfusepy.Driver(mfusepy.Operations())
+    assert not driver.implements('mkdir')
+    assert driver.call('mkdir', b'/dir', 0o755) == -errno.ENOSYS
+    with pytest.raises(OSError, match="Function not implemented"):
+        driver.mkdir('/dir', 0o755)
+
+
+def test_driver_create_without_flags():
+    class CreateWithoutFlags(mfusepy.Operations):
+        use_ns = True
+
+        def __init__(self):
+            self.created = []
+
+        def create(self, path, mode):
+            self.created.append(path)
+            return 3
+
+    operations = CreateWithoutFlags()
+    driver = mfusepy.Driver(operations)
+    assert driver.create('/a', 0o644).fh == 3
+    assert operations.created == ['/a']
+
+
+def test_driver_xattr_size_probe():
+    class Attributes(mfusepy.Operations):
+        use_ns = True
+
+        def __init__(self):
+            self.calls = 0
+
+        def listxattr(self, path):
+            self.calls += 1
+            return ['user.a', 'user.b']
+
+        def getxattr(self, path, name, position=0):
+            self.calls += 1
+            return name.encode() * 2
+
+    operations = Attributes()
+    driver = mfusepy.Driver(operations)
+    # The result of the size query is reused for the following fetch.
+    assert driver.listxattr('/') == ['user.a', 'user.b']
+    assert operations.calls == 1
+    assert driver.getxattr('/', 'user.b') == b'user.buser.b'
+    assert operations.calls == 2
+    assert driver.call('listxattr', b'/', None, 0) == 14
+    assert driver.call('listxattr', b'/other', None, 0) == 14
+    assert operations.calls == 4
+
+
+def test_driver_xattr_size_probe_modification():
+    class Attributes(mfusepy.Operations):
+        use_ns = True
+
+        def __init__(self):
+            self.value = b'old'
+
+        def getxattr(self, path, name, position=0):
+            return self.value
+
+        def setxattr(self, path, name, value, options, position=0):
+            self.value = value
+            return 0
+
+    operations = Attributes()
+    driver = mfusepy.Driver(operations)
+    assert driver.call('getxattr', b'/', b'user.a', None, 0) == 3
+
+    # A modification by another thread discards the result of the size query in this thread.
+    thread = threading.Thread(target=lambda: driver.setxattr('/', 'user.a', b'new'))
+    thread.start()
+    thread.join()
+    buffer = ctypes.create_string_buffer(3)
+    assert driver.call('getxattr', b'/', b'user.a', ctypes.cast(buffer, mfusepy.c_byte_p), 3) == 3
+    assert buffer.raw == b'new'
+
+
+def test_driver_xattr_size_probe_foreign_thread(run_in_foreign_thread):
+    class Attributes(mfusepy.Operations):
+        use_ns = True
+
+        def __init__(self):
+            self.calls = 0
+
+        def listxattr(self, path):
+            self.calls += 1
+            return ['user.a', 'user.b']
+
+    operations = Attributes()
+    driver = mfusepy.Driver(operations)
+    buffer = ctypes.create_string_buffer(14)
+    # The size query and the fetch are separate callbacks on the same libfuse thread.
+    results = run_in_foreign_thread(
+        lambda: driver.call('listxattr', b'/', None, 0),
+        lambda: driver.call('listxattr', b'/', ctypes.cast(buffer, mfusepy.c_byte_p), 14),
+    )
+    assert results == [14, 14]
+    assert buffer.raw == b'user.a\0user.b\0'
+    assert operations.calls == 1
+
+
+def test_driver_readdir_dir_entries(tmp_path):
+    (tmp_path / 'file').write_bytes(b'')
+    (tmp_path / 'folder').mkdir()
+
+    class Listing(mfusepy.Operations):
+        use_ns = True
+
+        def __init__(self):
+            self.result = None
+
+        def readdir(self, path, fh):
+            return self.result() if callable(self.result) else self.result
+
+    operations = Listing()
+    driver = mfusepy.Driver(operations)
+
+    operations.result = mfusepy.DirEntries(
+        [b'.', b'..', b'a', b'b'],
+        array('I', [stat.S_IFDIR] * 2 + [stat.S_IFREG, stat.S_IFLNK]),
+        array('Q', [1, 1, 2, 3]),
+    )
+    assert driver.readdir('/') == [
+        ('.', stat.S_IFDIR, 1, 0),
+        ('..', stat.S_IFDIR, 1, 0),
+        ('a', stat.S_IFREG, 2, 0),
+        ('b', stat.S_IFLNK, 3, 0),
+    ]
+
+    operations.result = mfusepy.DirEntries(['a', 'b'])
+    assert driver.readdir('/') == [('a', 0, 0, 0), ('b', 0, 0, 0)]
+
+    with pytest.raises(ValueError, match="same length"):
+        mfusepy.DirEntries(['a', 'b'], modes=[stat.S_IFREG])
+
+    expected = sorted(
+        (entry.name, stat.S_IFMT(entry.stat(follow_symlinks=False).st_mode), entry.inode(), 0)
+        for entry in os.scandir(tmp_path)
+    )
+    operations.result = lambda: os.scandir(tmp_path)
+    assert sorted(driver.readdir('/')) == expected
+    operations.result = lambda: mfusepy.DirEntries.from_scandir(os.scandir(tmp_path), with_dots=True)
+    entries = driver.readdir('/')
+    assert [entry[0] for entry in entries[:2]] == ['.', '..']
+    assert sorted(entries[2:]) == expected
+
+
+def test_request_context_outside_of_request():
+    assert mfusepy.fuse_get_context() == (0, 0, 0)
+    context = mfusepy.request_context()
+    assert (context.uid, context.gid, context.pid, context.umask) == (0, 0, 0, 0)
+    assert context.groups == []
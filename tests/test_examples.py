@@ -43,9 +43,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../e
 from loopback import cli as cli_loopback  # noqa: E402
 from memory import cli as cli_memory  # noqa: E402
 from memory_nullpath import cli as cli_memory_nullpath  # noqa: E402
+from passthrough import cli as cli_passthrough  # noqa: E402
 from readdir_returning_offsets import cli as cli_readdir_returning_offsets  # noqa: E402
 from readdir_with_offset import cli as cli_readdir_with_offset  # noqa: E402
 
+import mfusepy  # noqa: E402
+
 # Some Python interpreters, e.g. the macOS Python may lack os.*xattr APIs.
 os_has_xattr_funcs = all(hasattr(os, f) for f in ("listxattr", "setxattr", "getxattr", "removexattr"))
 
@@ -209,9 +212,9 @@ class RunCLI:
             time.sleep(0.1)
 
 
-@pytest.mark.parametrize('cli', [cli_loopback, cli_memory, cli_memory_nullpath])
+@pytest.mark.parametrize('cli', [cli_loopback, cli_passthrough, cli_memory, cli_memory_nullpath])
 def test_read_write_file_system(cli, tmp_path):
-    if cli == cli_loopback:
+    if cli in (cli_loopback, cli_passthrough):
         mount_source = tmp_path / "folder"
         mount_point = tmp_path / "mounted"
         mount_source.mkdir()
@@ -267,7 +270,7 @@ def test_read_write_file_system(cli, tmp_path):
             assert os.stat(path).st_gid == 23456
         except PermissionError:
             if sys.platform != 'darwin':
-                assert cli == cli_loopback
+                assert cli in (cli_loopback, cli_passthrough)
 
         os.chown(path, os.getuid(), os.getgid())
         assert os.stat(path).st_uid == os.getuid()
@@ -275,14 +278,16 @@ def test_read_write_file_system(cli, tmp_path):
 
         if os_has_xattr_funcs:
             try:
-                assert not os.listxattr(path)
+                # The source folder for passthrough may add xattrs, e.g., security.selinux or com.apple.provenance.
+                initial_xattrs = os.listxattr(path)
+                assert not initial_xattrs or cli == cli_passthrough
                 os.setxattr(path, b"user.tag-test", b"FOO-RESULT")
-                assert os.listxattr(path)
+                assert "user.tag-test" in os.listxattr(path)
                 assert os.getxattr(path, b"user.tag-test") == b"FOO-RESULT"
                 os.removexattr(path, b"user.tag-test")
-                assert not os.listxattr(path)
+                assert os.listxattr(path) == initial_xattrs
             except OSError as exception:
-                assert cli == cli_loopback
+                assert cli in (cli_loopback, cli_passthrough)
                 assert exception.errno == errno.ENOTSUP
 
         os.utime(path, (1.5, 12.5))
@@ -319,7 +324,7 @@ def test_read_write_file_system(cli, tmp_path):
         os.rmdir(mount_point / "bar")
         assert not os.path.exists(mount_point / "bar")
 
-        if cli != cli_loopback:
+        if cli not in (cli_loopback, cli_passthrough):
             # Looks like macOS always returns the memory page size here (16K Apple Silicon, 4K Intel)
             # and not the value provided by the fuse fs implementation (here: 512).
             # FreeBSD returns 65536 (why?).
@@ -386,6 +391,32 @@ def test_readdir_with_offset(cli, tmp_path):
         assert len(set(filter_platform_files(os.listdir(mount_point)))) == 1000
 
 
+def test_passthrough_open_result(tmp_path):
+    # Reads and writes are forwarded by the kernel if passthrough is available, else by the callbacks.
+    # Either way, the results must be the same.
+    mount_source = tmp_path / "folder"
+    mount_point = tmp_path / "mounted"
+    mount_source.mkdir()
+    mount_point.mkdir()
+    data = os.urandom(1024 * 1024)
+    (mount_source / "existing").write_bytes(data)
+
+    def cli(args):
+        mfusepy.FUSE(mfusepy.Passthrough(args[0]), args[1], foreground=True)
+
+    with RunCLI(cli, mount_point, [str(mount_source)]):
+        assert (mount_point / "existing").read_bytes() == data
+        (mount_point / "created").write_bytes(data[::-1])
+        assert (mount_point / "created").read_bytes() == data[::-1]
+        assert (mount_source / "created").read_bytes() == data[::-1]
+
+        with open(mount_point / "existing", 'r+b') as file:
+            file.seek(100)
+            file.write(b'passthrough')
+        assert (mount_source / "existing").read_bytes()[95:115] == data[95:100] + b'passthrough' + data[111:115]
+        assert os.stat(mount_point / "existing").st_size == len(data)
+
+
 if __name__ == '__main__':
     with tempfile.TemporaryDirectory() as directory:
         # Directory argument must not be something in the current directory,
@@ -0,0 +1,49 @@
+import ctypes.util
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def test_find_library_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    calls = []
+    original_find_library = ctypes.util.find_library
+
+    def find_library(name):
+        calls.append(name)
+        return original_find_library(name)
+
+    monkeypatch.setattr(ctypes.util, 'find_library', find_library)
+
+    path = mfusepy._find_library('c')
+    assert path
+    assert calls == ['c']
+    with open(tmp_path / 'mfusepy' / 'libraries.json', encoding='utf-8') as file:
+        assert json.load(file)['c']['path'] == path
+
+    assert mfusepy._find_library('c') == path
+    assert calls == ['c']
+
+    # Stale entries are looked up again.
+    with open(tmp_path / 'mfusepy' / 'libraries.json', 'w', encoding='utf-8') as file:
+        json.dump({'c': {'path': str(tmp_path / 'libc.so'), 'identity': [1, 2]}}, file)
+    assert mfusepy._find_library('c') == path
+    assert calls == ['c', 'c']
+
+
+def test_find_libfuse_prefers_sonames(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mfusepy, '_find_library', lambda name: calls.append(name) or f'/usr/lib/lib{name}.so')
+
+    # With only libfuse3 installed, find_library must not be called for the fuse fallback.
+    monkeypatch.setattr(mfusepy, '_is_loadable', lambda path: path == 'libfuse3.so.3')
+    assert mfusepy._find_libfuse('fuse', 'fuse3') == 'libfuse3.so.3'
+    assert not calls
+
+    monkeypatch.setattr(mfusepy, '_is_loadable', lambda path: False)
+    assert mfusepy._find_libfuse('fuse', 'fuse3') == '/usr/lib/libfuse.so'
+    assert calls == ['fuse']
@@ -0,0 +1,95 @@
+import errno
+import io
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def test_handle_table():
+    table = mfusepy.HandleTable()
+    first = table.add(None)
+    second = table.add('second')
+    assert first != 0
+    assert table.get(first) is None
+    assert table.get(second) == 'second'
+    assert len(table) == 2
+
+    assert table.remove(first) is None
+    third = table.add('third')
+    assert third != first  # Same slot, different generation.
+    assert table.get(third) == 'third'
+    for handle in (first, 0, -1, 123456):
+        with pytest.raises(OSError, match="Bad file descriptor") as exception:
+            table.get(handle)
+        assert exception.value.errno == errno.EBADF
+    with pytest.raises(OSError, match="Bad file descriptor"):
+        table.remove(first)
+    assert len(table) == 2
+
+
+def test_handle_table_threads():
+    table = mfusepy.HandleTable()
+
+    def churn():
+        for i in range(1000):
+            handle = table.add(i)
+            assert table.get(handle) == i
+            assert table.remove(handle) == i
+
+    threads = [threading.Thread(target=churn) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(table) == 0
+
+
+class ObjectHandles(mfusepy.Operations):
+    use_ns = True
+    use_object_handles = True
+
+    def __init__(self):
+        self.released = []
+
+    def getattr(self, path, fh=None):
+        return {'st_mode': stat.S_IFREG | 0o644, 'st_nlink': 1}
+
+    def open(self, path, flags):
+        return io.BytesIO(b'hello ' + path.encode())
+
+    def read(self, path, size, offset, fh):
+        fh.seek(offset)
+        return fh.read(size)
+
+    def release(self, path, fh):
+        self.released.append(fh.getvalue())
+        return 0
+
+    def opendir(self, path):
+        return ['.', '..', 'a']
+
+    def readdir(self, path, fh):
+        return fh
+
+
+def test_object_handles():
+    operations = ObjectHandles()
+    driver = mfusepy.Driver(operations)
+    fi = driver.open('/a')
+    assert len(driver.fuse.handles) == 1
+    assert driver.read('/a', 100, 0, fi) == b'hello /a'
+    driver.release('/a', fi)
+    assert operations.released == [b'hello /a']
+    assert len(driver.fuse.handles) == 0
+
+    fi = driver.opendir('/')
+    assert [entry[0] for entry in driver.readdir('/', fi)] == ['.', '..', 'a']
+    driver.releasedir('/', fi)
+    assert len(driver.fuse.handles) == 0
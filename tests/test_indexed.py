@@ -0,0 +1,99 @@
+import errno
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+FILE = stat.S_IFREG | 0o644
+
+
+class Archive(mfusepy.IndexedReadOnlyFS):
+    def __init__(self, files):
+        files = sorted(files, key=lambda file: self.path_sort_key(file[0]))
+        self.contents = [data for _path, data in files]
+        super().__init__((path, FILE, len(data), 10**9 * index) for index, (path, data) in enumerate(files))
+
+    def read_entry(self, row, offset, size):
+        return self.contents[row][offset : offset + size]
+
+
+class OffloadedArchive(Archive):
+    @mfusepy.offload
+    def lookup_in_worker(self, path):
+        return self.lookup(path)
+
+
+def test_indexed_read_only_fs():
+    files = [('/b/z', b'zzz'), ('/a', b'hello'), ('/b/c/d', b'deep'), ('/b/y', b''), ('/b/z', b'zz')]
+    operations = Archive(files)
+    # The root, 'a', 'b', 'b/c' (implicit), 'b/y', 'b/z', and 'b/c/d'. The last row for 'b/z' wins.
+    assert len(operations) == 7
+
+    with mfusepy.Driver(operations) as driver:
+        assert stat.S_ISDIR(driver.getattr('/').st_mode)
+        assert stat.S_ISDIR(driver.getattr('/b/c').st_mode)
+        st = driver.getattr('/b/z')
+        assert (st.st_mode, st.st_size, st.st_mtimespec.tv_sec) == (FILE, 2, 4)
+
+        for path in ('/missing', '/a/missing', '/b/c/d/e', '/b/zz'):
+            with pytest.raises(OSError, match="No such file") as exception:
+                driver.getattr(path)
+            assert exception.value.errno == errno.ENOENT
+
+        assert [entry[0] for entry in driver.readdir('/')] == ['.', '..', 'a', 'b']
+        entries = driver.readdir('/b', driver.opendir('/b'))
+        assert [(name, mode) for name, mode, _ino, _offset in entries] == [
+            ('.', stat.S_IFDIR),
+            ('..', stat.S_IFDIR),
+            ('c', stat.S_IFDIR | 0o555),
+            ('y', FILE),
+            ('z', FILE),
+        ]
+        assert entries[4][2] == driver.getattr('/b/z').st_ino
+        assert [entry[0] for entry in driver.readdir('/b/c', driver.opendir('/b/c'))] == ['.', '..', 'd']
+        with pytest.raises(OSError, match="Not a directory"):
+            driver.opendir('/a')
+
+        fi = driver.open('/b/c/d')
+        assert driver.read('/b/c/d', 100, 1, fi) == b'eep'
+        assert driver.read('/b/c/d', 100, 10, fi) == b''
+        with pytest.raises(OSError, match="Read-only file system"):
+            driver.open('/a', os.O_WRONLY)
+
+
+def test_indexed_read_only_fs_sort_order():
+    # '/a/b' must come before '/a.txt' because the files of folder 'a' are sorted before its siblings.
+    paths = ['/a.txt', '/a/b', '/a', '/a!/c', '/b/d/e']
+    files = [(path, b'') for path in sorted(paths, key=mfusepy.IndexedReadOnlyFS.path_sort_key)]
+    assert [path for path, _data in files] == ['/a', '/a/b', '/a!/c', '/a.txt', '/b/d/e']
+    operations = Archive(files)
+    assert len(operations) == 9
+    assert stat.S_ISDIR(operations.getattr('/a').st_mode)
+    assert operations.getattr('/a.txt').st_mode == FILE
+    assert [operations.name(entry) for entry in operations.children(operations.lookup('/'))] == [
+        b'a',
+        b'a!',
+        b'a.txt',
+        b'b',
+    ]
+    assert [operations.name(entry) for entry in operations.children(operations.lookup('/b/d'))] == [b'e']
+
+    with pytest.raises(ValueError, match="sorted"):
+        mfusepy.IndexedReadOnlyFS([(path, FILE, 0, 0) for path in paths])
+
+
+def test_indexed_read_only_fs_process_pool():
+    operations = OffloadedArchive([(f'/d/f{index}', b'') for index in range(20)])
+    # The hash table must stay valid in worker processes, which use another hash seed.
+    operations.process_pool = mfusepy.ProcessPool(operations, 1)
+    try:
+        assert operations.lookup_in_worker('/d/f7') == operations.lookup('/d/f7')
+        with pytest.raises(OSError, match="No such file"):
+            operations.lookup_in_worker('/d/missing')
+    finally:
+        operations.process_pool.shutdown()
@@ -0,0 +1,114 @@
+import errno
+import inspect
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+class LoggedOperations(mfusepy.LoggingMixIn, mfusepy.Operations):
+    chmod = os.chmod
+
+    def __init__(self):
+        self.files = {}
+
+    @mfusepy.overrides(mfusepy.Operations)
+    def create(self, path: str, mode: int, fi=None) -> int:
+        return 3
+
+    @mfusepy.overrides(mfusepy.Operations)
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        return b'x' * size
+
+
+class DerivedLoggedOperations(LoggedOperations):
+    @mfusepy.overrides(mfusepy.Operations)
+    def write(self, path: str, data: bytes, offset: int, fh: int) -> int:
+        return len(data)
+
+
+class OverridingLoggedOperations(LoggedOperations):
+    @mfusepy.overrides(mfusepy.Operations)
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        return super().read(path, size, offset, fh).upper()
+
+
+def test_logging_mixin_wraps_callbacks_once():
+    assert getattr(LoggedOperations.read, '_logs_callback', False)
+    assert getattr(DerivedLoggedOperations.write, '_logs_callback', False)
+    assert DerivedLoggedOperations.read is LoggedOperations.read
+    # Unimplemented callbacks must stay ignored so that FUSE does not register them.
+    assert getattr(LoggedOperations.mkdir, 'libfuse_ignore', False)
+
+    operations = DerivedLoggedOperations()
+    assert isinstance(operations.files, dict)
+    assert len(inspect.signature(operations.create).parameters) == 3
+    assert operations.write('/', b'abc', 0, 0) == 3
+
+
+def test_logging_mixin_output(caplog):
+    operations = LoggedOperations()
+    with caplog.at_level(logging.INFO, logger=mfusepy.callback_logger.name):
+        assert operations.read('/', 4, 0, 0) == b'xxxx'
+    assert not caplog.records
+
+    with caplog.at_level(logging.DEBUG, logger=mfusepy.callback_logger.name):
+        assert len(operations.read('/', 1000, 0, 0)) == 1000
+    assert [record.getMessage().split(' ')[:2] for record in caplog.records] == [['->', 'read'], ['<-', 'read']]
+    assert '[1000 B]' in caplog.records[1].getMessage()
+
+
+def test_logging_mixin_override_calling_super(caplog):
+    operations = OverridingLoggedOperations()
+    assert getattr(OverridingLoggedOperations.read, '_logs_callback', False)
+    with caplog.at_level(logging.DEBUG, logger=mfusepy.callback_logger.name):
+        assert operations.read('/', 2, 0, 0) == b'XX'
+        assert operations.read('/', 2, 0, 0) == b'XX'
+    messages = [record.getMessage() for record in caplog.records]
+    assert [message.split(' ')[:2] for message in messages] == [['->', 'read'], ['<-', 'read']] * 2
+    assert "b'XX'" in messages[1]
+
+
+def test_error_log_rate_limiter(caplog):
+    limiter = mfusepy.ErrorLogRateLimiter(max_records=2, interval=3600)
+    allowed = [limiter.allow('read', errno.EIO, logging.ERROR) for _ in range(1000)]
+    assert allowed.count(True) == 2
+    assert allowed[:2] == [True, True]
+
+    with caplog.at_level(logging.ERROR, logger=mfusepy.log.name):
+        limiter.flush()
+    assert [record.getMessage().split(' in the last')[0] for record in caplog.records] == [
+        'Suppressed 998 EIO from read'
+    ]
+
+    assert mfusepy.ErrorLogRateLimiter(max_records=None).allow('read', errno.EIO, logging.ERROR)
+
+
+def test_error_log_rate_limiter_summary_after_burst(caplog):
+    limiter = mfusepy.ErrorLogRateLimiter(max_records=1, interval=0.1)
+    with caplog.at_level(logging.ERROR, logger=mfusepy.log.name):
+        # The burst stops without further errors. The summary is still logged after the interval.
+        for _ in range(5):
+            limiter.allow('getattr', errno.ENOENT, logging.ERROR)
+        deadline = time.monotonic() + 10
+        while not caplog.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert [record.getMessage().split(' in the last')[0] for record in caplog.records] == [
+        'Suppressed 4 ENOENT from getattr'
+    ]
+
+    # The ended window was removed, so a new burst is allowed to log again.
+    assert limiter.allow('getattr', errno.ENOENT, logging.ERROR)
+    limiter.flush()
+
+
+def test_callback_statistics():
+    statistics = mfusepy.CallbackStatistics()
+    for _ in range(3):
+        statistics.record_error('read', errno.EIO)
+    statistics.record_error('getattr', errno.ENOENT)
+    assert statistics.snapshot()['errors'] == {'read:EIO': 3, 'getattr:ENOENT': 1}
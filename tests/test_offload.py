@@ -0,0 +1,161 @@
+import contextlib
+import errno
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def pattern(size, offset):
+    return bytes((offset + i) % 251 for i in range(size))
+
+
+class Generated(mfusepy.Operations):
+    use_ns = True
+
+    def __init__(self) -> None:
+        self.worker_pid = None
+        self.calls = 0
+
+    def init_worker(self):
+        self.worker_pid = os.getpid()
+
+    @mfusepy.offload
+    def get_worker_pid(self):
+        return self.worker_pid
+
+    @mfusepy.offload
+    def count_calls(self):
+        self.calls += 1
+        return self.calls
+
+    def open(self, path, flags):
+        return 0
+
+    @mfusepy.offload
+    def read(self, path, size, offset, fh):
+        if path == '/missing':
+            raise mfusepy.FuseOSError(errno.ENOENT)
+        return pattern(size, offset)
+
+
+def test_process_pool():
+    operations = Generated()
+    operations.process_pool = mfusepy.ProcessPool(operations, 2, buffer_size=4096)
+    try:
+        worker_pid = operations.get_worker_pid()
+        assert worker_pid is not None
+        assert worker_pid != os.getpid()
+
+        assert bytes(operations.read('/', 100, 7, 0)) == pattern(100, 7)
+        # Results larger than the shared memory buffer are pickled.
+        assert operations.read('/', 10000, 7, 0) == pattern(10000, 7)
+        with pytest.raises(OSError, match="No such file") as exception:
+            operations.read('/missing', 1, 0, 0)
+        assert exception.value.errno == errno.ENOENT
+    finally:
+        operations.process_pool.shutdown()
+
+    # Without a process pool, the methods are called in this process.
+    operations.process_pool = None
+    assert operations.get_worker_pid() is None
+
+
+def test_process_pool_foreign_thread(run_in_foreign_thread):
+    operations = Generated()
+    pool = operations.process_pool = mfusepy.ProcessPool(operations, 1, buffer_size=4096)
+    try:
+        # Each callback on the same libfuse thread reuses the shared memory buffer.
+        results = run_in_foreign_thread(*[lambda: bytes(operations.read('/', 100, 7, 0))] * 3)
+        assert results == [pattern(100, 7)] * 3
+        assert len(pool._buffers) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_driver_process_pool():
+    operations = Generated()
+    with mfusepy.Driver(operations, process_pool=2) as driver:
+        assert operations.process_pool is not None
+        fi = driver.open('/file')
+        assert driver.read('/file', 1000, 123, fi) == pattern(1000, 123)
+        with pytest.raises(OSError, match="No such file"):
+            driver.read('/missing', 10, 0, fi)
+
+
+class Coalesced(Generated):
+    coalesce_requests = True
+
+
+def test_driver_process_pool_coalesce_requests():
+    operations = Coalesced()
+    with mfusepy.Driver(operations, process_pool=2) as driver:
+        fi = driver.open('/file')
+
+        def read_repeatedly():
+            # The next read of the same thread reuses the shared memory buffer of the previous result.
+            return [driver.read('/file', 1000, offset, fi) == pattern(1000, offset) for offset in range(50)]
+
+        results: list = []
+        threads = [threading.Thread(target=lambda: results.append(read_repeatedly())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [[True] * 50] * 8
+
+
+@pytest.mark.skipif(not mfusepy.InterpreterPool.is_supported(), reason="Requires Python 3.13 or newer")
+def test_interpreter_pool():
+    operations = Generated()
+    operations.process_pool = mfusepy.InterpreterPool(operations, buffer_size=4096)
+    try:
+        assert operations.get_worker_pid() == os.getpid()
+        assert bytes(operations.read('/', 100, 7, 0)) == pattern(100, 7)
+        # The buffer is replaced by a larger one for larger results.
+        assert bytes(operations.read('/', 10000, 7, 0)) == pattern(10000, 7)
+        with pytest.raises(OSError, match="No such file") as exception:
+            operations.read('/missing', 1, 0, 0)
+        assert exception.value.errno == errno.ENOENT
+
+        # Each thread is pinned to its own subinterpreter with its own copy of the operations.
+        assert [operations.count_calls() for _ in range(3)] == [1, 2, 3]
+        counts = []
+        thread = threading.Thread(target=lambda: counts.extend(operations.count_calls() for _ in range(2)))
+        thread.start()
+        thread.join()
+        assert counts == [1, 2]
+    finally:
+        operations.process_pool.shutdown()
+    assert operations.calls == 0
+
+
+@pytest.mark.skipif(not mfusepy.InterpreterPool.is_supported(), reason="Requires Python 3.13 or newer")
+def test_interpreter_pool_foreign_thread(run_in_foreign_thread):
+    operations = Generated()
+    pool = operations.process_pool = mfusepy.InterpreterPool(operations, buffer_size=4096)
+    try:
+        # Each callback on the same libfuse thread is pinned to the same subinterpreter.
+        assert run_in_foreign_thread(*[operations.count_calls] * 3) == [1, 2, 3]
+        assert len(pool._workers) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_driver_interpreter_pool():
+    operations = Generated()
+    supported = mfusepy.InterpreterPool.is_supported()
+    # Without subinterpreter support, the methods are called directly.
+    context = contextlib.nullcontext() if supported else pytest.warns(RuntimeWarning, match="Python 3.13")
+    with context, mfusepy.Driver(operations, interpreter_pool=True) as driver:
+        assert isinstance(operations.process_pool, mfusepy.InterpreterPool) == supported
+        fi = driver.open('/file')
+        assert driver.read('/file', 1000, 123, fi) == pattern(1000, 123)
+        with pytest.raises(OSError, match="No such file"):
+            driver.read('/missing', 10, 0, fi)
+    assert operations.process_pool is None
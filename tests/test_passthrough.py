@@ -0,0 +1,41 @@
+import os
+import stat
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def test_passthrough(tmp_path):
+    (tmp_path / 'folder').mkdir()
+    (tmp_path / 'folder' / 'file').write_bytes(b'foo\n')
+    os.symlink('folder/file', tmp_path / 'link')
+
+    with mfusepy.Driver(mfusepy.Passthrough(str(tmp_path))) as driver:
+        fi = driver.opendir('/')
+        entries = {entry[0]: entry[1] for entry in driver.readdir('/', fi)}
+        driver.releasedir('/', fi)
+        assert sorted(entries) == ['.', '..', 'folder', 'link']
+        assert stat.S_ISDIR(entries['folder'])
+        assert stat.S_ISLNK(entries['link'])
+        assert stat.S_ISDIR(driver.getattr('/folder').st_mode)
+        assert driver.getattr('/folder/file').st_size == 4
+        assert stat.S_ISLNK(driver.getattr('/link').st_mode)
+        assert driver.readlink('/link') == 'folder/file'
+
+        fi = driver.open('/folder/file')
+        assert driver.read('/folder/file', 100, 1, fi) == b'oo\n'
+        driver.release('/folder/file', fi)
+
+        fi = driver.create('/folder/new', 0o644)
+        assert driver.write('/folder/new', b'bar', 0, fi) == 3
+        driver.flush('/folder/new', fi)
+        driver.release('/folder/new', fi)
+        driver.rename('/folder/new', '/renamed')
+        driver.mkdir('/created', 0o755)
+        driver.unlink('/folder/file')
+
+    assert (tmp_path / 'renamed').read_bytes() == b'bar'
+    assert (tmp_path / 'created').is_dir()
+    assert not (tmp_path / 'folder' / 'file').exists()
@@ -0,0 +1,34 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def _busy_work(n):
+    return sum(i * i for i in range(n))
+
+
+def test_profiler_merges_threads(tmp_path):
+    profiler = mfusepy.Profiler(str(tmp_path / "profile"))
+
+    def run():
+        for _ in range(3):
+            assert profiler.call(_busy_work, 1000) == _busy_work(1000)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = profiler.stats()
+    calls = [entry[1] for function, entry in stats.stats.items() if function[2] == '_busy_work']
+    assert calls == [12]
+
+    profiler.dump()
+    assert (tmp_path / "profile.pstats").stat().st_size > 0
+    collapsed = (tmp_path / "profile.collapsed").read_text(encoding='utf-8')
+    assert any(line.startswith('_busy_work (') for line in collapsed.splitlines())
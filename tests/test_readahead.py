@@ -0,0 +1,142 @@
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+DATA = bytes(random.Random(0).getrandbits(8) for _ in range(1 << 20))
+
+
+class Backend(mfusepy.Operations):
+    use_ns = True
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reads: list[tuple[int, int]] = []
+
+    def read(self, path, size, offset, fh):
+        with self.lock:
+            self.reads.append((offset, size))
+        return DATA[offset : offset + size]
+
+
+class Prefetching(mfusepy.ReadaheadMixin, Backend):
+    pass
+
+
+class Writable(Backend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.data = bytearray(DATA)
+
+    def read(self, path, size, offset, fh):
+        return bytes(self.data[offset : offset + size])
+
+    def write(self, path, data, offset, fh):
+        self.data[offset : offset + len(data)] = data
+        return len(data)
+
+    def truncate(self, path, length, fh=None):
+        del self.data[length:]
+        return 0
+
+    def rename(self, old, new):
+        return 0
+
+
+class PrefetchingWritable(mfusepy.ReadaheadMixin, Writable):
+    pass
+
+
+def test_readahead_sequential():
+    operations = Prefetching(readahead_size=64 * 1024, max_readahead_blocks=4)
+    chunks = [operations.read('/file', 16 * 1024, offset, 0) for offset in range(0, len(DATA) + 16 * 1024, 16 * 1024)]
+    assert b''.join(chunks) == DATA
+    # Most reads should have been served from prefetched 64 KiB blocks.
+    assert sum(1 for _, size in operations.reads if size == 64 * 1024) >= 8
+    assert len(operations.reads) < len(chunks)
+    assert operations.release('/file', 0) == 0
+    operations.destroy('/')
+
+
+def test_readahead_random_access():
+    generator = random.Random(1)
+    operations = Prefetching(readahead_size=10000, max_readahead_blocks=4)
+    position = 0
+    for _ in range(500):
+        offset = position if generator.random() < 0.7 else generator.randrange(len(DATA))
+        size = generator.randrange(1, 30000)
+        result = operations.read('/file', size, offset, 0)
+        assert result == DATA[offset : offset + size]
+        position = offset + len(result)
+    operations.destroy('/')
+
+
+def test_readahead_modifications():
+    # Unimplemented callbacks must stay unimplemented so that they are not registered with libfuse.
+    assert getattr(Prefetching.write, 'libfuse_ignore', False)
+
+    operations = PrefetchingWritable(readahead_size=4096, max_readahead_blocks=4)
+    for offset in range(0, 4 * 1024, 1024):
+        assert operations.read('/file', 1024, offset, 0) == DATA[offset : offset + 1024]
+    assert operations._readahead_streams[('/file', 0)].blocks
+
+    # Prefetched blocks of the file are dropped on write, also for other file handles.
+    operations.write('/file', b'new', 5000, 1)
+    assert not operations._readahead_streams[('/file', 0)].blocks
+    assert operations.read('/file', 1024, 4096, 0) == DATA[4096:5000] + b'new' + DATA[5003:5120]
+
+    for offset in range(5120, 8 * 1024, 1024):
+        operations.read('/file', 1024, offset, 0)
+    operations.truncate('/file', 9000)
+    assert operations.read('/file', 1024, 8192, 0) == DATA[8192:9000]
+
+    operations.read('/folder/file', 1024, 0, 0)
+    operations.rename('/folder', '/moved')
+    assert set(operations._readahead_streams) == {('/file', 0)}
+    operations.destroy('/')
+
+
+class Slow(Backend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.handles: list = []
+        self.released = False
+        self.read_after_release = False
+
+    def read(self, path, size, offset, fh):
+        self.handles.append(fh)
+        if offset >= 4096:
+            time.sleep(0.1)
+        if self.released:
+            self.read_after_release = True
+        return super().read(path, size, offset, fh)
+
+    def release(self, path, fh):
+        self.released = True
+        return 0
+
+
+class PrefetchingSlow(mfusepy.ReadaheadMixin, Slow):
+    pass
+
+
+def test_readahead_raw_fi_and_release():
+    operations = PrefetchingSlow(readahead_size=4096, max_readahead_blocks=4, readahead_threads=1)
+    fi = mfusepy.fuse_file_info(fh=3)
+    for offset in range(0, 4096, 1024):
+        assert operations.read('/file', 1024, offset, fi) == DATA[offset : offset + 1024]
+
+    # Prefetches must not use the fuse_file_info, which is only valid during the callback.
+    prefetch_handles = [fh for fh in operations.handles if fh is not fi]
+    assert prefetch_handles
+    assert all(isinstance(fh, mfusepy.fuse_file_info) and fh.fh == 3 for fh in prefetch_handles)
+
+    # Release must wait for the running prefetch before the filesystem closes the file.
+    assert operations.release('/file', fi) == 0
+    assert not operations.read_after_release
+    operations.destroy('/')
@@ -0,0 +1,84 @@
+import bz2
+import gzip
+import lzma
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+DATA = b''.join(i.to_bytes(4, 'little') * (i % 7) for i in range(200000))
+
+
+def compress_parts(compress, part_size):
+    return b''.join(compress(DATA[i : i + part_size]) for i in range(0, len(DATA), part_size))
+
+
+@pytest.mark.parametrize(
+    ('name', 'compressed'),
+    [
+        ('single.gz', gzip.compress(DATA)),
+        ('multi.gz', compress_parts(gzip.compress, 1 << 20) + b'\0' * 8),
+        ('multi.bz2', compress_parts(bz2.compress, 1 << 20)),
+        ('multi.xz', compress_parts(lzma.compress, 1 << 20)),
+    ],
+)
+def test_seekable_decompressor(tmp_path, monkeypatch, name, compressed):
+    path = tmp_path / name
+    path.write_bytes(compressed)
+
+    decompressor = mfusepy.SeekableDecompressor(str(path), checkpoint_spacing=1 << 20, block_size=1 << 16)
+    assert decompressor.size == len(DATA)
+    random.seed(0)
+    for _ in range(50):
+        offset = random.randrange(len(DATA) + 10)
+        size = random.randrange(1, 300000)
+        assert decompressor.pread(size, offset) == DATA[offset : offset + size]
+    assert decompressor.read() == DATA
+    decompressor.seek(-10, os.SEEK_END)
+    assert decompressor.read(100) == DATA[-10:]
+    if name == 'single.gz':
+        assert len(decompressor._restarts) > 1
+    decompressor.close()
+
+    # The saved restart points are loaded instead of decompressing the whole file again.
+    monkeypatch.setattr(mfusepy.SeekableDecompressor, '_scan', None)
+    with mfusepy.SeekableDecompressor(str(path)) as decompressor:
+        assert decompressor.size == len(DATA)
+        assert decompressor.pread(1000, len(DATA) // 2) == DATA[len(DATA) // 2 :][:1000]
+
+
+def test_seekable_decompressor_errors(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(b'hello')
+    with pytest.raises(ValueError, match="not gzip, bzip2, or xz compressed"):
+        mfusepy.SeekableDecompressor(str(path))
+
+    path = tmp_path / 'truncated.gz'
+    path.write_bytes(gzip.compress(DATA)[:1000])
+    with pytest.raises(EOFError, match="Compressed file ended"):
+        mfusepy.SeekableDecompressor(str(path))
+
+
+def test_seekable_decompressor_checkpoint_limit(tmp_path):
+    data = DATA * 4
+    path = tmp_path / 'single.gz'
+    path.write_bytes(gzip.compress(data))
+
+    with mfusepy.SeekableDecompressor(
+        str(path), write_index=False, checkpoint_spacing=1 << 16, max_checkpoints=4, block_size=1 << 16
+    ) as decompressor:
+        snapshots = [restart for restart in decompressor._restarts if restart[4] is not None]
+        assert 2 <= len(snapshots) <= 4
+        assert decompressor._snapshot_spacing > 1 << 16
+
+        random.seed(1)
+        for _ in range(50):
+            offset = random.randrange(len(data))
+            size = random.randrange(1, 100000)
+            assert decompressor.pread(size, offset) == data[offset : offset + size]
+        assert sum(1 for restart in decompressor._restarts if restart[4] is not None) <= 4
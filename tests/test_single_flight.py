@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def _call_concurrently(function, count: int) -> tuple[list, list]:
+    results: list = [None] * count
+
+    def run(index):
+        try:
+            results[index] = function()
+        except OSError as exception:
+            results[index] = exception
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_single_flight():
+    single_flight = mfusepy.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait()
+        return value * 2
+
+    threads, results = _call_concurrently(lambda: single_flight.call('key', slow, 21), 8)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert [result for result, _ in results] == [42] * 8
+    assert sum(shared for _, shared in results) == 8 - len(calls)
+    assert len(calls) < 8
+
+    # Exceptions are shared, too, and nothing is cached after the call has finished.
+    def fail(value):
+        raise mfusepy.FuseOSError(value)
+
+    with pytest.raises(OSError, match="No such file"):
+        single_flight.call('key', fail, 2)
+    assert single_flight.call('key', slow, 1) == (2, False)
+
+
+def test_single_flight_memoryview():
+    single_flight = mfusepy.SingleFlight()
+    release = threading.Event()
+    buffer = bytearray(b'result')
+
+    def reused():
+        release.wait()
+        return memoryview(buffer)
+
+    threads, results = _call_concurrently(lambda: single_flight.call('key', reused), 4)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    # The first caller might reuse the memory of its result after it returned.
+    buffer[:] = b'reused'
+
+    assert sorted(isinstance(result, memoryview) for result, _ in results) == [False, False, False, True]
+    assert [bytes(result) for result, shared in results if shared] == [b'result'] * 3
+
+
+def test_coalesce_requests():
+    class Slow(mfusepy.Operations):
+        use_ns = True
+        coalesce_requests = True
+
+        def __init__(self):
+            self.release = threading.Event()
+            self.calls = []
+
+        def getattr(self, path, fh=None):
+            self.calls.append(('getattr', path))
+            self.release.wait()
+            return {'st_mode': 0o100644, 'st_size': 4096}
+
+        def read(self, path, size, offset, fh):
+            self.calls.append(('read', path))
+            self.release.wait()
+            return b'a' * size
+
+    operations = Slow()
+    driver = mfusepy.Driver(operations)
+    fi = mfusepy.fuse_file_info()
+    threads, results = _call_concurrently(lambda: (driver.getattr('/a').st_size, driver.read('/a', 4096, 0, fi)), 8)
+    time.sleep(0.2)
+    operations.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(4096, b'a' * 4096)] * 8
+    counters = driver.fuse.statistics.snapshot()['counters']
+    assert counters.get('coalesced_getattr', 0) == 8 - operations.calls.count(('getattr', '/a'))
+    assert counters.get('coalesced_read', 0) == 8 - operations.calls.count(('read', '/a'))
+    assert len(operations.calls) < 16
+
+
+def test_coalesce_requests_after_write():
+    class Slow(mfusepy.Operations):
+        use_ns = True
+        coalesce_requests = True
+
+        def __init__(self):
+            self.started = threading.Event()
+            self.release = threading.Event()
+            self.size = 0
+
+        def getattr(self, path, fh=None):
+            size = self.size
+            if not self.started.is_set():
+                self.started.set()
+                self.release.wait()
+            return {'st_mode': 0o100644, 'st_size': size}
+
+        def write(self, path, data, offset, fh):
+            self.size = offset + len(data)
+            return len(data)
+
+    operations = Slow()
+    driver = mfusepy.Driver(operations)
+    threads, results = _call_concurrently(lambda: driver.getattr('/a').st_size, 1)
+    assert operations.started.wait(5)
+
+    # A getattr after the write must not join the getattr that started before it.
+    assert driver.write('/a', b'abc', 0, mfusepy.fuse_file_info()) == 3
+    timer = threading.Timer(1, operations.release.set)
+    timer.start()
+    assert driver.getattr('/a').st_size == 3
+    timer.cancel()
+    operations.release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [0]
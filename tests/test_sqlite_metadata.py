@@ -0,0 +1,107 @@
+import errno
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+FILE = stat.S_IFREG | 0o644
+
+
+class Contents(mfusepy.SQLiteMetadataFS):
+    def read_entry(self, ino, offset, size):
+        return f'file {ino}'.encode()[offset : offset + size]
+
+
+def test_sqlite_metadata_fs(tmp_path):
+    database = str(tmp_path / 'index.sqlite')
+    rows = [('/b/z', FILE, 3, 5 * 10**9), ('/a', FILE, 6, 0), ('/b/c/d', FILE, 4, 0), ('/b/z', 0o100600, 6, 0)]
+    mfusepy.SQLiteMetadataFS.build(database, rows, [('/a', 'user.key', b'value')])
+
+    operations = Contents(database)
+    with mfusepy.Driver(operations) as driver:
+        assert stat.S_ISDIR(driver.getattr('/').st_mode)
+        assert stat.S_ISDIR(driver.getattr('/b/c').st_mode)
+        st = driver.getattr('/b/z')
+        # The last row for a path wins.
+        assert (st.st_mode, st.st_size) == (0o100600, 6)
+        with pytest.raises(OSError, match="No such file") as exception:
+            driver.getattr('/b/missing')
+        assert exception.value.errno == errno.ENOENT
+
+        # Folders are listed in the order of the rows.
+        entries = driver.readdir('/b', driver.opendir('/b'))
+        assert [(name, mode) for name, mode, _ino, _offset in entries] == [
+            ('.', stat.S_IFDIR),
+            ('..', stat.S_IFDIR),
+            ('z', 0o100600),
+            ('c', stat.S_IFDIR | 0o555),
+        ]
+        assert entries[2][2] == st.st_ino
+
+        # Listings can be resumed at each returned offset.
+        fi = driver.opendir('/')
+        entries = driver.readdir('/', fi)
+        for index, (_name, _mode, _ino, offset) in enumerate(entries):
+            assert driver.readdir('/', fi, offset) == entries[index + 1 :]
+
+        assert driver.listxattr('/a') == ['user.key']
+        assert driver.getxattr('/a', 'user.key') == b'value'
+
+        fi = driver.open('/a')
+        assert driver.read('/a', 100, 2, fi) == f'le {driver.getattr("/a").st_ino}'.encode()
+        with pytest.raises(OSError, match="Read-only file system"):
+            driver.open('/a', os.O_WRONLY)
+
+        # Each thread uses its own connection.
+        values = []
+        barrier = threading.Barrier(4)
+
+        def get_value():
+            # Keep all threads alive until each has queried, so that no thread ID is reused.
+            values.append(operations.getxattr('/a', 'user.key'))
+            barrier.wait()
+
+        threads = [threading.Thread(target=get_value) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert values == [b'value'] * 4
+        assert len(operations._connections) == 5
+
+
+def test_sqlite_metadata_fs_foreign_thread(tmp_path, run_in_foreign_thread):
+    database = str(tmp_path / 'index.sqlite')
+    mfusepy.SQLiteMetadataFS.build(database, [('/a', FILE, 6, 0)], [('/a', 'user.key', b'value')])
+
+    operations = Contents(database)
+    # Each callback on the same libfuse thread reuses the connection.
+    assert run_in_foreign_thread(*[lambda: operations.getxattr('/a', 'user.key')] * 3) == [b'value'] * 3
+    assert len(operations._connections) == 1
+    operations.destroy('/')
+    assert not operations._connections
+
+
+def test_sqlite_metadata_fs_pagination(tmp_path):
+    database = str(tmp_path / 'index.sqlite')
+    mfusepy.SQLiteMetadataFS.build(database, ((f'/folder/{i:04d}', FILE, i, 0) for i in range(1000)))
+
+    operations = mfusepy.SQLiteMetadataFS(database)
+    operations.readdir_page_size = 100
+    driver = mfusepy.Driver(operations)
+    fi = driver.opendir('/folder')
+    names = []
+    offset = 0
+    while True:
+        page = driver.readdir('/folder', fi, offset)
+        if not page:
+            break
+        names.extend(name for name, _mode, _ino, _offset in page)
+        offset = page[-1][3]
+    assert names == ['.', '..'] + [f'{i:04d}' for i in range(1000)]
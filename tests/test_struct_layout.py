@@ -84,6 +84,8 @@ STRUCT_NAMES = {
 
 if platform.system() != 'NetBSD':
     STRUCT_NAMES['fuse_file_info'] = ['flags', 'fh', 'lock_owner']
+    if (mfusepy.fuse_version_major, mfusepy.fuse_version_minor) >= (3, 17):
+        STRUCT_NAMES['fuse_file_info'] += ['poll_events', 'backing_id']
 
 if mfusepy.fuse_version_major == 3:
     STRUCT_NAMES['fuse_config'] = [
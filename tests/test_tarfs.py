@@ -0,0 +1,110 @@
+import io
+import os
+import stat
+import sys
+import tarfile
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+def add(tar, name, data=b'', **attributes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    for key, value in attributes.items():
+        setattr(info, key, value)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def test_tarfs_single_file():
+    archive = os.path.join(os.path.dirname(__file__), 'single-file.tar')
+    with mfusepy.Driver(mfusepy.TarFS(archive, write_index=False)) as driver:
+        assert [entry[0] for entry in driver.readdir('/')] == ['.', '..', 'bar']
+        assert driver.read('/bar', 100, 0, driver.open('/bar')) == b'foo\n'
+
+
+def test_tarfs(tmp_path, monkeypatch):
+    archive = str(tmp_path / 'archive.tar')
+    with tarfile.open(archive, 'w') as tar:
+        add(tar, './folder', type=tarfile.DIRTYPE, mode=0o750)
+        add(tar, './folder/file', b'hello', mode=0o640, mtime=7)
+        add(tar, 'nested/deep/file', b'xyz')
+        add(tar, 'symlink', type=tarfile.SYMTYPE, linkname='folder/file')
+        add(tar, 'hardlink', type=tarfile.LNKTYPE, linkname='folder/file')
+        add(tar, 'symlink-hardlink', type=tarfile.LNKTYPE, linkname='symlink')
+
+    with mfusepy.Driver(mfusepy.TarFS(archive)) as driver:
+        assert [entry[0] for entry in driver.readdir('/')] == [
+            '.',
+            '..',
+            'folder',
+            'hardlink',
+            'nested',
+            'symlink',
+            'symlink-hardlink',
+        ]
+        assert driver.getattr('/folder').st_mode == stat.S_IFDIR | 0o750
+        st = driver.getattr('/folder/file')
+        assert (st.st_mode, st.st_size, st.st_mtimespec.tv_sec) == (stat.S_IFREG | 0o640, 5, 7)
+        assert stat.S_ISDIR(driver.getattr('/nested').st_mode)
+        assert driver.read('/folder/file', 100, 1, driver.open('/folder/file')) == b'ello'
+        assert driver.read('/hardlink', 3, 0, driver.open('/hardlink')) == b'hel'
+        assert driver.read('/nested/deep/file', 100, 0, driver.open('/nested/deep/file')) == b'xyz'
+        assert driver.readlink('/symlink') == 'folder/file'
+        assert driver.readlink('/symlink-hardlink') == 'folder/file'
+        with pytest.raises(OSError, match="Invalid argument"):
+            driver.readlink('/folder')
+    assert os.path.isfile(archive + '.mfusepy-index')
+
+    # The index is loaded instead of reading the archive again.
+    def fail(*args, **kwargs):
+        raise AssertionError("The archive should not be scanned")
+
+    monkeypatch.setattr(tarfile, 'open', fail)
+    with mfusepy.Driver(mfusepy.TarFS(archive)) as driver:
+        assert driver.readlink('/symlink') == 'folder/file'
+        assert driver.readlink('/symlink-hardlink') == 'folder/file'
+        assert driver.read('/hardlink', 100, 0, driver.open('/hardlink')) == b'hello'
+
+    # The index is rebuilt when the archive has been modified.
+    os.utime(archive, ns=(0, 0))
+    with pytest.raises(AssertionError, match="should not be scanned"):
+        mfusepy.TarFS(archive)
+
+
+@pytest.mark.parametrize('compression', ['gz', 'bz2', 'xz'])
+def test_tarfs_compressed(tmp_path, compression):
+    archive = str(tmp_path / f'archive.tar.{compression}')
+    data = bytes(range(256)) * 4096
+    with tarfile.open(archive, f'w:{compression}') as tar:
+        add(tar, 'small', b'hello')
+        add(tar, 'large', data)
+
+    for _ in range(2):
+        with mfusepy.Driver(mfusepy.TarFS(archive)) as driver:
+            fi = driver.open('/large')
+            assert driver.read('/large', 1000, 500000, fi) == data[500000:501000]
+            assert driver.read('/small', 100, 0, driver.open('/small')) == b'hello'
+    assert os.path.isfile(archive + '.mfusepy-checkpoints')
+
+
+class OffloadedTarFS(mfusepy.TarFS):
+    @mfusepy.offload
+    def read_entry(self, row, offset, size):
+        return bytes(super().read_entry(row, offset, size))
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz'])
+def test_tarfs_process_pool(tmp_path, mode):
+    archive = str(tmp_path / ('archive.tar.gz' if mode == 'w:gz' else 'archive.tar'))
+    data = bytes(range(256)) * 1000
+    with tarfile.open(archive, mode) as tar:
+        add(tar, 'folder/file', data)
+
+    # The mapping and the decompressor are reopened by path in the worker processes.
+    with mfusepy.Driver(OffloadedTarFS(archive), process_pool=1) as driver:
+        fi = driver.open('/folder/file')
+        assert driver.read('/folder/file', 1000, 12345, fi) == data[12345:13345]
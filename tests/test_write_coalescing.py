@@ -0,0 +1,117 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mfusepy  # noqa: E402
+
+
+class Backend(mfusepy.Operations):
+    use_ns = True
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.writes: list[tuple[int, int]] = []
+        self.fail = False
+        self.released: list[int] = []
+
+    def read(self, path, size, offset, fh):
+        return bytes(self.data[offset : offset + size])
+
+    def write(self, path, data, offset, fh):
+        if self.fail:
+            raise mfusepy.FuseOSError(mfusepy.errno.ENOSPC)
+        self.writes.append((offset, len(data)))
+        if len(self.data) < offset:
+            self.data += bytes(offset - len(self.data))
+        self.data[offset : offset + len(data)] = data
+        return len(data)
+
+    def release(self, path, fh):
+        self.released.append(fh)
+        return 0
+
+
+class Coalescing(mfusepy.WriteCoalescingMixin, Backend):
+    pass
+
+
+def test_write_coalescing():
+    operations = Coalescing(max_write_size=64 * 1024, max_write_age=60)
+    data = random.Random(0).randbytes(1 << 20)
+    for offset in range(0, len(data), 4096):
+        assert operations.write('/file', data[offset : offset + 4096], offset, 1) == 4096
+    assert operations.writes == [(offset, 64 * 1024) for offset in range(0, len(data), 64 * 1024)]
+
+    # Non-contiguous writes and overlapping reads are barriers.
+    operations.write('/file', b'abc', 10, 1)
+    operations.write('/file', b'def', 100, 1)
+    assert operations.writes[-1] == (10, 3)
+    assert operations.read('/file', 10, 95, 1) == data[95:100] + b'def' + data[103:105]
+
+    operations.write('/file', b'ghi', 200, 1)
+    assert operations.flush('/file', 1) == 0
+    assert operations.writes[-1] == (200, 3)
+    assert operations.release('/file', 1) == 0
+    assert not operations._write_buffers
+    operations.destroy('/')
+
+
+def test_write_coalescing_back_pressure_and_errors():
+    operations = Coalescing(max_write_size=1 << 20, max_write_age=60, max_buffered_bytes=8)
+    operations.write('/file', b'12345678', 0, 1)
+    assert not operations.writes
+    # Exceeding the memory cap writes through synchronously.
+    operations.write('/file', b'9', 8, 1)
+    assert operations.writes == [(0, 8), (8, 1)]
+
+    operations.write('/file', b'abc', 9, 1)
+    operations.fail = True
+    with pytest.raises(mfusepy.FuseOSError, match='No space'):
+        operations.fsync('/file', 0, 1)
+    operations.fail = False
+    # The data of the failed write is kept and written by the next barrier.
+    assert operations.release('/file', 1) == 0
+    assert bytes(operations.data) == b'123456789abc'
+    assert operations._buffered_bytes == 0
+
+    # The file is released in the filesystem even if the buffered data cannot be written.
+    operations.write('/file', b'def', 12, 2)
+    operations.fail = True
+    with pytest.raises(mfusepy.FuseOSError, match='No space'):
+        operations.release('/file', 2)
+    assert operations.released == [1, 2]
+    assert operations._buffered_bytes == 0
+    assert not operations._write_buffers
+    operations.destroy('/')
+
+
+def test_write_coalescing_keeps_callbacks_unimplemented():
+    class WriteOnly(mfusepy.WriteCoalescingMixin, mfusepy.Operations):
+        def write(self, path, data, offset, fh):
+            return len(data)
+
+    assert WriteOnly.truncate is None or getattr(WriteOnly.truncate, 'libfuse_ignore', False)
+    assert WriteOnly.read is mfusepy.Operations.read
+    assert WriteOnly.flush is mfusepy.WriteCoalescingMixin.flush
+
+
+def test_write_coalescing_raw_fi():
+    class Recording(Coalescing):
+        def write(self, path, data, offset, fh):
+            self.handles.append(fh.fh)
+            return super().write(path, data, offset, fh)
+
+    operations = Recording(max_write_size=1 << 20, max_write_age=60)
+    operations.handles = []
+    fi = mfusepy.fuse_file_info(fh=3)
+    operations.write('/file', b'abc', 0, fi)
+    # libfuse reuses the memory of the fuse_file_info after the callback has returned.
+    fi.fh = 4
+    assert operations.flush('/file', mfusepy.fuse_file_info(fh=3)) == 0
+    assert operations.handles == [3]
+    assert bytes(operations.data) == b'abc'
+    operations.destroy('/')